@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import EquipmentType, Devices
+from .models import EquipmentType, Devices, StickerExportJob
+from .search import search_devices
 
 # 註冊設備種類模型
 @admin.register(EquipmentType)
@@ -12,9 +13,16 @@ class EquipmentTypeAdmin(admin.ModelAdmin):
 class DevicesAdmin(admin.ModelAdmin):
     list_display = ['equipment_type', 'brand', 'specification', 'date_installed', 'contractor_name']
     list_filter = ['equipment_type', 'date_installed']
+    list_select_related = ['equipment_type__category']
     search_fields = ['brand', 'specification', 'contractor_name']
     date_hierarchy = 'date_installed'
     
+    def get_search_results(self, request, queryset, search_term):
+        # 與設備列表使用相同的索引搜尋 (PostgreSQL)，不依相關度排序以保留後台的排序
+        if not search_term:
+            return queryset, False
+        return search_devices(queryset, search_term, rank=False), False
+    
     # 將欄位分組顯示
     fieldsets = (
         ('基本資訊', {
@@ -33,3 +41,15 @@ class DevicesAdmin(admin.ModelAdmin):
             'fields': ('emergency_name', 'emergency_phone', 'maintenance_name', 'maintenance_phone')
         }),
     )
+
+
+# 註冊背景貼紙匯出工作 (僅供查看)
+@admin.register(StickerExportJob)
+class StickerExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'done', 'total', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['status', 'device_ids', 'base_url', 'total', 'done', 'file', 'error',
+                       'created_at', 'started_at', 'finished_at', 'heartbeat_at']
+
+    def has_add_permission(self, request):
+        return False
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class DevicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'devices'
+
+    def ready(self):
+        # 註冊快取失效的 signal
+        from . import signals  # noqa: F401
+
+        # 每個程序只註冊一次貼紙用的中文字體
+        from .stickers import register_fonts
+        register_fonts()
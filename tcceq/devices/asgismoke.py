@@ -0,0 +1,60 @@
+"""ASGI 冒煙測試
+
+在同一個程序中以 AsyncClient (經過與 tcceq/asgi.py 相同的 ASGI handler 與 middleware)
+同時送出大量設備詳細資料頁 (QR code 掃描) 與設備列表請求，檢查：
+
+    - 所有請求都成功回應
+    - 一個事件迴圈可以同時處理多少個請求 (max_in_flight)
+    - 處理期間程序的執行緒數 (非同步檢視不需要每個請求一個執行緒)
+
+不需要安裝 ASGI 伺服器；要測量實際的伺服器請使用 load_test 指令。
+"""
+import asyncio
+import random
+import threading
+import time
+
+from django.test import AsyncClient
+
+from .loadtest import LoadResults
+
+
+async def run_smoke_test(device_ids, paths, requests=500, concurrency=100, list_ratio=0.1, search_terms=(),
+                         seed=None, host=None):
+    """同時送出 requests 個請求 (最多 concurrency 個同時處理中)
+
+    paths: 端點名稱 → 路徑 (device_detail 的路徑含 {id})
+    list_ratio: 設備列表請求的比例，其餘為設備詳細資料頁
+    回傳 (LoadResults, 實際耗時秒數, {'max_in_flight': ..., 'max_threads': ...})
+    """
+    if not device_ids:
+        raise ValueError('沒有可用的設備 id')
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(requests):
+        if rng.random() < list_ratio:
+            params = {'search': rng.choice(search_terms)} if search_terms and rng.random() < 0.5 else {}
+            plan.append(('device_list_search' if params else 'device_list', paths['device_list'], params))
+        else:
+            plan.append(('device_detail', paths['device_detail'].format(id=rng.choice(device_ids)), {}))
+
+    client = AsyncClient(raise_request_exception=False, **({'headers': {'host': host}} if host else {}))
+    results = LoadResults()
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {'in_flight': 0, 'max_in_flight': 0, 'max_threads': threading.active_count()}
+
+    async def send(endpoint, path, params):
+        async with semaphore:
+            stats['in_flight'] += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+            started = time.perf_counter()
+            response = await client.get(path, params)
+            elapsed = time.perf_counter() - started
+            stats['in_flight'] -= 1
+            stats['max_threads'] = max(stats['max_threads'], threading.active_count())
+        results.record(endpoint, elapsed, f'HTTP {response.status_code}' if response.status_code >= 400 else None)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(*item) for item in plan))
+    del stats['in_flight']
+    return results, time.perf_counter() - started, stats
@@ -0,0 +1,303 @@
+"""效能基準測試
+
+在獨立的測試資料庫中建立指定筆數的設備 (例如 1k / 10k / 100k)，
+依序測量各頁面、匯入指令與 CSV 轉換的耗時，結果為可比較的 JSON：
+
+    {"meta": {...}, "results": [{"scenario": ..., "size": ..., "p50_ms": ..., ...}]}
+
+每個情境重複執行數次，記錄平均、百分位數與吞吐量 (每秒處理的請求數或設備數)。
+compare_results 依 p50 與先前儲存的基準結果比較。
+
+快取在每次執行前清除，測量的是未命中快取時的耗時 (貼紙的快取檔案在執行期間停用)。
+"""
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import date
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .models import Devices
+from .stickers import sticker_cache
+from .survey_csv import FIELD_MAPPING
+from .synthetic import InventoryGenerator, generate_inventory
+from .utils import percentile
+
+# 頁面類情境 (每次一個請求)
+REQUEST_SCENARIOS = (
+    'device_list', 'device_list_search', 'device_detail', 'download_qrcodes', 'download_all_qrcodes',
+)
+# 匯入類情境 (每次處理一個檔案，吞吐量以設備數計算)
+IMPORT_SCENARIOS = (
+    'import_devices', 'load_sample_data', 'reload_sample_data', 'import_survey_csv', 'ingest_survey_csvs',
+    'parse_csv_to_json',
+)
+SCENARIOS = REQUEST_SCENARIOS + IMPORT_SCENARIOS
+
+# 每次執行耗時較長、預設只重複少數幾次的情境
+HEAVY_SCENARIOS = ('download_all_qrcodes',) + IMPORT_SCENARIOS
+
+# 設備列表搜尋情境使用的關鍵字 (synthetic 的空調設備廠牌)
+SEARCH_TERM = '東元'
+# 匯入檔案中設備的起始編號，與資料庫中已產生的設備不重複
+IMPORT_START = 10 ** 8
+# 匯入檔案中沒有安裝日期的設備使用的日期 (load_sample_data 需要日期)
+DEFAULT_DATE_INSTALLED = date(2024, 1, 1)
+
+_SURVEY_NAMES = {}
+for _name, _field in FIELD_MAPPING.items():
+    _SURVEY_NAMES.setdefault(_field, _name)
+
+
+def summarize(scenario, size, durations, items=1, unit='request'):
+    """把每次執行的秒數整理成一筆結果"""
+    values = sorted(durations)
+    total = sum(values)
+    result = {
+        'scenario': scenario,
+        'size': size,
+        'iterations': len(values),
+        'unit': unit,
+        'items': items,
+        'total_seconds': round(total, 6),
+        'throughput': round(items * len(values) / total, 3) if total else None,
+    }
+    result['mean_ms'] = round(total / len(values) * 1000, 3)
+    for name, q in (('min', 0), ('p50', 50), ('p90', 90), ('p95', 95), ('p99', 99), ('max', 100)):
+        result[f'{name}_ms'] = round(percentile(values, q) * 1000, 3)
+    return result
+
+
+def seed_devices(count, seed=0):
+    """以 synthetic 補足資料到 count 筆設備 (相同 seed 產生相同的資料)"""
+    existing = Devices.objects.count()
+    if count > existing:
+        generate_inventory(count - existing, seed=seed, start=existing)
+
+
+class ImportFiles:
+    """匯入情境使用的輸入檔案 (暫存目錄，各指令的格式各自產生一份)"""
+
+    def __init__(self, rows, seed=0):
+        self.directory = tempfile.TemporaryDirectory(prefix='devices-benchmark-')
+        self.rows = rows
+        records = []
+        for record in InventoryGenerator(seed).iter_devices(rows, start=IMPORT_START):
+            record['date_installed'] = record['date_installed'] or DEFAULT_DATE_INSTALLED
+            records.append(record)
+        types = sorted({record['equipment_type'] for record in records})
+
+        self.json = self._write_json('import_devices.json', types, records, '%Y-%m-%d')
+        self.sample_json = self._write_json('sample_data.json', types, records, '%Y/%m/%d')
+        self.csv = self._write_survey_csv('survey.csv', records)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def _write_json(self, name, types, records, date_format):
+        devices = [dict(record, date_installed=record['date_installed'].strftime(date_format)) for record in records]
+        with open(self.path(name), 'w', encoding='utf-8') as file:
+            json.dump({'equipment_types': [{'name': name} for name in types], 'devices': devices}, file, ensure_ascii=False)
+        return self.path(name)
+
+    def _write_survey_csv(self, name, records):
+        """現場調查 CSV 格式 (每個設備一個區塊)"""
+        with open(self.path(name), 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            for index, record in enumerate(records, 1):
+                values = {
+                    'brand': record['brand'],
+                    'specification': record['specification'],
+                    'power_info': record['power_info'],
+                    'date_installed': record['date_installed'].strftime('%Y/%m/%d'),
+                    'maintenance_cycle': record['maintenance_cycle'],
+                    'warranty_period': record['warranty_period'],
+                    'contractor_info': f'{record["contractor_name"]} {record["contractor_phone"]}',
+                }
+                for prefix in ('installer', 'emergency', 'maintenance'):
+                    if record[f'{prefix}_name']:
+                        values[f'{prefix}_info'] = f'{record[f"{prefix}_name"]} {record[f"{prefix}_phone"]}'
+                writer.writerow([f'設備{index}', record['equipment_type'], ''])
+                for number, (field, value) in enumerate(values.items(), 1):
+                    writer.writerow([number, _SURVEY_NAMES[field], value])
+                writer.writerow(['', '', ''])
+        return self.path(name)
+
+    def cleanup(self):
+        self.directory.cleanup()
+
+
+class BenchmarkRunner:
+    """依資料量由小到大執行各情境
+
+    repeat: 頁面類情境的執行次數 (另有一次不計時的暖身)
+    heavy_repeat: 匯入與全部貼紙 PDF 的執行次數
+    qrcode_count: download_qrcodes 每次選取的設備數
+    import_rows: 匯入檔案的設備數上限 (不超過資料量)
+    max_all_qrcodes: 資料量超過此值時略過 download_all_qrcodes
+    log: 顯示進度的函式
+    """
+
+    def __init__(self, sizes, scenarios=SCENARIOS, repeat=20, heavy_repeat=3, qrcode_count=100,
+                 import_rows=10000, max_all_qrcodes=1000, workers=2, seed=0, log=print):
+        self.sizes = sorted(sizes)
+        self.scenarios = [scenario for scenario in SCENARIOS if scenario in scenarios]
+        self.repeat = repeat
+        self.heavy_repeat = heavy_repeat
+        self.qrcode_count = qrcode_count
+        self.import_rows = import_rows
+        self.max_all_qrcodes = max_all_qrcodes
+        self.workers = workers
+        self.seed = seed
+        self.log = log
+        self.client = Client()
+
+    def run(self):
+        # 測試資料庫的設備 id 與實際資料重疊，不讀寫共用的貼紙快取檔案
+        with override_settings(STICKER_CACHE_DIR=None):
+            return self._run()
+
+    def _run(self):
+        results = []
+        for size in self.sizes:
+            started = time.perf_counter()
+            seed_devices(size, self.seed)
+            self.log(f'已建立 {size} 筆設備 ({time.perf_counter() - started:.1f} 秒)')
+            self.device_ids = list(Devices.objects.order_by('id').values_list('id', flat=True))
+            self.rng = random.Random(f'{self.seed}:{size}')
+
+            import_files = None
+            if set(self.scenarios) & set(IMPORT_SCENARIOS):
+                import_files = ImportFiles(min(size, self.import_rows), self.seed)
+            try:
+                for scenario in self.scenarios:
+                    if scenario == 'download_all_qrcodes' and size > self.max_all_qrcodes:
+                        self.log(f'{scenario} ({size}): 略過，資料量超過 {self.max_all_qrcodes}')
+                        continue
+                    result = self.run_scenario(scenario, size, import_files)
+                    self.log(
+                        f'{scenario} ({size}): p50 {result["p50_ms"]:.1f} ms、p95 {result["p95_ms"]:.1f} ms、'
+                        f'{result["throughput"]} {result["unit"]}/s'
+                    )
+                    results.append(result)
+            finally:
+                if import_files:
+                    import_files.cleanup()
+        return results
+
+    def run_scenario(self, scenario, size, import_files):
+        iterations = self.heavy_repeat if scenario in HEAVY_SCENARIOS else self.repeat
+        if scenario in IMPORT_SCENARIOS:
+            run = getattr(self, f'run_{scenario}')
+            durations = [self.timed(run, import_files) for _ in range(iterations)]
+            return summarize(scenario, size, durations, items=import_files.rows, unit='device')
+
+        request = getattr(self, f'request_{scenario}')
+        # 先執行一次不計時，避免第一次請求載入範本等的時間影響結果
+        self.get_response(request)
+        durations = [self.timed(self.get_response, request) for _ in range(iterations)]
+        return summarize(scenario, size, durations)
+
+    def timed(self, function, *args):
+        # 每次都從空的快取開始
+        cache.clear()
+        sticker_cache.clear()
+        started = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - started
+
+    def get_response(self, request):
+        response = request()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code} {response.reason_phrase}')
+        # 串流回應讀完內容才算完成
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+        return response
+
+    # 頁面類情境
+
+    def request_device_list(self):
+        return self.client.get(reverse('devices:device_list'))
+
+    def request_device_list_search(self):
+        return self.client.get(reverse('devices:device_list'), {'search': SEARCH_TERM})
+
+    def request_device_detail(self):
+        return self.client.get(reverse('devices:device_detail', args=[self.rng.choice(self.device_ids)]))
+
+    def request_download_qrcodes(self):
+        device_ids = self.rng.sample(self.device_ids, min(self.qrcode_count, len(self.device_ids)))
+        return self.client.post(reverse('devices:download_qrcodes'), {'device_ids': device_ids})
+
+    def request_download_all_qrcodes(self):
+        return self.client.get(reverse('devices:download_all_qrcodes'))
+
+    # 匯入類情境 (在交易中執行後回復，不影響下一次執行)
+
+    def call_rolled_back(self, *args, **options):
+        with transaction.atomic():
+            call_command(*args, stdout=StringIO(), stderr=StringIO(), **options)
+            transaction.set_rollback(True)
+
+    def run_import_devices(self, files):
+        self.call_rolled_back('import_devices', file=files.json)
+
+    def run_load_sample_data(self, files):
+        self.call_rolled_back('load_sample_data', file=files.sample_json)
+
+    def run_reload_sample_data(self, files):
+        self.call_rolled_back('reload_sample_data', file=files.sample_json)
+
+    def run_import_survey_csv(self, files):
+        self.call_rolled_back('import_survey_csv', file=files.csv)
+
+    def run_ingest_survey_csvs(self, files):
+        self.call_rolled_back('ingest_survey_csvs', files.csv, workers=self.workers)
+
+    def run_parse_csv_to_json(self, files):
+        from convert_csv_to_json import parse_csv_to_json
+
+        # 轉換腳本以 print 顯示結果
+        with redirect_stdout(StringIO()):
+            parse_csv_to_json(files.csv, files.path('converted.json'))
+
+
+def compare_results(current, baseline, threshold=0.1):
+    """依 p50 比較兩次結果，回傳 [{scenario, size, baseline_p50_ms, p50_ms, change, status}]
+
+    change 為相對於基準的變化比例 (正值表示變慢)，超過 threshold 時 status 為 'slower'，
+    低於 -threshold 時為 'faster'，否則為 'unchanged'。
+    """
+    baseline_results = {(result['scenario'], result['size']): result for result in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        previous = baseline_results.get((result['scenario'], result['size']))
+        if previous is None or not previous['p50_ms']:
+            continue
+        change = result['p50_ms'] / previous['p50_ms'] - 1
+        if change > threshold:
+            status = 'slower'
+        elif change < -threshold:
+            status = 'faster'
+        else:
+            status = 'unchanged'
+        comparison.append({
+            'scenario': result['scenario'],
+            'size': result['size'],
+            'baseline_p50_ms': previous['p50_ms'],
+            'p50_ms': result['p50_ms'],
+            'change': round(change, 4),
+            'status': status,
+        })
+    return comparison
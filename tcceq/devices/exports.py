@@ -0,0 +1,163 @@
+"""背景貼紙匯出工作
+
+由 run_export_worker 指令啟動的工作程序輪詢 StickerExportJob，
+逐頁產生 PDF 並回報進度 (同時更新心跳時間)，完成後存放於 MEDIA_ROOT/sticker_exports/。
+工作程序中止時留下的產生中工作，超過 STICKER_EXPORT_STALE_SECONDS 沒有心跳就標記為失敗；
+完成或失敗超過 STICKER_EXPORT_RETENTION_HOURS 的工作與檔案會被刪除。
+"""
+import os
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Devices, StickerExportJob
+from .pdfstream import iter_sticker_pdf
+from .stickers import ALL_LAYOUT, SELECTED_LAYOUT, get_sticker_page
+
+# 每完成多少頁更新一次進度
+PROGRESS_EVERY = 50
+# 匯出檔案存放的目錄 (MEDIA_ROOT 之下)
+EXPORT_DIR = 'sticker_exports'
+
+
+class JobReclaimed(Exception):
+    """工作因心跳逾時已被標記為失敗，不再繼續產生"""
+
+
+def job_devices(job):
+    """工作要輸出的設備"""
+    devices = Devices.objects.select_related('equipment_type').order_by('id')
+    if job.device_ids is not None:
+        devices = devices.filter(id__in=job.device_ids)
+    return devices
+
+
+def claim_next_job():
+    """取得下一個等待中的工作並標記為產生中，沒有工作時回傳 None"""
+    with transaction.atomic():
+        job = (
+            StickerExportJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=StickerExportJob.STATUS_PENDING)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = StickerExportJob.STATUS_RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+    return job
+
+
+def report_progress(job, **fields):
+    """更新產生中工作的進度與心跳時間，工作已被標記為失敗時引發 JobReclaimed"""
+    updated = (
+        StickerExportJob.objects
+        .filter(id=job.id, status=StickerExportJob.STATUS_RUNNING)
+        .update(heartbeat_at=timezone.now(), **fields)
+    )
+    if not updated:
+        raise JobReclaimed(job.id)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def run_export_job(job):
+    """產生工作的 PDF，過程中更新已完成頁數"""
+    relative_path = f'{EXPORT_DIR}/stickers_job_{job.id}.pdf'
+    full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    try:
+        devices = job_devices(job)
+        total = devices.count()
+        report_progress(job, total=total)
+
+        # 選中設備與所有設備的下載版面規格行位置不同
+        layout = SELECTED_LAYOUT if job.device_ids is not None else ALL_LAYOUT
+
+        def pages():
+            for done, device in enumerate(devices.iterator(chunk_size=500), 1):
+                device_url = f"{job.base_url}{reverse('devices:device_detail', args=[device.id])}"
+                yield get_sticker_page(device, device_url)
+                if done % PROGRESS_EVERY == 0:
+                    report_progress(job, done=done)
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as output:
+            for chunk in iter_sticker_pdf(pages(), layout):
+                output.write(chunk)
+
+        report_progress(
+            job, file=relative_path, status=StickerExportJob.STATUS_DONE,
+            done=total, finished_at=timezone.now(),
+        )
+    except JobReclaimed:
+        _remove(full_path)
+    except Exception:
+        _remove(full_path)
+        StickerExportJob.objects.filter(id=job.id, status=StickerExportJob.STATUS_RUNNING).update(
+            status=StickerExportJob.STATUS_FAILED,
+            error=traceback.format_exc(),
+            finished_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
+
+
+def fail_stale_jobs():
+    """將超過 STICKER_EXPORT_STALE_SECONDS 沒有心跳的產生中工作標記為失敗，回傳工作數"""
+    now = timezone.now()
+    stale_seconds = getattr(settings, 'STICKER_EXPORT_STALE_SECONDS', 300)
+    return (
+        StickerExportJob.objects
+        .filter(status=StickerExportJob.STATUS_RUNNING, heartbeat_at__lt=now - timedelta(seconds=stale_seconds))
+        .update(
+            status=StickerExportJob.STATUS_FAILED,
+            error=f'工作程序超過 {stale_seconds} 秒沒有回報進度 (可能已中止)',
+            finished_at=now,
+        )
+    )
+
+
+def delete_expired_exports():
+    """刪除完成或失敗超過 STICKER_EXPORT_RETENTION_HOURS 的工作，以及匯出目錄中同樣逾期的檔案
+
+    工作程序中止時留下的不完整檔案沒有對應的工作紀錄，因此以檔案的修改時間判斷。
+    回傳 (刪除的工作數, 刪除的檔案數)。
+    """
+    retention = timedelta(hours=getattr(settings, 'STICKER_EXPORT_RETENTION_HOURS', 24))
+    expired = StickerExportJob.objects.filter(
+        status__in=[StickerExportJob.STATUS_DONE, StickerExportJob.STATUS_FAILED],
+        finished_at__lt=timezone.now() - retention,
+    )
+    files = 0
+    for job in expired.exclude(file='').only('id', 'file').iterator():
+        if job.file.storage.exists(job.file.name):
+            job.file.delete(save=False)
+            files += 1
+    jobs, _ = expired.delete()
+
+    directory = os.path.join(settings.MEDIA_ROOT, EXPORT_DIR)
+    cutoff = time.time() - retention.total_seconds()
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                files += 1
+        except FileNotFoundError:
+            pass
+    return jobs, files
@@ -0,0 +1,349 @@
+"""以批次寫入的設備匯入引擎
+
+設備種類以記憶體中的 名稱→id 對照表解析，重複檢查使用載入到記憶體的鍵值集合，
+設備以 bulk_create 分批寫入，每筆資料不需要額外的資料庫往返。
+
+bulk_create 不會呼叫 save() 也不會送出 signal，因此寫入前會自行產生
+search_document 與排程欄位，完成後讓已快取的頁面失效。
+
+每個設備都有自然鍵 (設備種類、廠牌、規格) 與內容雜湊。upsert 模式以現有設備的
+自然鍵→雜湊 對照表，把每筆資料分為新增、更新與未變更，只有新增及雜湊不同的設備
+以 INSERT ... ON CONFLICT (natural_key) DO UPDATE 批次寫入。一般的匯入跳過自然鍵與
+現有設備 (或同一次匯入中之前的資料) 相同的設備。
+
+一般的匯入在第一次 add 時載入所有現有設備的鍵值。大型檔案可使用 NDJSON
+(每行一個 JSON 物件) 格式，以 import_ndjson 逐行讀取，每批資料在各自的交易中寫入，
+只以 prefetch 查詢該批設備的現有鍵值，提交後以 release 捨棄，記憶體用量不隨檔案大小
+或現有設備數增加。
+"""
+import json
+from itertools import islice
+
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Q
+
+from .keys import DEVICE_FIELDS
+from .models import Devices, EquipmentType
+from .pagecache import bump_data_version
+from .schedule import SCHEDULE_FIELDS
+from .stats import refresh_stats
+
+# upsert 時自然鍵衝突 (設備已存在) 要更新的欄位 (設備種類是自然鍵的一部分，不會改變)
+UPSERT_FIELDS = [*DEVICE_FIELDS, *SCHEDULE_FIELDS, 'content_hash', 'search_document', 'updated_at']
+
+
+class BulkDeviceImporter:
+    """批次匯入設備
+
+    使用方式::
+
+        importer = BulkDeviceImporter(dedup_fields=('brand', 'specification'))
+        for row in rows:
+            importer.add(importer.type_id(row['equipment_type']), **row_fields)
+        importer.finish()
+
+    逐批匯入時先以 build 建立該批的設備，prefetch(設備) 後再以 add_device 逐筆加入，
+    寫入並提交後呼叫 release()。
+
+    dedup_fields: 除了自然鍵之外，另外與設備種類一起判斷重複的欄位 (空值表示只依自然鍵判斷)
+    skip_blank_keys: dedup_fields 有空值時不依 dedup_fields 判斷重複 (自然鍵相同時仍視為重複)
+    upsert: 以自然鍵比對現有設備，內容不同時更新、相同時不寫入 (取代重複檢查)
+    batch_size: 每次 bulk_create 寫入的筆數
+    progress_every / on_progress: 每處理 progress_every 筆呼叫一次 on_progress(importer)
+    on_conflict: 寫入時才發現重複的設備 (其他連線在載入鍵值之後寫入相同自然鍵的設備)
+        跳過並呼叫 on_conflict(設備, 錯誤)
+    """
+
+    def __init__(self, dedup_fields=('brand', 'specification'), skip_blank_keys=False,
+                 batch_size=1000, progress_every=1000, on_progress=None, upsert=False, on_conflict=None):
+        self.dedup_fields = tuple(dedup_fields)
+        self.skip_blank_keys = skip_blank_keys
+        self.upsert = upsert
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.on_progress = on_progress
+        self.on_conflict = on_conflict
+
+        self.processed = 0
+        self.created = 0
+        self.skipped = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.types_created = 0
+        self._pending = []
+        # upsert 模式中尚未寫入的設備在 _pending 中的位置 (同一批中相同自然鍵以最後一筆為準)
+        self._pending_keys = {}
+
+        # 同名的設備種類以最早建立的為準 (與 filter(...).first() 相同)
+        self._type_ids = {}
+        for type_id, name in EquipmentType.objects.order_by('-id').values_list('id', 'name'):
+            self._type_ids[name] = type_id
+        # 現有設備的 自然鍵→內容雜湊 (非 upsert 模式用來跳過自然鍵重複的設備) 與 dedup_fields 的鍵值，
+        # None 表示尚未載入 (第一次 add 時載入全部，或由 prefetch 只載入一批)
+        self._hashes = None
+        self._existing = None
+
+    def _load_existing(self):
+        """載入所有現有設備的自然鍵與重複檢查鍵值"""
+        self._hashes = dict(
+            Devices.objects.values_list('natural_key', 'content_hash').iterator(chunk_size=5000)
+        )
+        self._existing = set()
+        if self.dedup_fields:
+            self._existing.update(
+                Devices.objects.values_list('equipment_type_id', *self.dedup_fields).iterator(chunk_size=5000)
+            )
+
+    def prefetch(self, devices):
+        """只載入與這批設備 (build 建立) 自然鍵或重複檢查鍵值相同的現有設備
+
+        之前的批次必須已經寫入，檔案內跨批次的重複由資料庫中的資料判斷
+        """
+        natural_keys = {device.natural_key for device in devices}
+        self._hashes = dict(
+            Devices.objects.filter(natural_key__in=natural_keys).values_list('natural_key', 'content_hash')
+        ) if natural_keys else {}
+        self._existing = set()
+        keys = {key for key in map(self._key, devices) if key is not None}
+        if keys:
+            # 每個欄位以 IN 篩選 (包含空值)，結果可能多於需要的組合，再依完整鍵值比對
+            lookups = Q(equipment_type_id__in={key[0] for key in keys})
+            for position, field in enumerate(self.dedup_fields, 1):
+                values = {key[position] for key in keys}
+                condition = Q(**{f'{field}__in': values - {None}})
+                if None in values:
+                    condition |= Q(**{f'{field}__isnull': True})
+                lookups &= condition
+            self._existing.update(
+                key for key in Devices.objects.filter(lookups).values_list('equipment_type_id', *self.dedup_fields)
+                if key in keys
+            )
+
+    def release(self):
+        """捨棄 prefetch 載入的鍵值 (該批已提交)，下一批需要再 prefetch"""
+        self._hashes = None
+        self._existing = None
+
+    def type_id(self, name, create=True):
+        """取得設備種類 id，不存在時建立 (create=False 時回傳 None)"""
+        type_id = self._type_ids.get(name)
+        if type_id is None and create:
+            type_id = EquipmentType.objects.create(name=name).id
+            self._type_ids[name] = type_id
+            self.types_created += 1
+        return type_id
+
+    def _key(self, device):
+        if not self.dedup_fields:
+            return None
+        values = tuple(getattr(device, field) for field in self.dedup_fields)
+        if self.skip_blank_keys and not all(values):
+            return None
+        return (device.equipment_type_id, *values)
+
+    def build(self, type_id, **fields):
+        """建立設備 (尚未寫入) 並產生自然鍵與內容雜湊，欄位名稱有誤時拋出 TypeError"""
+        device = Devices(equipment_type_id=type_id, **fields)
+        device.refresh_keys()
+        return device
+
+    def add(self, type_id, **fields):
+        """加入一筆設備 (稍後批次寫入)，重複或內容未變更時回傳 False"""
+        return self.add_device(self.build(type_id, **fields))
+
+    def add_device(self, device):
+        """加入 build 建立的設備，重複或內容未變更時回傳 False"""
+        self.processed += 1
+        if self._hashes is None:
+            self._load_existing()
+        if self.upsert:
+            written = self._add_upsert(device)
+            self._report()
+            return written
+
+        key = self._key(device)
+        if device.natural_key in self._hashes or (key is not None and key in self._existing):
+            self.skipped += 1
+            self._report()
+            return False
+        if key is not None:
+            self._existing.add(key)
+        self._hashes[device.natural_key] = device.content_hash
+        self.created += 1
+        self._append(device)
+        self._report()
+        return True
+
+    def _add_upsert(self, device):
+        current_hash = self._hashes.get(device.natural_key)
+        if current_hash == device.content_hash:
+            self.unchanged += 1
+            return False
+        if current_hash is None:
+            self.created += 1
+        else:
+            self.updated += 1
+        self._hashes[device.natural_key] = device.content_hash
+
+        index = self._pending_keys.get(device.natural_key)
+        if index is not None:
+            # 同一批中已有相同自然鍵的設備，一個 INSERT ... ON CONFLICT 不能更新同一列兩次
+            device.refresh_search_document()
+            device.refresh_schedule()
+            self._pending[index] = device
+            return True
+        self._pending_keys[device.natural_key] = len(self._pending)
+        self._append(device)
+        return True
+
+    def _append(self, device):
+        device.refresh_search_document()
+        device.refresh_schedule()
+        self._pending.append(device)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def skip(self):
+        """記錄一筆無法匯入的資料"""
+        self.processed += 1
+        self.skipped += 1
+        self._report()
+
+    def _report(self):
+        if self.on_progress and self.progress_every and self.processed % self.progress_every == 0:
+            self.on_progress(self)
+
+    def flush(self):
+        """寫入尚未寫入的設備"""
+        if not self._pending:
+            return
+        if self.upsert:
+            Devices.objects.bulk_create(
+                self._pending,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['natural_key'],
+                update_fields=UPSERT_FIELDS,
+            )
+        else:
+            try:
+                with transaction.atomic():
+                    Devices.objects.bulk_create(self._pending, batch_size=self.batch_size)
+            except IntegrityError:
+                # 自然鍵與載入鍵值之後才寫入的設備相同，逐筆寫入找出重複的設備
+                self._create_each(self._pending)
+        self._pending = []
+        self._pending_keys = {}
+
+    def _create_each(self, devices):
+        for device in devices:
+            try:
+                with transaction.atomic():
+                    Devices.objects.bulk_create([device])
+            except IntegrityError as error:
+                self.created -= 1
+                self.skipped += 1
+                if self.on_conflict:
+                    self.on_conflict(device, error)
+
+    def checkpoint(self):
+        """目前的計數，批次寫入失敗時以 rollback() 回復"""
+        return (self.processed, self.created, self.skipped, self.updated, self.unchanged, self.types_created)
+
+    def rollback(self, checkpoint):
+        """交易回復後還原計數並捨棄未寫入的設備 (之後不應再繼續匯入)"""
+        self.processed, self.created, self.skipped, self.updated, self.unchanged, self.types_created = checkpoint
+        self._pending = []
+        self._pending_keys = {}
+        self.release()
+
+    def finish(self):
+        """寫入剩餘的設備，交易完成後讓頁面快取失效並重新計算設備統計"""
+        self.flush()
+        transaction.on_commit(bump_data_version)
+        transaction.on_commit(refresh_stats)
+
+
+class RecordError(ValueError):
+    """單筆匯入資料的錯誤 (跳過該筆，繼續匯入)"""
+
+
+class BatchError(Exception):
+    """批次寫入失敗，已回復該批資料"""
+
+    def __init__(self, first_line, error):
+        super().__init__(f'第 {first_line} 行起的批次寫入失敗: {error}')
+        self.first_line = first_line
+
+
+def is_ndjson(path):
+    return path.endswith(('.ndjson', '.jsonl'))
+
+
+def read_ndjson(path, start_line=1):
+    """逐行讀取 NDJSON 檔案，產生 (行號, 資料)，格式錯誤的行產生 (行號, RecordError)"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_no, line in enumerate(file, 1):
+            if line_no < start_line or not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, RecordError(f'JSON 格式錯誤: {e}')
+                continue
+            if not isinstance(record, dict):
+                yield line_no, RecordError('每一行必須是一個 JSON 物件')
+                continue
+            yield line_no, record
+
+
+def import_ndjson(path, importer, build_device, batch_size=1000, start_line=1, on_error=None):
+    """以固定大小的批次匯入 NDJSON 檔案
+
+    每行是一個設備，或是 {"model": "equipment_type", "name": ...} 形式的設備種類。
+    build_device(資料, 行號) 回傳 (設備種類 id, 欄位)，資料有誤時拋出 RecordError。
+    每批在各自的交易中寫入，只查詢該批設備的現有鍵值 (prefetch)，提交後捨棄 (release)。
+    單筆錯誤以 on_error(行號, 錯誤) 回報並跳過；
+    寫入失敗時拋出 BatchError，之前的批次已經寫入，可從 BatchError.first_line 重新開始。
+    回傳最後處理的行號。
+    """
+    records = read_ndjson(path, start_line)
+    last_line = start_line - 1
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        checkpoint = importer.checkpoint()
+        try:
+            with transaction.atomic():
+                devices = []
+                for line_no, record in batch:
+                    try:
+                        if isinstance(record, RecordError):
+                            raise record
+                        if record.get('model') == 'equipment_type':
+                            importer.type_id(record['name'])
+                            continue
+                        type_id, fields = build_device(record, line_no)
+                        devices.append(importer.build(type_id, **fields))
+                    except KeyError as e:
+                        importer.skip()
+                        if on_error:
+                            on_error(line_no, RecordError(f'缺少欄位: {e}'))
+                    except (RecordError, ValueError, TypeError) as e:
+                        importer.skip()
+                        if on_error:
+                            on_error(line_no, e)
+                importer.prefetch(devices)
+                for device in devices:
+                    importer.add_device(device)
+                importer.flush()
+        except DatabaseError as e:
+            importer.rollback(checkpoint)
+            # 之前的批次已寫入，仍需讓快取失效
+            importer.finish()
+            raise BatchError(batch[0][0], e) from e
+        importer.release()
+        last_line = batch[-1][0]
+    importer.finish()
+    return last_line
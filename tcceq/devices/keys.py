@@ -0,0 +1,44 @@
+"""設備的自然鍵與內容雜湊
+
+自然鍵以 (設備種類, 廠牌, 規格) 識別同一個設備，存在有唯一索引的 natural_key 欄位，
+重新匯入時以它判斷要新增或更新。內容雜湊涵蓋所有匯入欄位，
+只有雜湊不同的設備才需要寫入。
+migration 0007 使用的是固定的複本，修改計算方式時需另寫 migration 重新計算現有設備。
+"""
+import datetime
+import hashlib
+
+# 從匯入資料複製到設備的欄位
+DEVICE_FIELDS = (
+    'brand', 'specification', 'power_info', 'date_installed',
+    'maintenance_cycle', 'warranty_period',
+    'contractor_name', 'contractor_phone',
+    'installer_name', 'installer_phone',
+    'emergency_name', 'emergency_phone',
+    'maintenance_name', 'maintenance_phone',
+)
+
+# 欄位之間的分隔字元 (不會出現在一般文字中)
+_SEPARATOR = '\x1f'
+
+
+def _normalize(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def _digest(values):
+    return hashlib.sha1(_SEPARATOR.join(values).encode('utf-8')).hexdigest()
+
+
+def natural_key(equipment_type_id, brand, specification):
+    """設備的自然鍵 (廠牌與規格都是空值的設備，同一設備種類只能有一個)"""
+    return _digest([_normalize(equipment_type_id), _normalize(brand), _normalize(specification)])
+
+
+def content_hash(equipment_type_id, values):
+    """設備種類與所有匯入欄位 (values 為欄位名稱對應值的 dict) 的雜湊"""
+    return _digest([_normalize(equipment_type_id)] + [_normalize(values.get(field)) for field in DEVICE_FIELDS])
@@ -0,0 +1,258 @@
+"""本機 HTTP 負載測試
+
+以多個執行緒對執行中的伺服器 (runserver、gunicorn 或 ASGI 伺服器) 送出請求，
+模擬三種流量：
+
+    scan      大量技術人員同時掃描貼紙 QR code (device_detail)
+    browse    辦公室人員瀏覽設備列表、篩選設備類型與搜尋，並翻頁
+    download  偶爾下載選取設備的貼紙 PDF (download_qrcodes)
+    mixed     依 MIXED_WEIGHTS 混合以上三種流量
+
+每個執行緒使用自己的 HTTP/1.1 持續連線 (只使用標準函式庫)，
+結果依端點統計延遲百分位數、吞吐量與錯誤率。
+"""
+import http.client
+import random
+import re
+import threading
+import time
+from html import unescape
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from .utils import percentile
+
+PROFILES = ('scan', 'browse', 'download', 'mixed')
+# mixed 流量中各種流量的比例
+MIXED_WEIGHTS = (('scan', 80), ('browse', 18), ('download', 2))
+
+_NEXT_CURSOR_RE = re.compile(r'href="\?([^"]*cursor=[^"]+)">下一頁')
+
+
+class Target:
+    """負載測試的對象：伺服器位址、路徑與測試用的資料"""
+
+    def __init__(self, base_url, device_ids, type_ids=(), search_terms=(), paths=None):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'無效的網址: {base_url}')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.device_ids = list(device_ids)
+        self.type_ids = list(type_ids)
+        self.search_terms = list(search_terms)
+        # 端點名稱 → 路徑 (device_detail 的路徑含 {id})
+        self.paths = paths
+
+    def path(self, endpoint, **kwargs):
+        return self.prefix + self.paths[endpoint].format(**kwargs)
+
+
+class Connection:
+    """單一執行緒使用的持續連線，自動處理 cookie 與重新連線"""
+
+    def __init__(self, target, timeout):
+        self.target = target
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.target.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(self.target.host, self.target.port, timeout=self.timeout)
+
+    def request(self, method, path, fields=None, headers=None):
+        """送出請求並讀完回應，回傳 (狀態碼, 內容)"""
+        headers = dict(headers or {})
+        body = None
+        if fields is not None:
+            body = urlencode(fields, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+
+        # 伺服器關閉閒置連線時重新連線後再試一次
+        for attempt in (1, 2):
+            if self.connection is None:
+                self._connect()
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status, content
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class LoadResults:
+    """各端點的延遲與錯誤 (多個執行緒共用)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = {}
+
+    def record(self, endpoint, seconds, error=None):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            self.errors.setdefault(endpoint, 0)
+            if error is not None:
+                self.errors[endpoint] += 1
+                self.error_samples.setdefault(endpoint, str(error))
+
+    def summary(self, elapsed):
+        """{端點: 統計}，延遲以毫秒表示"""
+        summary = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            summary[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'error_rate': round(self.errors[endpoint] / len(values), 4),
+                'throughput': round(len(values) / elapsed, 3),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p95_ms': round(percentile(values, 95) * 1000, 3),
+                'p99_ms': round(percentile(values, 99) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3),
+            }
+            if endpoint in self.error_samples:
+                summary[endpoint]['error_sample'] = self.error_samples[endpoint]
+        return summary
+
+
+class VirtualUser:
+    """一個執行緒模擬的使用者，依流量類型不斷產生請求"""
+
+    def __init__(self, target, profile, results, rng, timeout=30, think_time=0, qrcode_count=20):
+        self.target = target
+        self.profile = profile
+        self.results = results
+        self.rng = rng
+        self.think_time = think_time
+        self.qrcode_count = qrcode_count
+        self.connection = Connection(target, timeout)
+        self.csrf_token = None
+        self._mixed = ([name for name, weight in MIXED_WEIGHTS], [weight for name, weight in MIXED_WEIGHTS])
+
+    def call(self, endpoint, method, path, fields=None, headers=None):
+        """送出一個請求並記錄結果，回傳內容 (失敗時回傳 None)"""
+        started = time.perf_counter()
+        try:
+            status, content = self.connection.request(method, path, fields, headers)
+        except (OSError, http.client.HTTPException) as e:
+            self.results.record(endpoint, time.perf_counter() - started, e)
+            self.connection.close()
+            return None
+        elapsed = time.perf_counter() - started
+        if status >= 400:
+            self.results.record(endpoint, elapsed, f'HTTP {status}')
+            return None
+        self.results.record(endpoint, elapsed)
+        return content
+
+    def step(self):
+        profile = self.profile
+        if profile == 'mixed':
+            profile = self.rng.choices(*self._mixed)[0]
+        getattr(self, f'do_{profile}')()
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+
+    def do_scan(self):
+        device_id = self.rng.choice(self.target.device_ids)
+        self.call('device_detail', 'GET', self.target.path('device_detail', id=device_id))
+
+    def do_browse(self):
+        params = {}
+        roll = self.rng.random()
+        if roll < 0.4 and self.target.search_terms:
+            params['search'] = self.rng.choice(self.target.search_terms)
+        elif roll < 0.7 and self.target.type_ids:
+            params['type'] = self.rng.choice(self.target.type_ids)
+        endpoint = 'device_list_search' if 'search' in params else 'device_list'
+        path = self.target.path('device_list')
+        content = self.call(endpoint, 'GET', f'{path}?{urlencode(params)}' if params else path)
+        # 翻到後面幾頁
+        for page in range(self.rng.choice((0, 0, 1, 2))):
+            match = content and _NEXT_CURSOR_RE.search(content.decode('utf-8', 'replace'))
+            if not match:
+                break
+            content = self.call(f'{endpoint}_next', 'GET', f'{path}?{unescape(match.group(1))}')
+
+    def do_download(self):
+        if self.csrf_token is None:
+            # 取得 CSRF cookie (與使用者先開啟設備列表相同)
+            self.connection.request('GET', self.target.path('device_list'))
+            self.csrf_token = self.connection.cookies.get('csrftoken', '')
+        device_ids = self.rng.sample(self.target.device_ids, min(self.qrcode_count, len(self.target.device_ids)))
+        base_url = f'{self.target.scheme}://{self.target.host}{f":{self.target.port}" if self.target.port else ""}'
+        self.call(
+            'download_qrcodes', 'POST', self.target.path('download_qrcodes'),
+            fields={'device_ids': device_ids, 'csrfmiddlewaretoken': self.csrf_token},
+            headers={'X-CSRFToken': self.csrf_token, 'Referer': base_url + self.target.path('device_list')},
+        )
+
+
+def run_load(target, profile='mixed', concurrency=10, duration=30, max_requests=None, seed=None,
+             ramp_up=0, **user_options):
+    """以 concurrency 個執行緒送出請求，直到經過 duration 秒或達到 max_requests 個請求
+
+    ramp_up: 在幾秒內逐漸啟動所有執行緒 (0 表示同時開始，模擬突發流量)
+    回傳 (LoadResults, 實際耗時秒數)
+    """
+    if profile not in PROFILES:
+        raise ValueError(f'未知的流量類型: {profile}')
+    if not target.device_ids:
+        raise ValueError('沒有可用的設備 id')
+
+    results = LoadResults()
+    stop = threading.Event()
+    counter_lock = threading.Lock()
+    sent = 0
+
+    def take_ticket():
+        nonlocal sent
+        with counter_lock:
+            if max_requests is not None and sent >= max_requests:
+                return False
+            sent += 1
+            return True
+
+    def worker(index):
+        rng = random.Random(None if seed is None else f'{seed}:{index}')
+        user = VirtualUser(target, profile, results, rng, **user_options)
+        if ramp_up:
+            time.sleep(ramp_up * index / concurrency)
+        try:
+            while not stop.is_set() and take_ticket():
+                user.step()
+        finally:
+            user.connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline = started + duration if duration else None
+    for thread in threads:
+        while thread.is_alive():
+            if deadline is not None and time.perf_counter() >= deadline:
+                stop.set()
+            thread.join(0.1)
+    return results, time.perf_counter() - started
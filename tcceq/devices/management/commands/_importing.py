@@ -0,0 +1,103 @@
+from devices.importers import BatchError, BulkDeviceImporter, import_ndjson, is_ndjson
+
+
+class ImportCommandMixin:
+    """設備匯入指令共用的批次寫入與 NDJSON 選項"""
+
+    def add_import_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=['json', 'ndjson'],
+            help='檔案格式 (預設依副檔名判斷，.ndjson / .jsonl 為 NDJSON)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='每次批次寫入的設備數，NDJSON 每批各自提交 (預設: 1000)'
+        )
+        parser.add_argument(
+            '--progress-every',
+            type=int,
+            default=1000,
+            help='每處理多少筆顯示一次進度 (預設: 1000)'
+        )
+        parser.add_argument(
+            '--resume-from-line',
+            type=int,
+            default=1,
+            help='NDJSON 從第幾行開始匯入，用於中斷後繼續 (預設: 1)'
+        )
+        self.add_upsert_argument(parser)
+
+    def add_upsert_argument(self, parser):
+        parser.add_argument(
+            '--upsert',
+            action='store_true',
+            help='以自然鍵 (設備種類、廠牌、規格) 比對現有設備，內容有變更時更新，未變更時不寫入'
+        )
+
+    def use_ndjson(self, file_path, options):
+        if options['format']:
+            return options['format'] == 'ndjson'
+        return is_ndjson(file_path)
+
+    def create_importer(self, options, **kwargs):
+        return BulkDeviceImporter(
+            batch_size=options['batch_size'],
+            progress_every=options['progress_every'],
+            on_progress=self.report_progress,
+            on_conflict=self.report_conflict,
+            upsert=options.get('upsert', False),
+            **kwargs
+        )
+
+    def report_progress(self, importer):
+        message = f'已處理 {importer.processed} 筆：建立 {importer.created} 個設備，跳過 {importer.skipped} 個'
+        if importer.upsert:
+            message += f'，更新 {importer.updated} 個，未變更 {importer.unchanged} 個'
+        self.stdout.write(message)
+
+    def report_conflict(self, device, error):
+        self.stdout.write(
+            self.style.WARNING(f'設備已存在 (寫入時發現重複)，跳過: {device.brand} {device.specification}')
+        )
+
+    def report_upsert(self, importer):
+        """upsert 模式的更新統計"""
+        if importer.upsert:
+            self.stdout.write(
+                self.style.SUCCESS(f'更新了 {importer.updated} 個設備，{importer.unchanged} 個設備內容未變更')
+            )
+
+    def handle_ndjson(self, file_path, importer, build_device, options):
+        """逐批匯入 NDJSON 檔案，回傳是否全部完成"""
+        def report_error(line_no, error):
+            self.stdout.write(self.style.ERROR(f'第 {line_no} 行：{error}'))
+
+        self.stdout.write(f'開始從第 {options["resume_from_line"]} 行匯入 NDJSON...')
+        try:
+            last_line = import_ndjson(
+                file_path, importer, build_device,
+                batch_size=options['batch_size'],
+                start_line=options['resume_from_line'],
+                on_error=report_error,
+            )
+        except BatchError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            self.stdout.write(
+                self.style.WARNING(
+                    f'之前的批次已寫入 (建立 {importer.created} 個設備)，'
+                    f'修正後可使用 --resume-from-line {e.first_line} 繼續匯入'
+                )
+            )
+            return False
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'匯入完成！處理到第 {last_line} 行，建立了 {importer.types_created} 個設備種類、'
+                f'{importer.created} 個設備，跳過 {importer.skipped} 筆'
+            )
+        )
+        self.report_upsert(importer)
+        return True
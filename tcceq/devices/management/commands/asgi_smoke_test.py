@@ -0,0 +1,91 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from devices.asgismoke import run_smoke_test
+from devices.models import Devices
+
+
+class Command(BaseCommand):
+    help = '在本機程序中經由 ASGI handler 同時送出大量設備詳細資料頁與列表請求，確認非同步檢視可並行處理'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='送出的請求數 (預設: 500)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=100,
+            help='同時處理中的請求數上限 (預設: 100)'
+        )
+        parser.add_argument(
+            '--list-ratio',
+            type=float,
+            default=0.1,
+            help='設備列表請求的比例，其餘為設備詳細資料頁 (預設: 0.1)'
+        )
+        parser.add_argument(
+            '--host',
+            type=str,
+            default='localhost',
+            help='請求的 Host 標頭，必須在 ALLOWED_HOSTS 中 (預設: localhost)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='亂數種子，指定時每次送出相同的請求'
+        )
+
+    def handle(self, *args, **options):
+        device_ids = list(Devices.objects.values_list('id', flat=True))
+        if not device_ids:
+            raise CommandError('資料庫中沒有設備，請先執行 generate_inventory 或匯入資料')
+        search_terms = [term for term in Devices.objects.values_list('brand', flat=True)[:20] if term]
+
+        if settings.DEVICE_ASYNC_VIEWS:
+            self.stdout.write('使用非同步檢視 (DEVICE_ASYNC_VIEWS=1)')
+        else:
+            self.stdout.write(self.style.WARNING(
+                '目前使用同步檢視，請以 DEVICE_ASYNC_VIEWS=1 執行以測試 ASGI 部署使用的非同步檢視'
+            ))
+
+        results, elapsed, stats = asyncio.run(run_smoke_test(
+            device_ids,
+            paths={
+                'device_list': reverse('devices:device_list'),
+                'device_detail': reverse('devices:device_detail', args=[0]).replace('/0/', '/{id}/'),
+            },
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            list_ratio=options['list_ratio'],
+            search_terms=search_terms,
+            seed=options['seed'],
+            host=options['host'],
+        ))
+
+        summary = results.summary(elapsed)
+        errors = 0
+        for endpoint, endpoint_stats in summary.items():
+            errors += endpoint_stats['errors']
+            line = (
+                f'{endpoint}: {endpoint_stats["requests"]} 個請求、p50 {endpoint_stats["p50_ms"]:.1f} ms、'
+                f'p95 {endpoint_stats["p95_ms"]:.1f} ms、max {endpoint_stats["max_ms"]:.1f} ms、'
+                f'錯誤 {endpoint_stats["errors"]} 個'
+            )
+            self.stdout.write(self.style.ERROR(line) if endpoint_stats['errors'] else line)
+            if 'error_sample' in endpoint_stats:
+                self.stdout.write(self.style.ERROR(f'  錯誤範例: {endpoint_stats["error_sample"]}'))
+        total = sum(endpoint_stats['requests'] for endpoint_stats in summary.values())
+        self.stdout.write(
+            f'最多同時處理 {stats["max_in_flight"]} 個請求，程序最多 {stats["max_threads"]} 個執行緒'
+        )
+        if errors:
+            raise CommandError(f'{total} 個請求中有 {errors} 個失敗')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} 個請求全部成功，耗時 {elapsed:.1f} 秒，{total / elapsed:.1f} 次/秒'
+        ))
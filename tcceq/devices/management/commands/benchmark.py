@@ -0,0 +1,190 @@
+import json
+import logging
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from devices.benchmarks import SCENARIOS, BenchmarkRunner, compare_results
+
+
+def parse_size(value):
+    """1000、10k、1m 形式的資料量"""
+    multipliers = {'k': 1000, 'm': 1000000}
+    try:
+        if value[-1:].lower() in multipliers:
+            return int(float(value[:-1]) * multipliers[value[-1].lower()])
+        return int(value)
+    except ValueError:
+        raise CommandError(f'無法解析資料量: {value}')
+
+
+class Command(BaseCommand):
+    help = '在獨立的測試資料庫中建立基準資料，測量設備頁面、匯入指令與 CSV 轉換的效能'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            default=['1k', '10k'],
+            help='設備資料量，可使用 k / m (預設: 1k 10k)'
+        )
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=SCENARIOS,
+            default=SCENARIOS,
+            metavar='SCENARIO',
+            help=f'要執行的情境 (預設全部): {", ".join(SCENARIOS)}'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='頁面類情境的執行次數 (預設: 20)'
+        )
+        parser.add_argument(
+            '--heavy-repeat',
+            type=int,
+            default=3,
+            help='匯入與全部貼紙 PDF 的執行次數 (預設: 3)'
+        )
+        parser.add_argument(
+            '--qrcode-count',
+            type=int,
+            default=100,
+            help='download_qrcodes 每次選取的設備數 (預設: 100)'
+        )
+        parser.add_argument(
+            '--import-rows',
+            type=int,
+            default=10000,
+            help='匯入情境的設備數上限 (預設: 10000)'
+        )
+        parser.add_argument(
+            '--max-all-qrcodes',
+            type=int,
+            default=1000,
+            help='資料量超過此值時略過 download_all_qrcodes (預設: 1000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='ingest_survey_csvs 解析程序數 (預設: 2)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='產生基準資料的亂數種子 (預設: 0)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='benchmark_results.json',
+            help='結果 JSON 檔案路徑 (預設: benchmark_results.json)'
+        )
+        parser.add_argument(
+            '--baseline',
+            type=str,
+            help='與先前儲存的結果 JSON 比較'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.1,
+            help='p50 變化超過此比例時視為變慢或變快 (預設: 0.1)'
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='有情境變慢時以錯誤結束'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='保留測試資料庫，下次執行時不必重新建立資料表'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [parse_size(size) for size in options['sizes']]
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], 'r', encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'無法讀取基準結果 {options["baseline"]}: {e}')
+
+        runner = BenchmarkRunner(
+            sizes,
+            scenarios=options['scenarios'],
+            repeat=options['repeat'],
+            heavy_repeat=options['heavy_repeat'],
+            qrcode_count=options['qrcode_count'],
+            import_rows=options['import_rows'],
+            max_all_qrcodes=options['max_all_qrcodes'],
+            workers=options['workers'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        results = self.run_in_test_database(runner, options['keepdb'])
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'sizes': sizes,
+                'repeat': options['repeat'],
+                'heavy_repeat': options['heavy_repeat'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'結果已寫入 {options["output"]}'))
+
+        if baseline is not None:
+            self.report_comparison(report, baseline, options)
+
+    def run_in_test_database(self, runner, keepdb):
+        """與執行測試相同，建立獨立的測試資料庫，不會動到正式資料"""
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        # 頁面預算警告在基準測試中沒有意義；快取改用獨立的記憶體快取，清除時不影響其他程序
+        middleware_logger = logging.getLogger('devices.middleware')
+        middleware_logger.disabled = True
+        try:
+            with override_settings(CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'devices-benchmark'},
+            }):
+                return runner.run()
+        finally:
+            middleware_logger.disabled = False
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+            teardown_test_environment()
+
+    def report_comparison(self, report, baseline, options):
+        comparison = compare_results(report, baseline, options['threshold'])
+        if not comparison:
+            self.stdout.write(self.style.WARNING('基準結果中沒有相同的情境與資料量，無法比較'))
+            return
+
+        styles = {'slower': self.style.ERROR, 'faster': self.style.SUCCESS, 'unchanged': str}
+        for item in comparison:
+            self.stdout.write(styles[item['status']](
+                f'{item["scenario"]} ({item["size"]}): {item["baseline_p50_ms"]:.1f} ms → '
+                f'{item["p50_ms"]:.1f} ms ({item["change"]:+.1%})'
+            ))
+
+        slower = [item for item in comparison if item['status'] == 'slower']
+        if slower and options['fail_on_regression']:
+            raise CommandError(f'{len(slower)} 個情境比基準慢超過 {options["threshold"]:.0%}')
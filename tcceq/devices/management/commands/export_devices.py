@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from devices.dataexport import EXPORT_FORMATS, export_queryset, iter_export
+from devices.pagecache import normalize_search
+from devices.schedule import DUE_WINDOWS, due_filters
+
+
+class Command(BaseCommand):
+    help = '以串流方式匯出設備清單 (CSV 或 JSON Lines)，可使用與設備列表相同的篩選條件'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORT_FORMATS),
+            default='csv',
+            help='匯出格式，CSV 含 UTF-8 BOM 供 Excel 開啟 (預設: csv)'
+        )
+        parser.add_argument(
+            '--file',
+            type=str,
+            help='輸出檔案路徑 (預設輸出到標準輸出)'
+        )
+        parser.add_argument(
+            '--type',
+            type=int,
+            help='只匯出指定設備類型 id 的設備'
+        )
+        parser.add_argument(
+            '--search',
+            type=str,
+            default='',
+            help='只匯出符合搜尋關鍵字的設備'
+        )
+        parser.add_argument(
+            '--maintenance-due',
+            choices=[window for window, _ in DUE_WINDOWS],
+            help='只匯出下次保養日期在指定範圍的設備 (past: 已到期、month: 本月、next_month: 下個月、quarter: 本季、year: 今年)'
+        )
+        parser.add_argument(
+            '--warranty-expires',
+            choices=[window for window, _ in DUE_WINDOWS],
+            help='只匯出保固到期日在指定範圍的設備 (範圍同 --maintenance-due)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=getattr(settings, 'DEVICE_EXPORT_CHUNK_SIZE', 2000),
+            help='每次從資料庫讀取的設備筆數'
+        )
+
+    def handle(self, *args, **options):
+        devices = export_queryset(options['type'], normalize_search(options['search']), due_filters(options))
+        chunks = iter_export(options['format'], devices, options['chunk_size'])
+
+        file_path = options['file']
+        if not file_path:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        started = time.perf_counter()
+        # CSV 欄位中的換行由 csv 模組處理，檔案不做換行轉換
+        with open(file_path, 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'設備清單已匯出: {file_path} ({os.path.getsize(file_path) / 1024 / 1024:.1f} MB)，耗時 {elapsed:.2f} 秒'
+            )
+        )
@@ -0,0 +1,42 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from devices.snapshot import SnapshotError, export_snapshot
+
+
+class Command(BaseCommand):
+    help = '以 PostgreSQL COPY 將設備大類、設備種類與設備匯出成壓縮的快照檔'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            type=str,
+            help='快照檔案路徑 (預設: devices_snapshot_<日期時間>.copy.gz)'
+        )
+        parser.add_argument(
+            '--compress-level',
+            type=int,
+            default=6,
+            choices=range(0, 10),
+            help='gzip 壓縮等級 0-9 (預設: 6)'
+        )
+
+    def handle(self, *args, **options):
+        file_path = options['file'] or f'devices_snapshot_{timezone.localtime():%Y%m%d_%H%M%S}.copy.gz'
+
+        started = time.perf_counter()
+        try:
+            counts = export_snapshot(file_path, options['compress_level'])
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count} 筆')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'快照已輸出: {file_path} ({os.path.getsize(file_path) / 1024 / 1024:.1f} MB)，耗時 {elapsed:.2f} 秒'
+            )
+        )
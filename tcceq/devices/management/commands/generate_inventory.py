@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from devices.models import Devices
+from devices.synthetic import generate_inventory
+
+
+class Command(BaseCommand):
+    help = '產生擬真的設備大類、設備種類與設備資料，供負載與大資料量測試使用'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--devices',
+            type=int,
+            default=10000,
+            help='要產生的設備數 (預設: 10000)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='亂數種子，相同的種子與起始編號產生相同的資料 (預設: 0)'
+        )
+        parser.add_argument(
+            '--start',
+            type=int,
+            help='設備編號從多少開始 (預設為目前的設備數，重複執行時接續產生)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='每次批次寫入的設備數 (預設: 5000)'
+        )
+        parser.add_argument(
+            '--progress-every',
+            type=int,
+            default=50000,
+            help='每產生多少筆顯示一次進度 (預設: 50000)'
+        )
+
+    def handle(self, *args, **options):
+        start = options['start']
+        if start is None:
+            start = Devices.objects.count()
+        started = time.perf_counter()
+
+        def report_progress(importer):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'已產生 {importer.processed} 筆 ({importer.processed / elapsed:.0f} 筆/秒)')
+
+        importer = generate_inventory(
+            options['devices'],
+            seed=options['seed'],
+            start=start,
+            batch_size=options['batch_size'],
+            progress_every=options['progress_every'],
+            on_progress=report_progress,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'產生完成！新增了 {importer.created} 個設備 (編號 {start} 起)，耗時 {elapsed:.1f} 秒'
+            )
+        )
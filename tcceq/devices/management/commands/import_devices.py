@@ -1,109 +1,89 @@
 import json
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from devices.models import EquipmentType, Devices
+from devices.importers import DEVICE_FIELDS, RecordError
 from datetime import datetime
+from ._importing import ImportCommandMixin
 
-class Command(BaseCommand):
-    help = '從 JSON 檔案匯入設備資料'
+class Command(ImportCommandMixin, BaseCommand):
+    help = '從 JSON 或 NDJSON 檔案匯入設備資料'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--file',
             type=str,
-            help='JSON 檔案路徑',
+            help='JSON 或 NDJSON 檔案路徑',
             default='devices/import_template.json'
         )
+        self.add_import_arguments(parser)
+
+    def build_device(self, importer, device_data):
+        """把一筆設備資料轉成 (設備類型 id, 欄位)"""
+        equipment_type_id = importer.type_id(device_data['equipment_type'], create=False)
+        if equipment_type_id is None:
+            raise RecordError(f'找不到設備類型: {device_data["equipment_type"]}')
+        fields = {field: device_data[field] for field in DEVICE_FIELDS}
+        fields['date_installed'] = datetime.strptime(device_data['date_installed'], '%Y-%m-%d').date()
+        return equipment_type_id, fields
 
     def handle(self, *args, **options):
         file_path = options['file']
         
         try:
+            if self.use_ndjson(file_path, options):
+                importer = self.create_importer(options, dedup_fields=('brand', 'specification'))
+                self.handle_ndjson(
+                    file_path, importer,
+                    lambda device_data, line_no: self.build_device(importer, device_data),
+                    options,
+                )
+                return
+            
             with open(file_path, 'r', encoding='utf-8') as file:
                 data = json.load(file)
             
             with transaction.atomic():
+                importer = self.create_importer(options, dedup_fields=('brand', 'specification'))
+                
                 # 先匯入設備類型
-                equipment_types_created = 0
                 for eq_type_data in data.get('equipment_types', []):
-                    equipment_type, created = EquipmentType.objects.get_or_create(
-                        name=eq_type_data['name']
-                    )
-                    if created:
-                        equipment_types_created += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(f'建立設備類型: {equipment_type.name}')
-                        )
+                    importer.type_id(eq_type_data['name'])
+                equipment_types_created = importer.types_created
                 
                 # 再匯入設備
-                devices_created = 0
                 for device_data in data.get('devices', []):
                     try:
-                        # 取得設備類型
-                        equipment_type = EquipmentType.objects.get(
-                            name=device_data['equipment_type']
-                        )
-                        
-                        # 檢查是否已存在相同設備
-                        existing_device = Devices.objects.filter(
-                            equipment_type=equipment_type,
-                            brand=device_data['brand'],
-                            specification=device_data['specification']
-                        ).first()
-                        
-                        if existing_device:
-                            self.stdout.write(
-                                self.style.WARNING(
-                                    f'設備已存在，跳過: {device_data["brand"]} - {device_data["specification"]}'
-                                )
-                            )
-                            continue
-                        
-                        # 建立新設備
-                        device = Devices.objects.create(
-                            equipment_type=equipment_type,
-                            brand=device_data['brand'],
-                            specification=device_data['specification'],
-                            power_info=device_data['power_info'],
-                            date_installed=datetime.strptime(device_data['date_installed'], '%Y-%m-%d').date(),
-                            maintenance_cycle=device_data['maintenance_cycle'],
-                            warranty_period=device_data['warranty_period'],
-                            contractor_name=device_data['contractor_name'],
-                            contractor_phone=device_data['contractor_phone'],
-                            installer_name=device_data['installer_name'],
-                            installer_phone=device_data['installer_phone'],
-                            emergency_name=device_data['emergency_name'],
-                            emergency_phone=device_data['emergency_phone'],
-                            maintenance_name=device_data['maintenance_name'],
-                            maintenance_phone=device_data['maintenance_phone'],
-                        )
-                        devices_created += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'建立設備: {device.brand} - {device.specification}'
-                            )
-                        )
-                    
-                    except EquipmentType.DoesNotExist:
-                        self.stdout.write(
-                            self.style.ERROR(
-                                f'找不到設備類型: {device_data["equipment_type"]}'
-                            )
-                        )
+                        equipment_type_id, fields = self.build_device(importer, device_data)
+                    except RecordError as e:
+                        importer.skip()
+                        self.stdout.write(self.style.ERROR(str(e)))
                         continue
                     except Exception as e:
+                        importer.skip()
                         self.stdout.write(
                             self.style.ERROR(
                                 f'建立設備時發生錯誤: {device_data.get("brand", "未知")} - {str(e)}'
                             )
                         )
                         continue
+                    
+                    # 已存在相同設備 (種類、廠牌、規格) 時跳過
+                    if not importer.add(equipment_type_id, **fields) and options['verbosity'] >= 2:
+                        self.stdout.write(
+                            self.style.WARNING(
+                                f'設備已存在，跳過: {device_data["brand"]} - {device_data["specification"]}'
+                            )
+                        )
+                
+                importer.finish()
+                devices_created = importer.created
             
             self.stdout.write(
                 self.style.SUCCESS(
                     f'匯入完成！建立了 {equipment_types_created} 個設備類型和 {devices_created} 個設備'
                 )
             )
+            self.report_upsert(importer)
         
         except FileNotFoundError:
             self.stdout.write(
@@ -0,0 +1,88 @@
+import os
+
+from django.db import transaction
+from devices.importers import RecordError
+from devices.survey_csv import iter_survey_devices
+from .reload_sample_data import Command as ReloadSampleDataCommand
+
+
+class Command(ReloadSampleDataCommand):
+    help = '直接解析現場調查 CSV (直式設備區塊) 並批次寫入資料庫，不需要先轉成 JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            type=str,
+            default='devices/testimport.csv',
+            help='指定 CSV 檔案路徑 (預設: devices/testimport.csv)'
+        )
+        parser.add_argument(
+            '--clear-existing',
+            action='store_true',
+            help='清除現有資料'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='每次批次寫入的設備數 (預設: 1000)'
+        )
+        parser.add_argument(
+            '--progress-every',
+            type=int,
+            default=1000,
+            help='每處理多少筆顯示一次進度 (預設: 1000)'
+        )
+        self.add_upsert_argument(parser)
+
+    def handle(self, *args, **options):
+        file_path = options['file']
+        
+        # 確認檔案存在
+        if not os.path.exists(file_path):
+            self.stdout.write(
+                self.style.ERROR(f'檔案不存在: {file_path}')
+            )
+            return
+
+        def report_unknown_field(field_name, field_value):
+            if options['verbosity'] >= 2:
+                self.stdout.write(self.style.WARNING(f'未知欄位: {field_name} = {field_value}'))
+
+        self.stdout.write('開始載入資料...')
+        
+        # 與 convert_csv_to_json.py + reload_sample_data 相同的欄位對應與轉換規則，
+        # 但 CSV 只讀取一次，每次只保留一個設備區塊在記憶體中
+        with open(file_path, 'r', encoding='utf-8') as file, transaction.atomic():
+            if options['clear_existing']:
+                self.clear_data()
+            
+            importer = self.create_importer(options, dedup_fields=('specification',), skip_blank_keys=True)
+            
+            for index, device_data in enumerate(iter_survey_devices(file, report_unknown_field), 1):
+                try:
+                    equipment_type_id, fields = self.build_device(
+                        importer, device_data, f'第 {index} 個設備', options['verbosity']
+                    )
+                except RecordError as e:
+                    importer.skip()
+                    self.stdout.write(self.style.WARNING(f'第 {index} 個設備：{e}'))
+                    continue
+                
+                # 已存在相同規格的設備時跳過（避免重複）
+                if not importer.add(equipment_type_id, **fields) and options['verbosity'] >= 2:
+                    self.stdout.write(f'第 {index} 個設備：設備已存在，跳過: {device_data.get("specification")}')
+            
+            importer.finish()
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'資料載入完成！'
+                f'新增了 {importer.types_created} 個設備種類、{importer.created} 個設備'
+            )
+        )
+        self.report_upsert(importer)
+        if importer.skipped > 0:
+            self.stdout.write(
+                self.style.WARNING(f'跳過了 {importer.skipped} 個設備（重複或資料不完整）')
+            )
@@ -0,0 +1,136 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from devices.importers import RecordError
+from devices.survey_csv import parse_survey_file
+from .reload_sample_data import Command as ReloadSampleDataCommand
+
+
+def expand_paths(patterns):
+    """把目錄、萬用字元與檔案路徑展開成不重複的 CSV 檔案清單"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.csv')))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+class Command(ReloadSampleDataCommand):
+    help = '以多個程序平行解析多個現場調查 CSV，合併去除重複後批次寫入資料庫'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            help='CSV 檔案、目錄 (讀取其中的 *.csv) 或萬用字元 (例如 "surveys/**/*.csv")'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='平行解析的程序數 (預設: CPU 核心數)'
+        )
+        parser.add_argument(
+            '--clear-existing',
+            action='store_true',
+            help='清除現有資料'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='每次批次寫入的設備數 (預設: 1000)'
+        )
+        parser.add_argument(
+            '--progress-every',
+            type=int,
+            default=1000,
+            help='每處理多少筆顯示一次進度 (預設: 1000)'
+        )
+        self.add_upsert_argument(parser)
+
+    def handle(self, *args, **options):
+        paths = expand_paths(options['paths'])
+        missing = [path for path in paths if not os.path.isfile(path)]
+        if missing:
+            raise CommandError(f'檔案不存在: {", ".join(missing)}')
+        if not paths:
+            raise CommandError('沒有符合的 CSV 檔案')
+
+        workers = max(1, min(options['workers'], len(paths)))
+        self.stdout.write(f'共 {len(paths)} 個檔案，使用 {workers} 個程序解析...')
+
+        started = time.perf_counter()
+        failed = 0
+        # 子程序只負責解析 CSV (不使用資料庫)，寫入在主程序中以同一個批次寫入器完成，
+        # 設備種類與重複檢查因此會跨檔案合併
+        with ProcessPoolExecutor(max_workers=workers) as executor, transaction.atomic():
+            if options['clear_existing']:
+                self.clear_data()
+            importer = self.create_importer(options, dedup_fields=('specification',), skip_blank_keys=True)
+
+            futures = [executor.submit(parse_survey_file, path) for path in paths]
+            for path, future in zip(paths, futures):
+                try:
+                    result = future.result()
+                except (OSError, UnicodeDecodeError) as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'{path}: 無法解析 - {e}'))
+                    continue
+
+                write_started = time.perf_counter()
+                created, skipped = importer.created, importer.skipped
+                for index, device_data in enumerate(result['devices'], 1):
+                    label = f'{path} 第 {index} 個設備'
+                    try:
+                        equipment_type_id, fields = self.build_device(
+                            importer, device_data, label, options['verbosity']
+                        )
+                    except RecordError as e:
+                        importer.skip()
+                        self.stdout.write(self.style.WARNING(f'{label}：{e}'))
+                        continue
+                    importer.add(equipment_type_id, **fields)
+                write_seconds = time.perf_counter() - write_started
+
+                self.report_file(
+                    result,
+                    created=importer.created - created,
+                    skipped=importer.skipped - skipped,
+                    write_seconds=write_seconds,
+                )
+
+            importer.finish()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'匯入完成！{len(paths) - failed} 個檔案，新增了 {importer.types_created} 個設備種類、'
+                f'{importer.created} 個設備，跳過 {importer.skipped} 個，耗時 {elapsed:.2f} 秒'
+            )
+        )
+        self.report_upsert(importer)
+        if failed:
+            self.stdout.write(self.style.ERROR(f'{failed} 個檔案無法解析'))
+
+    def report_file(self, result, created, skipped, write_seconds):
+        """輸出單一檔案的統計"""
+        self.stdout.write(
+            f'{result["path"]}: {result["rows"]} 行、{len(result["devices"])} 個設備 '
+            f'(新增 {created}、跳過 {skipped})，'
+            f'解析 {result["parse_seconds"]:.2f} 秒、寫入 {write_seconds:.2f} 秒'
+        )
+        if result['unknown_fields']:
+            unknown = '、'.join(f'{name} ({count})' for name, count in result['unknown_fields'].items())
+            self.stdout.write(self.style.WARNING(f'  未知欄位: {unknown}'))
@@ -0,0 +1,160 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from devices.loadtest import PROFILES, Target, run_load
+from devices.models import Devices, EquipmentType
+from devices.synthetic import CATALOG
+
+
+class Command(BaseCommand):
+    help = '對執行中的伺服器送出模擬 QR code 掃描、列表瀏覽與貼紙下載的混合流量，統計各端點的延遲與錯誤率'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            type=str,
+            default='http://127.0.0.1:8000',
+            help='伺服器網址 (預設: http://127.0.0.1:8000)'
+        )
+        parser.add_argument(
+            '--profile',
+            choices=PROFILES,
+            default='mixed',
+            help='流量類型：scan (掃描 QR code)、browse (瀏覽與搜尋)、download (下載貼紙)、mixed (混合，預設)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=10,
+            help='同時送出請求的使用者數 (預設: 10)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='測試秒數 (預設: 30，0 表示只依 --requests 結束)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            help='最多送出的請求數 (翻頁另計)'
+        )
+        parser.add_argument(
+            '--ramp-up',
+            type=float,
+            default=0,
+            help='在幾秒內逐漸啟動所有使用者 (預設: 0，同時開始)'
+        )
+        parser.add_argument(
+            '--think-time',
+            type=float,
+            default=0,
+            help='每個使用者兩次操作之間的最長等待秒數 (預設: 0)'
+        )
+        parser.add_argument(
+            '--qrcode-count',
+            type=int,
+            default=20,
+            help='每次下載貼紙選取的設備數 (預設: 20)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='單一請求的逾時秒數 (預設: 30)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='亂數種子，指定時每次送出相同順序的請求'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='將結果寫入 JSON 檔案'
+        )
+
+    def handle(self, *args, **options):
+        # 設備 id 與設備類型從伺服器使用的同一個資料庫讀取
+        device_ids = list(Devices.objects.values_list('id', flat=True))
+        if not device_ids:
+            raise CommandError('資料庫中沒有設備，請先執行 generate_inventory 或匯入資料')
+        search_terms = sorted({brand for description, types, brands, powers in CATALOG.values() for brand in brands})
+        search_terms += [term for term in Devices.objects.values_list('brand', flat=True)[:20] if term]
+
+        try:
+            target = Target(
+                options['url'],
+                device_ids=device_ids,
+                type_ids=list(EquipmentType.objects.values_list('id', flat=True)),
+                search_terms=search_terms,
+                paths={
+                    'device_list': reverse('devices:device_list'),
+                    'device_detail': reverse('devices:device_detail', args=[0]).replace('/0/', '/{id}/'),
+                    'download_qrcodes': reverse('devices:download_qrcodes'),
+                },
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        duration = options['duration'] or None
+        if duration is None and options['requests'] is None:
+            raise CommandError('--duration 為 0 時必須指定 --requests')
+        self.stdout.write(
+            f'對 {options["url"]} 送出 {options["profile"]} 流量，{options["concurrency"]} 個使用者'
+            + (f'，{duration:g} 秒' if duration else '')
+            + (f'，最多 {options["requests"]} 個請求' if options['requests'] else '')
+        )
+
+        results, elapsed = run_load(
+            target,
+            profile=options['profile'],
+            concurrency=options['concurrency'],
+            duration=duration,
+            max_requests=options['requests'],
+            seed=options['seed'],
+            ramp_up=options['ramp_up'],
+            timeout=options['timeout'],
+            think_time=options['think_time'],
+            qrcode_count=options['qrcode_count'],
+        )
+        summary = results.summary(elapsed)
+        if not summary:
+            raise CommandError('沒有送出任何請求')
+
+        total = sum(stats['requests'] for stats in summary.values())
+        errors = sum(stats['errors'] for stats in summary.values())
+        for endpoint, stats in summary.items():
+            line = (
+                f'{endpoint}: {stats["requests"]} 個請求、{stats["throughput"]:.1f} 次/秒、'
+                f'p50 {stats["p50_ms"]:.1f} ms、p95 {stats["p95_ms"]:.1f} ms、p99 {stats["p99_ms"]:.1f} ms、'
+                f'錯誤率 {stats["error_rate"]:.1%}'
+            )
+            self.stdout.write(self.style.ERROR(line) if stats['errors'] else line)
+            if 'error_sample' in stats:
+                self.stdout.write(self.style.ERROR(f'  錯誤範例: {stats["error_sample"]}'))
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f'共 {total} 個請求，耗時 {elapsed:.1f} 秒，{total / elapsed:.1f} 次/秒，錯誤 {errors} 個'
+        ))
+
+        if options['output']:
+            report = {
+                'meta': {
+                    'created_at': timezone.now().isoformat(),
+                    'url': options['url'],
+                    'profile': options['profile'],
+                    'concurrency': options['concurrency'],
+                    'duration': duration,
+                    'requests': options['requests'],
+                    'think_time': options['think_time'],
+                    'seed': options['seed'],
+                    'elapsed_seconds': round(elapsed, 3),
+                },
+                'endpoints': summary,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'結果已寫入 {options["output"]}'))
@@ -0,0 +1,41 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from devices.models import Devices
+from devices.pagecache import bump_data_version
+from devices.schedule import update_schedules
+
+
+class Command(BaseCommand):
+    help = '把已過去的下次保養日期往後推到下一個周期 (每天排程執行)；--all 重新解析所有設備的維修保養周期與保固時程'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重新計算所有設備 (例如調整解析規則之後)，預設只處理下次保養日期已過去的設備'
+        )
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            help='以指定日期 (YYYY-MM-DD) 為今天計算 (預設: 今天)'
+        )
+
+    def handle(self, *args, **options):
+        today = options['date'] or timezone.localdate()
+        devices = Devices.objects.all()
+        if not options['all']:
+            # 使用 next_maintenance_due 的索引，只讀取需要更新的設備
+            devices = devices.filter(next_maintenance_due__lt=today)
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            changed = update_schedules(devices, connection, today=today)
+            if changed:
+                # 詳細資料頁會顯示下次保養日期
+                transaction.on_commit(bump_data_version)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'已更新 {changed} 個設備的保養排程，耗時 {elapsed:.1f} 秒'))
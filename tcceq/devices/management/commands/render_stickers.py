@@ -0,0 +1,215 @@
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+from devices.pdfstream import iter_sticker_pdf
+from devices.stickers import get_sticker_page
+
+
+# 子程序可能以 spawn 方式啟動 (例如 Windows)，此模組在 django.setup() 之前
+# 就會被匯入，因此模型一律在函式內匯入。
+
+def _init_worker():
+    """子程序啟動時建立 Django 環境"""
+    import django
+    django.setup()
+
+
+def filter_devices(type_id=None, since=None):
+    """依設備種類與安裝日期篩選設備"""
+    from devices.models import Devices
+
+    devices = Devices.objects.all()
+    if type_id:
+        devices = devices.filter(equipment_type_id=type_id)
+    if since:
+        devices = devices.filter(date_installed__gte=since)
+    return devices
+
+
+def write_pages(path, pages):
+    """把貼紙內容逐頁寫入暫存檔，供合併時再逐頁讀取"""
+    with open(path, 'wb') as output:
+        for page in pages:
+            pickle.dump(page, output, pickle.HIGHEST_PROTOCOL)
+
+
+def read_pages(path):
+    """逐頁讀取 write_pages 寫入的貼紙內容"""
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+
+def render_shard(shard_no, id_from, id_to, type_id, since, base_url, output_path, pages_path=None):
+    """在子程序中繪製一個分片的貼紙並寫成 PDF，指定 pages_path 時另外寫出貼紙內容供合併"""
+    started = time.perf_counter()
+    devices = (
+        filter_devices(type_id, since)
+        .filter(id__gte=id_from, id__lte=id_to)
+        .select_related('equipment_type')
+        .order_by('id')
+    )
+    pages = [
+        get_sticker_page(device, f"{base_url}{reverse('devices:device_detail', args=[device.id])}")
+        for device in devices
+    ]
+    rendered = time.perf_counter()
+
+    with open(output_path, 'wb') as output:
+        for chunk in iter_sticker_pdf(pages):
+            output.write(chunk)
+    if pages_path:
+        write_pages(pages_path, pages)
+    finished = time.perf_counter()
+
+    return {
+        'shard': shard_no,
+        'id_from': id_from,
+        'id_to': id_to,
+        'pages': len(pages),
+        'render_seconds': rendered - started,
+        'write_seconds': finished - rendered,
+        'path': output_path,
+        'pages_path': pages_path,
+    }
+
+
+class Command(BaseCommand):
+    help = '以多個程序平行繪製設備 QR code 貼紙，依 id 範圍分片輸出 PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='平行繪製的程序數 (預設: CPU 核心數)'
+        )
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=1000,
+            help='每個分片的設備數 (預設: 1000)'
+        )
+        parser.add_argument(
+            '--type',
+            type=str,
+            help='只輸出指定設備種類 (id 或名稱)'
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='只輸出安裝日期在此日期 (YYYY-MM-DD) 之後的設備'
+        )
+        parser.add_argument(
+            '--base-url',
+            type=str,
+            default='http://localhost:8000',
+            help='QR code 連結的網站網址 (預設: http://localhost:8000)'
+        )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default='stickers',
+            help='PDF 輸出目錄 (預設: stickers)'
+        )
+        parser.add_argument(
+            '--merge',
+            action='store_true',
+            help='另外輸出一個合併所有分片的 PDF (由各分片寫出的暫存檔逐頁合併)'
+        )
+
+    def handle(self, *args, **options):
+        from devices.models import EquipmentType
+
+        workers = max(1, options['workers'])
+        shard_size = max(1, options['shard_size'])
+        base_url = options['base_url'].rstrip('/')
+        output_dir = options['output_dir']
+
+        type_id = None
+        if options['type']:
+            equipment_types = EquipmentType.objects.all()
+            if options['type'].isdigit():
+                equipment_types = equipment_types.filter(id=options['type'])
+            else:
+                equipment_types = equipment_types.filter(name=options['type'])
+            equipment_type = equipment_types.first()
+            if equipment_type is None:
+                raise CommandError(f'找不到設備種類: {options["type"]}')
+            type_id = equipment_type.id
+
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f'日期格式錯誤: {options["since"]}，應為 YYYY-MM-DD')
+
+        # 依 id 排序切成分片，每個分片以 (起始 id, 結束 id) 表示
+        ids = list(filter_devices(type_id, since).order_by('id').values_list('id', flat=True))
+        if not ids:
+            self.stdout.write(self.style.WARNING('沒有符合條件的設備'))
+            return
+        shards = [
+            (ids[i], ids[min(i + shard_size, len(ids)) - 1])
+            for i in range(0, len(ids), shard_size)
+        ]
+        del ids
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.stdout.write(f'共 {len(shards)} 個分片，使用 {workers} 個程序繪製...')
+
+        # 子程序會重新連線資料庫，先關閉父程序的連線
+        connections.close_all()
+
+        started = time.perf_counter()
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [
+                executor.submit(
+                    render_shard, shard_no, id_from, id_to, type_id, since, base_url,
+                    os.path.join(output_dir, f'stickers_{shard_no:04d}.pdf'),
+                    os.path.join(output_dir, f'stickers_{shard_no:04d}.pages') if options['merge'] else None,
+                )
+                for shard_no, (id_from, id_to) in enumerate(shards, 1)
+            ]
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                pages_per_second = result['pages'] / result['render_seconds'] if result['render_seconds'] else 0
+                self.stdout.write(
+                    f'分片 {result["shard"]:04d} (id {result["id_from"]}-{result["id_to"]}): '
+                    f'{result["pages"]} 頁，繪製 {result["render_seconds"]:.2f} 秒、'
+                    f'寫入 {result["write_seconds"]:.2f} 秒 ({pages_per_second:.0f} 頁/秒) -> {result["path"]}'
+                )
+
+        if options['merge']:
+            merged_path = os.path.join(output_dir, 'stickers_all.pdf')
+            # 分片的貼紙內容不傳回父程序，合併時從暫存檔逐頁讀取，記憶體用量不隨總頁數增加
+            pages = (page for result in results for page in read_pages(result['pages_path']))
+            try:
+                with open(merged_path, 'wb') as output:
+                    for chunk in iter_sticker_pdf(pages):
+                        output.write(chunk)
+            finally:
+                for result in results:
+                    os.remove(result['pages_path'])
+            self.stdout.write(f'已合併輸出: {merged_path}')
+
+        elapsed = time.perf_counter() - started
+        total_pages = sum(result['pages'] for result in results)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'繪製完成！共 {total_pages} 頁，耗時 {elapsed:.2f} 秒 '
+                f'({total_pages / elapsed:.0f} 頁/秒)'
+            )
+        )
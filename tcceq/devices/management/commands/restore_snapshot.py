@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from devices.snapshot import SnapshotError, restore_snapshot
+
+
+class Command(BaseCommand):
+    help = '清除現有的設備資料，並以 PostgreSQL COPY 還原 export_snapshot 產生的快照檔'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            type=str,
+            required=True,
+            help='快照檔案路徑'
+        )
+        parser.add_argument(
+            '--ignore-schema',
+            action='store_true',
+            help='快照與資料庫的 migration 版本不同時仍然還原'
+        )
+
+    def handle(self, *args, **options):
+        file_path = options['file']
+        if not os.path.exists(file_path):
+            raise CommandError(f'檔案不存在: {file_path}')
+
+        started = time.perf_counter()
+        try:
+            counts = restore_snapshot(file_path, options['ignore_schema'])
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count} 筆')
+        self.stdout.write(self.style.SUCCESS(f'快照還原完成，耗時 {elapsed:.2f} 秒'))
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from devices.exports import claim_next_job, delete_expired_exports, fail_stale_jobs, run_export_job
+from devices.models import StickerExportJob
+
+# 每隔幾秒檢查一次中止的工作與逾期的匯出檔案
+CLEANUP_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = '執行背景貼紙匯出工作 (不需要額外的訊息佇列)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='沒有工作時每隔幾秒檢查一次 (預設: 2 秒)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='處理完目前等待中的工作後結束'
+        )
+
+    def cleanup(self):
+        """將沒有心跳的產生中工作標記為失敗，並刪除逾期的匯出工作與檔案"""
+        stale = fail_stale_jobs()
+        if stale:
+            self.stdout.write(self.style.WARNING(f'{stale} 個工作的工作程序已中止，標記為失敗'))
+        jobs, files = delete_expired_exports()
+        if jobs or files:
+            self.stdout.write(f'刪除了 {jobs} 個逾期的匯出工作、{files} 個檔案')
+
+    def handle(self, *args, **options):
+        poll_interval = options['poll_interval']
+        self.stdout.write('貼紙匯出工作程序已啟動...')
+
+        last_cleanup = None
+        while True:
+            close_old_connections()
+            if last_cleanup is None or time.monotonic() - last_cleanup >= CLEANUP_INTERVAL:
+                self.cleanup()
+                last_cleanup = time.monotonic()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            self.stdout.write(f'開始產生貼紙匯出 #{job.id}...')
+            started = time.perf_counter()
+            job = run_export_job(job)
+            elapsed = time.perf_counter() - started
+
+            if job.status == StickerExportJob.STATUS_DONE:
+                self.stdout.write(
+                    self.style.SUCCESS(f'貼紙匯出 #{job.id} 完成：{job.total} 頁，耗時 {elapsed:.2f} 秒')
+                )
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f'貼紙匯出 #{job.id} 失敗：{job.error}')
+                )
@@ -0,0 +1,107 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import routers
+from .querycount import QueryCounter, install_dispatch
+from .streaming import ThreadedStream
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """統計每個請求的 SQL 查詢次數與耗時，超過 QUERY_BUDGET 時記錄警告
+
+    串流回應 (StreamingHttpResponse) 在回傳後才讀取的資料不會被計入。
+    同時支援同步與非同步請求，ASGI 部署時不會讓非同步檢視退回執行緒中執行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_queries = getattr(settings, 'QUERY_BUDGET', 20)
+        self.max_duration = getattr(settings, 'QUERY_BUDGET_TIME', 0.5)
+        self.is_async = iscoroutinefunction(get_response)
+        self.dispatch_installed = False
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        return self.process_counter(request, response, counter)
+
+    async def __acall__(self, request):
+        if not self.dispatch_installed:
+            # 非同步檢視的查詢在 asgiref 的共用執行緒執行，計數用的 wrapper 要裝在那裡的連線上
+            await sync_to_async(install_dispatch)()
+            self.dispatch_installed = True
+        async with QueryCounter() as counter:
+            response = await self.get_response(request)
+        return self.process_counter(request, response, counter)
+
+    def process_counter(self, request, response, counter):
+        if counter.count > self.max_queries or counter.duration > self.max_duration:
+            view_name = request.resolver_match.view_name if request.resolver_match else request.path
+            logger.warning(
+                '%s 超出查詢預算：%d 次查詢 (上限 %d)，耗時 %.1f ms (上限 %.1f ms)',
+                view_name, counter.count, self.max_queries,
+                counter.duration * 1000, self.max_duration * 1000,
+            )
+        if settings.DEBUG:
+            response['X-DB-Queries'] = str(counter.count)
+            response['X-DB-Time'] = f'{counter.duration * 1000:.1f}ms'
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """建立每個請求的唯讀副本路由狀態 (devices.routers)，請求中有寫入時設定 read-your-writes cookie"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = routers.begin_request(request)
+        return routers.finish_response(state, self.get_response(request))
+
+    async def __acall__(self, request):
+        state = routers.begin_request(request)
+        return routers.finish_response(state, await self.get_response(request))
+
+
+class AsyncStreamingMiddleware:
+    """非同步請求的同步串流回應改由 devices.streaming.ThreadedStream 輸出
+
+    避免 ASGI handler 把整個串流內容讀進記憶體，並佔用 asgiref 的共用同步執行緒。
+    同步 (WSGI) 請求不做任何處理。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.streaming and not response.is_async:
+            response.streaming_content = ThreadedStream(response.streaming_content)
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_alter_devices_contractor_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StickerExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '產生中'), ('done', '已完成'), ('failed', '失敗')], db_index=True, default='pending', max_length=10)),
+                ('device_ids', models.JSONField(blank=True, null=True)),
+                ('base_url', models.CharField(max_length=200)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('done', models.PositiveIntegerField(default=0)),
+                ('file', models.FileField(blank=True, upload_to='sticker_exports/')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': '貼紙匯出工作',
+                'verbose_name_plural': '貼紙匯出工作',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:51
+
+import re
+
+from django.db import migrations, models
+
+# 以下為 devices.search 在此 migration 建立時的內容，複製一份固定下來，
+# 之後修改 devices.search 不會影響已執行或將要執行的 migration。
+MAX_TERM_LENGTH = 32
+SEARCH_FIELDS = ('brand', 'specification', 'contractor_name')
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def split_terms(text):
+    if not text:
+        return []
+    return _TERM_RE.findall(text.lower().replace('_', ' '))
+
+
+def build_search_document(*values):
+    tokens = []
+    seen = set()
+    for value in values:
+        for term in split_terms(value):
+            for start in range(len(term)):
+                token = term[start:start + MAX_TERM_LENGTH]
+                if token not in seen:
+                    seen.add(token)
+                    tokens.append(token)
+    return ' '.join(tokens)
+
+
+def fill_search_document(apps, schema_editor):
+    """為既有設備產生 search_document"""
+    Devices = apps.get_model('devices', 'Devices')
+    batch = []
+    for device in Devices.objects.only(*SEARCH_FIELDS).iterator(chunk_size=2000):
+        device.search_document = build_search_document(*(getattr(device, field) for field in SEARCH_FIELDS))
+        batch.append(device)
+        if len(batch) >= 2000:
+            Devices.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    if batch:
+        Devices.objects.bulk_update(batch, ['search_document'])
+
+
+# 與 devices.search.search_vector() 相同的運算式，查詢才能使用索引
+CREATE_SEARCH_INDEX = (
+    "CREATE INDEX devices_search_gin ON devices_devices "
+    "USING gin (array_to_tsvector(string_to_array(search_document, ' ')))"
+)
+DROP_SEARCH_INDEX = 'DROP INDEX IF EXISTS devices_search_gin'
+
+
+def add_search_index(apps, schema_editor):
+    # GIN 索引只在 PostgreSQL 上建立
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_stickerexportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devices',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_document, migrations.RunPython.noop),
+        # 索引只存在於 PostgreSQL 資料庫中，不加入模型狀態 (見 Devices.Meta)
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0005_devices_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devices',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:38
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+
+def backfill_stats(apps, schema_editor):
+    """依現有設備建立統計 (與此 migration 建立時的 devices.stats.compute_counts 相同，以歷史模型計算)"""
+    Devices = apps.get_model('devices', 'Devices')
+    InventoryStat = apps.get_model('devices', 'InventoryStat')
+    devices = Devices.objects.order_by()
+    counts = Counter()
+    for equipment_type_id, count in devices.values_list('equipment_type_id').annotate(count=Count('id')):
+        counts[('type', str(equipment_type_id))] += count
+    for contractor_name, count in devices.values_list('contractor_name').annotate(count=Count('id')):
+        counts[('contractor', contractor_name or '')] += count
+    years = devices.annotate(year=ExtractYear('date_installed')).values_list('year').annotate(count=Count('id'))
+    for year, count in years:
+        counts[('year', '' if year is None else str(year))] += count
+    # 資料表剛建立，直接新增所有項目
+    InventoryStat.objects.bulk_create(
+        [InventoryStat(dimension=dimension, key=key, count=count) for (dimension, key), count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0007_devices_natural_key_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('type', '設備種類'), ('contractor', '施工廠商'), ('year', '安裝年份')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '設備統計',
+                'verbose_name_plural': '設備統計',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='inventory_stat_dimension_key')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
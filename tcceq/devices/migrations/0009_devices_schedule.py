@@ -0,0 +1,177 @@
+import calendar
+import datetime
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# 以下為 devices.schedule 在此 migration 建立時的內容，複製一份固定下來，
+# 之後修改 devices.schedule 不會影響已執行或將要執行的 migration。
+SOURCE_FIELDS = ('date_installed', 'maintenance_cycle', 'warranty_period')
+SCHEDULE_FIELDS = ('maintenance_interval_months', 'warranty_months', 'next_maintenance_due', 'warranty_expires')
+
+UNIT_MONTHS = {'年': 12, '季': 3, '個月': 1, '月': 1}
+
+CHINESE_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '兩': 2, '两': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+}
+
+_NUMBER = r'[0-9]+|[零〇一二兩两三四五六七八九十]+'
+_PERIOD = re.compile(r'(?P<number>%s|半)?(?P<unit>年|季|個月|月)(?P<half>半)?' % _NUMBER)
+_TIMES = re.compile(r'(?P<number>%s)次' % _NUMBER)
+
+MAX_MONTHS = 1200
+
+
+def parse_number(text):
+    if text.isdigit():
+        return int(text)
+    try:
+        if '十' in text:
+            tens, _, ones = text.partition('十')
+            return (CHINESE_DIGITS[tens] if tens else 1) * 10 + (CHINESE_DIGITS[ones] if ones else 0)
+        value = 0
+        for character in text:
+            value = value * 10 + CHINESE_DIGITS[character]
+        return value
+    except KeyError:
+        return None
+
+
+def parse_months(text):
+    if not text:
+        return None
+    text = ''.join(unicodedata.normalize('NFKC', text).split())
+    match = _PERIOD.search(text)
+    if match is None:
+        return None
+    unit_months = UNIT_MONTHS[match['unit']]
+    number = match['number']
+    if number == '半':
+        if unit_months % 2:
+            return None
+        months = unit_months // 2
+    else:
+        count = parse_number(number) if number else 1
+        if count is None:
+            return None
+        months = count * unit_months
+    if match['half']:
+        months += unit_months // 2
+    times = _TIMES.search(text, match.end())
+    if times:
+        count = parse_number(times['number'])
+        if not count or months % count:
+            return None
+        months //= count
+    if not 0 < months <= MAX_MONTHS:
+        return None
+    return months
+
+
+def as_date(value):
+    if not value:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def add_months(day, months):
+    index = day.month - 1 + months
+    year = day.year + index // 12
+    month = index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def next_due(start, interval_months, today):
+    elapsed = (today.year - start.year) * 12 + today.month - start.month
+    count = max(elapsed // interval_months, 1)
+    due = add_months(start, count * interval_months)
+    while due < today:
+        count += 1
+        due = add_months(start, count * interval_months)
+    return due
+
+
+def schedule_fields(date_installed, maintenance_cycle, warranty_period, today):
+    installed = as_date(date_installed)
+    interval = parse_months(maintenance_cycle)
+    warranty = parse_months(warranty_period)
+    return {
+        'maintenance_interval_months': interval,
+        'warranty_months': warranty,
+        'next_maintenance_due': next_due(installed, interval, today) if installed and interval else None,
+        'warranty_expires': add_months(installed, warranty) if installed and warranty else None,
+    }
+
+
+def backfill_schedules(apps, schema_editor):
+    """解析現有設備的維修保養周期與保固時程，計算下次保養日期與保固到期日"""
+    Devices = apps.get_model('devices', 'Devices')
+    quote = schema_editor.connection.ops.quote_name
+    sql = 'UPDATE %s SET %s WHERE %s = %%s' % (
+        quote(Devices._meta.db_table),
+        ', '.join('%s = %%s' % quote(field) for field in SCHEDULE_FIELDS),
+        quote('id'),
+    )
+    today = datetime.date.today()
+    rows = Devices.objects.order_by('id').values_list('id', *SOURCE_FIELDS)
+    pending = []
+    with schema_editor.connection.cursor() as cursor:
+        for device_id, *sources in rows.iterator(chunk_size=2000):
+            computed = schedule_fields(*sources, today=today)
+            if not any(computed.values()):
+                continue
+            pending.append((*(computed[field] for field in SCHEDULE_FIELDS), device_id))
+            if len(pending) >= 2000:
+                cursor.executemany(sql, pending)
+                pending = []
+        if pending:
+            cursor.executemany(sql, pending)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0008_inventorystat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devices',
+            name='maintenance_interval_months',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='devices',
+            name='warranty_months',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='devices',
+            name='next_maintenance_due',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='devices',
+            name='warranty_expires',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_schedules, migrations.RunPython.noop),
+        # 填入資料後再建立索引
+        migrations.AlterField(
+            model_name='devices',
+            name='next_maintenance_due',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='devices',
+            name='warranty_expires',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
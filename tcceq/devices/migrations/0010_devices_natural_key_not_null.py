@@ -0,0 +1,73 @@
+import hashlib
+
+from django.db import migrations, models
+
+# devices.keys.natural_key 在此 migration 建立時的內容 (廠牌與規格都是空值的設備也有自然鍵)
+_SEPARATOR = '\x1f'
+
+
+def _normalize(value):
+    return '' if value is None else str(value)
+
+
+def natural_key(equipment_type_id, brand, specification):
+    values = [_normalize(equipment_type_id), _normalize(brand), _normalize(specification)]
+    return hashlib.sha1(_SEPARATOR.join(values).encode('utf-8')).hexdigest()
+
+
+def fill_natural_keys(apps, schema_editor):
+    """為沒有自然鍵的設備產生自然鍵
+
+    之前的版本中，與其他設備重複 (相同設備種類、廠牌及規格) 的設備沒有自然鍵。
+    這些設備併入已有該自然鍵 (或最早建立) 的設備：保留該設備，刪除重複的資料。
+    統計數字由 refresh_stats 指令重新計算。
+    """
+    Devices = apps.get_model('devices', 'Devices')
+    quote = schema_editor.connection.ops.quote_name
+    sql = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+        quote(Devices._meta.db_table), quote('natural_key'), quote('id'),
+    )
+    missing = {}
+    rows = Devices.objects.filter(natural_key__isnull=True).order_by('id')
+    for device_id, equipment_type_id, brand, specification in rows.values_list(
+        'id', 'equipment_type_id', 'brand', 'specification'
+    ).iterator(chunk_size=2000):
+        missing[device_id] = natural_key(equipment_type_id, brand, specification)
+    if not missing:
+        return
+
+    keys = sorted(set(missing.values()))
+    taken = set()
+    for start in range(0, len(keys), 1000):
+        taken.update(
+            Devices.objects.filter(natural_key__in=keys[start:start + 1000]).values_list('natural_key', flat=True)
+        )
+    pending = []
+    duplicates = []
+    for device_id, key in missing.items():
+        if key in taken:
+            duplicates.append(device_id)
+        else:
+            taken.add(key)
+            pending.append((key, device_id))
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, len(pending), 2000):
+            cursor.executemany(sql, pending[start:start + 2000])
+    for start in range(0, len(duplicates), 1000):
+        Devices.objects.filter(id__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0009_devices_schedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_natural_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='devices',
+            name='natural_key',
+            field=models.CharField(editable=False, max_length=40, unique=True),
+        ),
+    ]
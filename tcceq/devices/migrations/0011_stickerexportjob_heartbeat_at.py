@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0010_devices_natural_key_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stickerexportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0011_stickerexportjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderSlot',
+            fields=[
+                ('number', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('holder', models.CharField(blank=True, max_length=32)),
+                ('acquired_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': '貼紙產生名額',
+                'verbose_name_plural': '貼紙產生名額',
+            },
+        ),
+    ]
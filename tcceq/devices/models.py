@@ -1,4 +1,8 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, router
+
+from . import keys, schedule
+from .search import SEARCH_FIELDS, build_search_document
 
 class EquipmentCategory(models.Model):
     name = models.CharField(max_length=100)   # 設備大類名稱
@@ -11,10 +15,17 @@ class EquipmentCategory(models.Model):
         verbose_name = "設備大類"
         verbose_name_plural = "設備大類"
 
+class EquipmentTypeManager(models.Manager):
+    def get_queryset(self):
+        # __str__ 會顯示大類名稱，一併取出以免下拉選單每個選項各查詢一次
+        return super().get_queryset().select_related('category')
+
 class EquipmentType(models.Model):
     category = models.ForeignKey(EquipmentCategory, on_delete=models.CASCADE, related_name='equipment_types', blank=True, null=True)  # 所屬設備大類（可選）
     name = models.CharField(max_length=100)   # 設備種類名稱
     
+    objects = EquipmentTypeManager()
+    
     def __str__(self):
         if self.category:
             return f"{self.category.name} - {self.name}"
@@ -41,10 +52,145 @@ class Devices(models.Model):
     emergency_phone = models.CharField(max_length=20, blank=True, null=True)      # 緊急維修人員電話
     maintenance_name = models.CharField(max_length=50)     # 負責維修人員姓名
     maintenance_phone = models.CharField(max_length=20)    # 負責維修人員電話
+    search_document = models.TextField(blank=True, default='', editable=False)  # 搜尋用詞 (由 SEARCH_FIELDS 產生)
+    updated_at = models.DateTimeField(auto_now=True)                              # 最後更新時間
+    natural_key = models.CharField(max_length=40, unique=True, editable=False)  # 自然鍵 (種類、廠牌、規格的雜湊)
+    content_hash = models.CharField(max_length=40, blank=True, default='', editable=False)  # 匯入欄位的雜湊，用於增量匯入
+    maintenance_interval_months = models.PositiveSmallIntegerField(blank=True, null=True, editable=False)  # 維修保養周期 (月，由 maintenance_cycle 解析)
+    warranty_months = models.PositiveSmallIntegerField(blank=True, null=True, editable=False)  # 保固期限 (月，由 warranty_period 解析)
+    next_maintenance_due = models.DateField(blank=True, null=True, editable=False, db_index=True)  # 下次保養日期
+    warranty_expires = models.DateField(blank=True, null=True, editable=False, db_index=True)  # 保固到期日
     
     def __str__(self):
         return f"{self.equipment_type.name} - {self.brand} ({self.specification})"
     
+    def refresh_search_document(self):
+        """依搜尋欄位重新產生 search_document"""
+        self.search_document = build_search_document(*(getattr(self, field) for field in SEARCH_FIELDS))
+    
+    def refresh_keys(self):
+        """重新產生自然鍵與內容雜湊"""
+        self.natural_key = keys.natural_key(self.equipment_type_id, self.brand, self.specification)
+        self.content_hash = keys.content_hash(
+            self.equipment_type_id, {field: getattr(self, field) for field in keys.DEVICE_FIELDS}
+        )
+    
+    def refresh_schedule(self, today=None):
+        """由維修保養周期、保固時程與安裝日期重新計算排程欄位"""
+        fields = schedule.schedule_fields(self.date_installed, self.maintenance_cycle, self.warranty_period, today)
+        for field, value in fields.items():
+            setattr(self, field, value)
+    
+    def validate_natural_key(self, using=None):
+        """已有相同設備種類、廠牌及規格的其他設備時丟出 ValidationError"""
+        key = keys.natural_key(self.equipment_type_id, self.brand, self.specification)
+        devices = Devices.objects.using(using or router.db_for_write(Devices, instance=self))
+        if devices.filter(natural_key=key).exclude(pk=self.pk).exists():
+            raise ValidationError('已有相同設備種類、廠牌及規格的設備')
+    
+    def clean(self):
+        super().clean()
+        self.validate_natural_key()
+    
+    def save(self, *args, **kwargs):
+        self.refresh_search_document()
+        previous_key = self.natural_key
+        self.refresh_keys()
+        # 新增設備或自然鍵改變時先檢查重複，不以資料庫的 IntegrityError 結束
+        if self._state.adding or self.natural_key != previous_key:
+            self.validate_natural_key(kwargs.get('using'))
+        self.refresh_schedule()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra_fields = {'updated_at', 'content_hash'}
+            if set(SEARCH_FIELDS) & set(update_fields):
+                extra_fields.add('search_document')
+            if {'equipment_type', 'equipment_type_id', 'brand', 'specification'} & set(update_fields):
+                extra_fields.add('natural_key')
+            if set(schedule.SOURCE_FIELDS) & set(update_fields):
+                extra_fields.update(schedule.SCHEDULE_FIELDS)
+            kwargs['update_fields'] = {*update_fields, *extra_fields}
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = "設備"
-        verbose_name_plural = "設備"
\ No newline at end of file
+        verbose_name_plural = "設備"
+        # 搜尋用的 GIN 索引 devices_search_gin 只建立在 PostgreSQL 上，由 migrations/0005 管理，
+        # 不列在 indexes 中，以免 SQLite 重建資料表時嘗試建立
+
+class InventoryStat(models.Model):
+    """預先彙總的設備數量 (依設備種類、施工廠商、安裝年份)，由 devices.stats 維護"""
+    DIMENSION_TYPE = 'type'
+    DIMENSION_CONTRACTOR = 'contractor'
+    DIMENSION_YEAR = 'year'
+    DIMENSION_CHOICES = [
+        (DIMENSION_TYPE, '設備種類'),
+        (DIMENSION_CONTRACTOR, '施工廠商'),
+        (DIMENSION_YEAR, '安裝年份'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)  # 統計維度
+    key = models.CharField(max_length=100, blank=True)    # 設備種類 id、廠商名稱或年份，空字串代表未填
+    count = models.IntegerField(default=0)                # 設備數量
+    updated_at = models.DateTimeField(auto_now=True)      # 最後更新時間
+
+    def __str__(self):
+        return f"{self.get_dimension_display()} {self.key or '(未填)'}: {self.count}"
+
+    class Meta:
+        verbose_name = "設備統計"
+        verbose_name_plural = "設備統計"
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='inventory_stat_dimension_key'),
+        ]
+
+class StickerExportJob(models.Model):
+    """背景產生 QR code 貼紙 PDF 的工作"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '等待中'),
+        (STATUS_RUNNING, '產生中'),
+        (STATUS_DONE, '已完成'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)  # 工作狀態
+    device_ids = models.JSONField(blank=True, null=True)      # 選中的設備 id，空值代表所有設備
+    base_url = models.CharField(max_length=200)               # QR code 連結的網站網址
+    total = models.PositiveIntegerField(default=0)            # 總頁數
+    done = models.PositiveIntegerField(default=0)             # 已完成頁數
+    file = models.FileField(upload_to='sticker_exports/', blank=True)  # 產生的 PDF
+    error = models.TextField(blank=True)                      # 失敗原因
+    created_at = models.DateTimeField(auto_now_add=True)      # 建立時間
+    started_at = models.DateTimeField(blank=True, null=True)  # 開始時間
+    finished_at = models.DateTimeField(blank=True, null=True) # 完成時間
+    heartbeat_at = models.DateTimeField(blank=True, null=True) # 工作程序最後回報進度的時間
+
+    def __str__(self):
+        return f"貼紙匯出 #{self.id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "貼紙匯出工作"
+        verbose_name_plural = "貼紙匯出工作"
+        ordering = ['-created_at']
+
+class RenderSlot(models.Model):
+    """產生貼紙 PDF 的名額與排隊位置 (所有程序共用，由 devices.renderqueue 管理)
+
+    1 到 STICKER_RENDER_WORKERS 號為產生名額，之後的 STICKER_RENDER_QUEUE 個為排隊位置。
+    持有者中止時，租約到期後名額自動空出。
+    """
+    number = models.PositiveSmallIntegerField(primary_key=True)  # 名額編號
+    holder = models.CharField(max_length=32, blank=True)         # 持有的請求 (隨機產生)，空字串代表空出
+    acquired_at = models.DateTimeField(blank=True, null=True)    # 取得時間 (排隊時依此決定順序)
+    expires_at = models.DateTimeField(blank=True, null=True)     # 租約到期時間
+
+    def __str__(self):
+        return f"貼紙產生名額 #{self.number}"
+
+    class Meta:
+        verbose_name = "貼紙產生名額"
+        verbose_name_plural = "貼紙產生名額"
@@ -0,0 +1,80 @@
+"""設備頁面的版本化快取 (設備列表片段、設備詳細資料頁)
+
+快取鍵都包含一個資料版本號 (generation counter)。設備、設備種類或設備大類
+有任何變更時，signal 只需把版本號加一，舊版本的快取鍵不會再被使用，
+之後由快取後端自行淘汰，不需要逐一刪除 (適用任何 Django 快取後端)。
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+DATA_VERSION_KEY = 'devices:data_version'
+# 最後一次資料變更的時間 (Unix 時間)，讀取副本時用來判斷副本是否可能還沒同步
+DATA_CHANGED_AT_KEY = 'devices:data_changed_at'
+
+
+def _initial_version():
+    # 以目前時間作為初始版本，版本號被淘汰後重建時不會與舊的快取鍵重複
+    return int(time.time() * 1000)
+
+
+def get_data_version():
+    """目前的資料版本號"""
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY, _initial_version())
+    return version
+
+
+async def aget_data_version():
+    """get_data_version 的非同步版本"""
+    version = await cache.aget(DATA_VERSION_KEY)
+    if version is None:
+        await cache.aadd(DATA_VERSION_KEY, _initial_version(), timeout=None)
+        version = await cache.aget(DATA_VERSION_KEY, _initial_version())
+    return version
+
+
+def bump_data_version():
+    """資料變更後讓所有已快取的頁面失效"""
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        cache.set(DATA_VERSION_KEY, _initial_version(), timeout=None)
+    cache.set(DATA_CHANGED_AT_KEY, time.time(), timeout=None)
+
+
+def normalize_search(search_query):
+    """去除多餘空白，讓只差在空白的搜尋共用同一份快取"""
+    return ' '.join((search_query or '').split())
+
+
+def make_key(prefix, *parts, version=None):
+    """組合快取鍵，參數以雜湊表示以避免過長或含有特殊字元"""
+    if version is None:
+        version = get_data_version()
+    digest = hashlib.md5(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f'devices:{prefix}:{version}:{digest}'
+
+
+def get_or_render(key, render):
+    """取得快取的 HTML 片段，沒有時呼叫 render() 產生並存入快取"""
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, str(html), getattr(settings, 'DEVICE_PAGE_CACHE_TIMEOUT', 300))
+    return mark_safe(html)
+
+
+async def aget_or_render(key, render):
+    """get_or_render 的非同步版本，render 為回傳 HTML 的 coroutine function"""
+    html = await cache.aget(key)
+    if html is None:
+        html = await render()
+        await cache.aset(key, str(html), getattr(settings, 'DEVICE_PAGE_CACHE_TIMEOUT', 300))
+    return mark_safe(html)
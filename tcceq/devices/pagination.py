@@ -0,0 +1,149 @@
+"""游標 (keyset) 分頁
+
+以排序欄位的值作為游標，每頁以 WHERE (排序欄位) > (上一頁最後一筆) 取得，
+不需要 COUNT(*) 與 OFFSET，任何一頁的查詢成本都與第一頁相同。
+游標以 base64 編碼，對使用者而言是不透明的字串。
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    raw = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values, direction = data['v'], data['d']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+class CursorPage:
+    """一頁資料與前後頁的游標"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """依 ordering (例如 ('id',) 或 ('-rank', 'id')) 做游標分頁
+
+    ordering 的最後一個欄位必須是唯一值 (通常是 id)，以確保順序固定。
+    """
+
+    def __init__(self, queryset, per_page, ordering=('id',)):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [
+            (field[1:], True) if field.startswith('-') else (field, False)
+            for field in ordering
+        ]
+
+    def _boundary_filter(self, values, forward):
+        """排在 values 之後 (forward) 或之前的資料條件"""
+        condition = Q()
+        for i, ((field, descending), value) in enumerate(zip(self.ordering, values)):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{field}__{lookup}': value})
+            # 前面的排序欄位都相等時才比較這個欄位
+            for (previous_field, _), previous_value in zip(self.ordering[:i], values[:i]):
+                term &= Q(**{previous_field: previous_value})
+            condition |= term
+        return condition
+
+    def _order_by(self, forward):
+        return [
+            f'-{field}' if descending == forward else field
+            for field, descending in self.ordering
+        ]
+
+    def _cursor_values(self, obj):
+        values = [getattr(obj, field) for field, _ in self.ordering]
+        # 日期以 ISO 格式存入游標，查詢時由 DateField 轉回日期
+        return [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+
+    def _page_query(self, cursor):
+        """游標指向的查詢 (多取一筆以判斷是否還有下一頁或上一頁)，游標無效時回到第一頁"""
+        queryset = self.queryset
+        values, forward = None, True
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+                if len(values) != len(self.ordering):
+                    raise InvalidCursor(cursor)
+                forward = direction == 'n'
+                # 被竄改的游標值無法轉換成欄位的型別時，建立條件就會失敗
+                queryset = queryset.filter(self._boundary_filter(values, forward))
+            except (InvalidCursor, ValidationError, ValueError, TypeError):
+                queryset, values, forward = self.queryset, None, True
+        return queryset.order_by(*self._order_by(forward))[:self.per_page + 1], values, forward
+
+    def _build_page(self, rows, values, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if (has_more if forward else values is not None):
+                next_cursor = encode_cursor(self._cursor_values(rows[-1]), 'n')
+            if (values is not None if forward else has_more):
+                previous_cursor = encode_cursor(self._cursor_values(rows[0]), 'p')
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None):
+        """取得游標指向的一頁，游標無效時回到第一頁"""
+        queryset, values, forward = self._page_query(cursor)
+        return self._build_page(list(queryset), values, forward)
+
+    async def aget_page(self, cursor=None):
+        """get_page 的非同步版本 (以 async for 讀取資料)"""
+        queryset, values, forward = self._page_query(cursor)
+        return self._build_page([obj async for obj in queryset], values, forward)
+
+
+def estimate_count(queryset):
+    """以 PostgreSQL 查詢計畫估計筆數 (不執行 COUNT)，其他資料庫回傳 None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
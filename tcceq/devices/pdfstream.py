@@ -0,0 +1,223 @@
+"""逐頁輸出的貼紙 PDF 寫入器
+
+reportlab 的 canvas 會把所有頁面保留在記憶體中，直到 save() 才一次輸出。
+此寫入器每加入一頁就立即回傳該頁的 PDF 物件位元組，字型等共用資源
+延後到最後才寫出，因此可直接作為 StreamingHttpResponse 的內容來源，
+記憶體用量不隨頁數增加。
+"""
+import zlib
+from array import array
+
+from reportlab.lib.rl_accel import escapePDF, fp_str
+from reportlab.pdfbase import pdfdoc, pdfmetrics
+from reportlab.pdfbase.cidfonts import CIDFontInfo, UnicodeCIDFont, structToPDF
+from reportlab.pdfbase.ttfonts import FF_NONSYMBOLIC, FF_SYMBOLIC, SUBSETN, TTFont, makeToUnicodeCMap
+
+from .stickers import ALL_LAYOUT, FONT_SIZE, STICKER_HEIGHT, STICKER_WIDTH, get_fonts, text_width
+
+# 固定的物件編號：目錄、頁面樹、共用資源
+CATALOG_ID = 1
+PAGES_ID = 2
+RESOURCES_ID = 3
+FIRST_PAGE_ID = 4
+
+
+class _PDFFont:
+    """單一字型在 PDF 中的資源名稱與文字編碼方式"""
+
+    def __init__(self, writer, font, index):
+        self.writer = writer
+        self.font = font
+        self.index = index
+        self.dynamic = isinstance(font, TTFont)
+
+    def resource_name(self, subset=None):
+        if subset is None:
+            return 'F%d' % self.index
+        return 'F%d+%d' % (self.index, subset)
+
+    def show_text(self, text, size):
+        """回傳顯示文字的 Tf/Tj 指令"""
+        if self.dynamic:
+            ops = []
+            for subset, chunk in self.font.splitString(text, self.writer):
+                ops.append('/%s %s Tf (%s) Tj' % (self.resource_name(subset), fp_str(size), escapePDF(chunk)))
+            return ' '.join(ops)
+        if isinstance(self.font, UnicodeCIDFont):
+            encoded = self.font.formatForPdf(text)
+        else:
+            encoded = escapePDF(text.encode('cp1252', 'replace'))
+        return '/%s %s Tf (%s) Tj' % (self.resource_name(), fp_str(size), encoded)
+
+
+class StickerPDFWriter:
+    """逐頁產生貼紙 PDF 的寫入器
+
+    使用方式::
+
+        writer = StickerPDFWriter()
+        yield writer.begin()
+        for page in pages:
+            yield writer.add_page(page)
+        yield writer.finish()
+    """
+
+    def __init__(self, fonts=None, compress=True):
+        self.compress = compress
+        self._fonts = {}
+        chinese_font, chinese_font_bold = fonts or get_fonts()
+        self.chinese_font = self._get_font(chinese_font)
+        self.chinese_font_bold = self._get_font(chinese_font_bold)
+        self.offset = 0
+        self.page_count = 0
+        # 每個物件的檔案位置，依物件編號排列 (從 1 開始)
+        self.xref = array('Q')
+        self._format_doc = pdfdoc.PDFDocument()
+
+    def _get_font(self, name):
+        if name not in self._fonts:
+            self._fonts[name] = _PDFFont(self, pdfmetrics.getFont(name), len(self._fonts) + 1)
+        return self._fonts[name]
+
+    def _emit(self, obj_id, body):
+        """輸出一個間接物件，記錄其位置"""
+        while len(self.xref) < obj_id:
+            self.xref.append(0)
+        self.xref[obj_id - 1] = self.offset
+        data = b'%d 0 obj\n' % obj_id + body + b'\nendobj\n'
+        self.offset += len(data)
+        return data
+
+    def _emit_stream(self, obj_id, content, extra=b''):
+        if isinstance(content, str):
+            content = content.encode('latin-1')
+        if self.compress:
+            content = zlib.compress(content)
+            extra += b' /Filter /FlateDecode'
+        body = b'<< /Length %d%s >>\nstream\n' % (len(content), extra) + content + b'\nendstream'
+        return self._emit(obj_id, body)
+
+    def _next_id(self):
+        return len(self.xref) + 1
+
+    def begin(self):
+        """PDF 檔頭"""
+        data = b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n'
+        self.offset = len(data)
+        # 預留固定物件的編號
+        self.xref.extend([0] * (FIRST_PAGE_ID - 1))
+        return data
+
+    def _centred_text(self, font, x, y, text):
+        x -= text_width(text, font.font.fontName) / 2
+        return 'BT 1 0 0 1 %s Tm %s ET' % (fp_str(x, y), font.show_text(text, FONT_SIZE))
+
+    def add_page(self, page, layout=ALL_LAYOUT):
+        """加入一頁貼紙，回傳該頁的 PDF 物件"""
+        ops = [page.qr_ops, '0 0 0 rg']
+        ops.append(self._centred_text(self.chinese_font_bold, layout.center_x, layout.type_y, page.type_line))
+        ops.append(self._centred_text(self.chinese_font_bold, layout.center_x, layout.brand_y, page.brand_line))
+        for line, y in zip(page.spec_lines, layout.spec_ys):
+            ops.append(self._centred_text(self.chinese_font, layout.center_x, y, line))
+
+        content_id = self._next_id()
+        data = self._emit_stream(content_id, '\n'.join(ops))
+        page_body = (
+            b'<< /Type /Page /Parent %d 0 R /Resources %d 0 R /MediaBox [0 0 %s] /Contents %d 0 R >>'
+            % (PAGES_ID, RESOURCES_ID, fp_str(STICKER_WIDTH, STICKER_HEIGHT).encode('ascii'), content_id)
+        )
+        data += self._emit(content_id + 1, page_body)
+        self.page_count += 1
+        return data
+
+    def _font_objects(self, font):
+        """產生字型物件，回傳 (資源名稱與物件編號的對照, 物件位元組)"""
+        if not font.dynamic:
+            obj_id = self._next_id()
+            if isinstance(font.font, UnicodeCIDFont):
+                info = dict(CIDFontInfo[font.font.face.name])
+                info['Name'] = '/' + font.resource_name()
+                info['Encoding'] = '/' + font.font.encodingName
+                body = structToPDF(info).format(self._format_doc)
+            else:
+                body = (
+                    '<< /Type /Font /Subtype /Type1 /Name /%s /BaseFont /%s /Encoding /WinAnsiEncoding >>'
+                    % (font.resource_name(), font.font.face.name)
+                ).encode('ascii')
+            return [(font.resource_name(), obj_id)], self._emit(obj_id, body)
+
+        # TrueType 字型：依實際用到的字元輸出子集
+        face = font.font.face
+        state = font.font.state.pop(self, None)
+        if state is None:
+            return [], b''
+        names = []
+        data = b''
+        for n, subset in enumerate(state.subsets):
+            base_font = (b''.join((SUBSETN(n), b'+', face.name, face.subfontNameX))).decode('pdfdoc')
+            font_id, cmap_id, descriptor_id, file_id = (self._next_id() + i for i in range(4))
+
+            widths = ' '.join(str(w) for w in map(face.getCharWidth, subset))
+            data += self._emit(font_id, (
+                '<< /Type /Font /Subtype /TrueType /Name /%s /BaseFont /%s /FirstChar 0 /LastChar %d '
+                '/Widths [ %s ] /ToUnicode %d 0 R /FontDescriptor %d 0 R >>'
+                % (font.resource_name(n), base_font, len(subset) - 1, widths, cmap_id, descriptor_id)
+            ).encode('latin-1'))
+            data += self._emit_stream(cmap_id, makeToUnicodeCMap(base_font, subset))
+
+            flags = (face.flags & ~FF_NONSYMBOLIC) | FF_SYMBOLIC
+            data += self._emit(descriptor_id, (
+                '<< /Type /FontDescriptor /FontName /%s /Ascent %s /CapHeight %s /Descent %s /Flags %d '
+                '/FontBBox [ %s ] /ItalicAngle %s /StemV %s /MissingWidth %s /FontFile2 %d 0 R >>'
+                % (base_font, face.ascent, face.capHeight, face.descent, flags,
+                   ' '.join(str(v) for v in face.bbox), face.italicAngle, face.stemV,
+                   face.defaultWidth, file_id)
+            ).encode('latin-1'))
+            font_file = face.makeSubset(subset)
+            data += self._emit_stream(file_id, font_file, b' /Length1 %d' % len(font_file))
+            names.append((font.resource_name(n), font_id))
+        return names, data
+
+    def finish(self):
+        """輸出字型、頁面樹、目錄與交互參照表"""
+        data = b''
+        font_refs = []
+        for font in self._fonts.values():
+            names, font_data = self._font_objects(font)
+            font_refs.extend(names)
+            data += font_data
+
+        fonts = ' '.join('/%s %d 0 R' % (name, obj_id) for name, obj_id in font_refs)
+        data += self._emit(RESOURCES_ID, ('<< /ProcSet [/PDF /Text] /Font << %s >> >>' % fonts).encode('latin-1'))
+
+        # 每頁佔用兩個物件編號 (內容、頁面)，頁面物件編號可直接推算
+        kids = ' '.join('%d 0 R' % (FIRST_PAGE_ID + 2 * i + 1) for i in range(self.page_count))
+        data += self._emit(PAGES_ID, ('<< /Type /Pages /Count %d /Kids [ %s ] >>' % (self.page_count, kids)).encode('ascii'))
+        data += self._emit(CATALOG_ID, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_ID)
+
+        xref_offset = self.offset
+        lines = [b'xref', b'0 %d' % (len(self.xref) + 1), b'0000000000 65535 f ']
+        lines.extend(b'%010d 00000 n ' % offset for offset in self.xref)
+        lines.append(b'trailer')
+        lines.append(b'<< /Size %d /Root %d 0 R >>' % (len(self.xref) + 1, CATALOG_ID))
+        lines.append(b'startxref')
+        lines.append(b'%d' % xref_offset)
+        lines.append(b'%%EOF\n')
+        return data + b'\n'.join(lines)
+
+
+def iter_sticker_pdf(pages, layout=ALL_LAYOUT, buffer_size=64 * 1024):
+    """將貼紙頁面逐頁轉成 PDF 位元組，累積到 buffer_size 才輸出一次"""
+    writer = StickerPDFWriter()
+    buffer = [writer.begin()]
+    buffered = len(buffer[0])
+    for page in pages:
+        data = writer.add_page(page, layout)
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    buffer.append(writer.finish())
+    yield b''.join(buffer)
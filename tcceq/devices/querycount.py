@@ -0,0 +1,92 @@
+"""SQL 查詢次數與耗時統計
+
+QueryCounter 以 connection.execute_wrapper 攔截所有資料庫連線的查詢，
+可在測試中當作 context manager 使用，也供 QueryBudgetMiddleware 統計每個請求。
+
+非同步請求的查詢由 asgiref 的共用執行緒執行，同時處理中的請求共用同一個連線物件，
+因此改用 async with：計數器記在 context variable 中，由事先裝在連線上的
+dispatch_query 依目前的 context 把查詢交給對應的計數器。
+"""
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_current_counter = ContextVar('devices_query_counter', default=None)
+
+
+def dispatch_query(execute, sql, params, many, context):
+    """把查詢交給目前 context 的 QueryCounter (沒有時直接執行)"""
+    counter = _current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_dispatch(connection=None):
+    """在目前執行緒的資料庫連線上裝上 dispatch_query (重複呼叫不會重複安裝)"""
+    for conn in [connection] if connection is not None else connections.all():
+        if dispatch_query not in conn.execute_wrappers:
+            conn.execute_wrappers.insert(0, dispatch_query)
+
+
+@receiver(connection_created)
+def _install_on_connect(sender, connection, **kwargs):
+    # 新的執行緒第一次連線時自動安裝
+    install_dispatch(connection)
+
+
+class QueryCounter:
+    """統計區塊內執行的 SQL 查詢次數與總耗時
+
+    使用方式::
+
+        with QueryCounter() as counter:
+            client.get(url)
+        print(counter.count, counter.duration)
+
+        async with QueryCounter() as counter:
+            await view(request)
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+        self._token = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """總耗時 (秒)"""
+        return sum(duration for _, duration in self.queries)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
+
+    async def __aenter__(self):
+        self._token = _current_counter.set(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        _current_counter.reset(self._token)
+        self._token = None
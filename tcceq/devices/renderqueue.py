@@ -0,0 +1,338 @@
+"""貼紙 PDF 的產生佇列
+
+貼紙 PDF 由 reportlab 產生，相當耗用 CPU。同時有多個「下載全部貼紙」請求時，
+會佔滿所有 worker，掃描 QR code 開啟的設備詳細資料頁也跟著變慢。
+
+RenderQueue 限制同時產生 PDF 的請求數 (STICKER_RENDER_WORKERS)，其餘請求依先後順序排隊，
+最多 STICKER_RENDER_QUEUE 個、最久等待 STICKER_RENDER_QUEUE_TIMEOUT 秒。
+佇列已滿或等待逾時時回傳 503 與 Retry-After (依最近的產生時間估計)，不再繼續堆積工作。
+
+名額與排隊位置記錄在資料庫的 RenderSlot，以條件式 UPDATE 取得，因此上限由所有程序共用：
+gunicorn 的多個 sync worker (以及使用同一個資料庫的其他主機) 合計最多同時產生
+STICKER_RENDER_WORKERS 個 PDF。每個名額有 STICKER_RENDER_LEASE_SECONDS 秒的租約，
+產生期間由背景執行緒定期延長；程序中止時租約到期，名額自動空出。
+排隊中的請求每隔 POLL_INTERVAL 秒檢查一次是否輪到自己。
+
+串流輸出的 PDF 在最後一個位元組送出 (或連線中斷) 後才釋放名額。
+目前的佇列長度與等待時間由 render_queue_status 檢視以 JSON 提供
+(執行中與排隊數為所有程序合計，其餘統計為本程序)。
+"""
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import RenderSlot
+from .utils import percentile
+
+# 統計等待與產生時間時保留的最近筆數
+RECENT_SIZE = 200
+# 還沒有產生紀錄時，估計每個 PDF 需要的秒數
+DEFAULT_RENDER_SECONDS = 5
+# 排隊中的請求每隔幾秒檢查一次是否有空出的名額
+POLL_INTERVAL = 0.2
+
+
+class RenderQueueFull(Exception):
+    """佇列已滿或等待逾時"""
+
+    def __init__(self, position, retry_after):
+        super().__init__(f'貼紙產生佇列已滿 (排在第 {position} 位)')
+        self.position = position
+        self.retry_after = retry_after
+
+
+def _slots():
+    # 名額一律在主資料庫 (不經過 ReplicaRouter，也不會讓使用者改讀主資料庫)
+    return RenderSlot.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _free(number, holder):
+    """空出名額 (只在仍由 holder 持有時)"""
+    _slots().filter(number=number, holder=holder).update(holder='', acquired_at=None, expires_at=None)
+
+
+class _LeaseKeeper(threading.Thread):
+    """定期延長名額的租約，直到 stop() 為止"""
+
+    def __init__(self, lease):
+        super().__init__(name=f'render-lease-{lease.number}', daemon=True)
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        renewed = False
+        try:
+            while not self.stopped.wait(self.lease.duration / 3):
+                renewed = True
+                _slots().filter(number=self.lease.number, holder=self.lease.holder).update(
+                    expires_at=timezone.now() + timedelta(seconds=self.lease.duration)
+                )
+        finally:
+            if renewed:
+                connections[DEFAULT_DB_ALIAS].close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class RenderLease:
+    """取得的產生名額，wait 為排隊等待的秒數"""
+
+    def __init__(self, number, holder, duration, wait):
+        self.number = number
+        self.holder = holder
+        self.duration = duration
+        self.wait = wait
+        self._keeper = _LeaseKeeper(self)
+        self._keeper.start()
+
+    def release(self):
+        self._keeper.stop()
+        _free(self.number, self.holder)
+
+
+class RenderQueue:
+    """限制同時產生貼紙 PDF 的請求數，其餘請求依先後順序等待
+
+    上限每次都從設定讀取，可在執行中 (或測試中) 調整。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=RECENT_SIZE)
+        self._durations = deque(maxlen=RECENT_SIZE)
+
+    @property
+    def workers(self):
+        return max(getattr(settings, 'STICKER_RENDER_WORKERS', 2), 1)
+
+    @property
+    def queue_depth(self):
+        return getattr(settings, 'STICKER_RENDER_QUEUE', 4)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'STICKER_RENDER_QUEUE_TIMEOUT', 30)
+
+    @property
+    def lease_seconds(self):
+        return getattr(settings, 'STICKER_RENDER_LEASE_SECONDS', 60)
+
+    def retry_after(self, position):
+        """依最近的產生時間估計排在第 position 位的請求要等幾秒"""
+        if self._durations:
+            average = sum(self._durations) / len(self._durations)
+        else:
+            average = DEFAULT_RENDER_SECONDS
+        return max(1, math.ceil(average * position / self.workers))
+
+    def _reject(self, position):
+        with self._lock:
+            self.rejected += 1
+        raise RenderQueueFull(position, self.retry_after(position))
+
+    def _snapshot(self):
+        """各名額的取得時間 (空出或租約已到期為 None)，並建立還沒有的 RenderSlot"""
+        total = self.workers + self.queue_depth
+        rows = _slots().filter(number__lte=total).values_list('number', 'holder', 'acquired_at', 'expires_at')
+        rows = list(rows)
+        if len(rows) < total:
+            _slots().bulk_create([RenderSlot(number=number) for number in range(1, total + 1)], ignore_conflicts=True)
+            rows = [(number, '', None, None) for number in range(1, total + 1)]
+        now = timezone.now()
+        return {
+            number: acquired_at if holder and expires_at >= now else None
+            for number, holder, acquired_at, expires_at in rows
+        }
+
+    def _claim(self, numbers, snapshot, holder, duration):
+        """取得 numbers 中一個空出 (或租約已到期) 的名額，回傳 (編號, 取得時間)；都已被取得時回傳 None"""
+        now = timezone.now()
+        for number in numbers:
+            if snapshot[number] is not None:
+                continue
+            # 條件式 UPDATE：其他程序同時取得同一個名額時只有一個會成功
+            claimed = _slots().filter(Q(holder='') | Q(expires_at__lt=now), number=number).update(
+                holder=holder, acquired_at=now, expires_at=now + timedelta(seconds=duration),
+            )
+            if claimed:
+                return number, now
+        return None
+
+    def acquire(self):
+        """取得產生 PDF 的名額 (RenderLease)；佇列已滿或等待逾時時丟出 RenderQueueFull"""
+        started = time.perf_counter()
+        holder = uuid.uuid4().hex
+        workers, lease_seconds = self.workers, self.lease_seconds
+        render_numbers = range(1, workers + 1)
+        queue_numbers = range(workers + 1, workers + self.queue_depth + 1)
+
+        slot = None
+        snapshot = self._snapshot()
+        # 有請求在排隊時不插隊
+        if all(snapshot[number] is None for number in queue_numbers):
+            slot = self._claim(render_numbers, snapshot, holder, lease_seconds)
+        if slot is None:
+            # 排隊位置的租約涵蓋整個等待時間
+            place = self._claim(queue_numbers, snapshot, holder, self.timeout + lease_seconds)
+            if place is None:
+                self._reject(self.queue_depth + 1)
+            number, queued_at = place
+            deadline = started + self.timeout
+            try:
+                while True:
+                    snapshot = self._snapshot()
+                    ahead = sum(
+                        1 for place in queue_numbers
+                        if snapshot[place] is not None and snapshot[place] < queued_at
+                    )
+                    # 排在最前面時才取得名額
+                    if not ahead:
+                        slot = self._claim(render_numbers, snapshot, holder, lease_seconds)
+                        if slot is not None:
+                            break
+                    if time.perf_counter() >= deadline:
+                        self._reject(ahead + 1)
+                    time.sleep(POLL_INTERVAL)
+            finally:
+                _free(number, holder)
+
+        wait = time.perf_counter() - started
+        with self._lock:
+            self.admitted += 1
+            self._waits.append(wait)
+        return RenderLease(slot[0], holder, lease_seconds, wait)
+
+    def release(self, lease, duration=None):
+        """釋放名額，duration 為產生 PDF 的秒數 (用於估計 Retry-After)"""
+        lease.release()
+        if duration is not None:
+            with self._lock:
+                self._durations.append(duration)
+
+    def stats(self):
+        """佇列狀態 (所有程序合計) 與本程序最近的等待、產生時間 (毫秒)"""
+        held = [number for number, acquired_at in self._snapshot().items() if acquired_at is not None]
+        stats = {
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'running': sum(1 for number in held if number <= self.workers),
+            'queued': sum(1 for number in held if number > self.workers),
+        }
+        with self._lock:
+            stats.update(admitted=self.admitted, rejected=self.rejected)
+            waits = sorted(self._waits)
+            durations = sorted(self._durations)
+        for name, values in (('wait_ms', waits), ('render_ms', durations)):
+            stats[name] = {
+                'p50': round(percentile(values, 50) * 1000, 1) if values else None,
+                'p95': round(percentile(values, 95) * 1000, 1) if values else None,
+                'max': round(values[-1] * 1000, 1) if values else None,
+            }
+        return stats
+
+
+class _SlotReleasingIterator:
+    """串流內容讀完或回應關閉時釋放名額 (未開始讀取就關閉也會釋放)"""
+
+    def __init__(self, queue, lease, iterable, started):
+        self.queue = queue
+        self.lease = lease
+        self.iterator = iter(iterable)
+        self.started = started
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self.queue.release(self.lease, time.perf_counter() - self.started)
+
+
+render_queue = RenderQueue()
+
+
+def queue_full_response(error):
+    response = HttpResponse(
+        f"貼紙產生工作已滿 (排在第 {error.position} 位)，請於 {error.retry_after} 秒後再試", status=503
+    )
+    response['Retry-After'] = str(error.retry_after)
+    response['X-Render-Queue-Position'] = str(error.position)
+    return response
+
+
+def hold_slot(response, lease, started):
+    """串流回應讀完後才釋放名額，其他回應立即釋放"""
+    if response.streaming:
+        response.streaming_content = _SlotReleasingIterator(render_queue, lease, response.streaming_content, started)
+    else:
+        render_queue.release(lease, time.perf_counter() - started)
+    response['X-Render-Wait'] = f'{lease.wait * 1000:.1f}ms'
+    return response
+
+
+def _acquire_in_thread():
+    """在 asgiref 的共用同步執行緒之外排隊，結束後關閉該執行緒的資料庫連線"""
+    try:
+        return render_queue.acquire()
+    finally:
+        close_old_connections()
+
+
+def limit_render_concurrency(view):
+    """產生貼紙 PDF 的檢視先向 render_queue 取得名額，佇列已滿時回傳 503
+
+    非同步檢視 (ASGI) 在另一個執行緒中排隊等待，不會佔用 asgiref 的共用同步執行緒
+    (其他同步檢視與非同步 ORM 查詢都在那裡執行)。
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                lease = await sync_to_async(_acquire_in_thread, thread_sensitive=False)()
+            except RenderQueueFull as e:
+                return queue_full_response(e)
+            started = time.perf_counter()
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                await sync_to_async(render_queue.release)(lease)
+                raise
+            return await sync_to_async(hold_slot)(response, lease, started)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                lease = render_queue.acquire()
+            except RenderQueueFull as e:
+                return queue_full_response(e)
+            started = time.perf_counter()
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                render_queue.release(lease)
+                raise
+            return hold_slot(response, lease, started)
+    return wrapper
@@ -0,0 +1,200 @@
+"""唯讀副本 (read replica) 的資料庫路由
+
+settings.DATABASE_REPLICAS 列出副本的資料庫別名 (由環境變數 DATABASE_REPLICA_URLS 設定)。
+只有以 read_from_replica 標記的檢視 (設備列表、詳細資料頁、貼紙與匯出) 的讀取查詢
+會送到副本，其餘查詢與所有寫入都使用主資料庫 (default)。
+
+- 每個請求開始時由 ReplicaRoutingMiddleware 建立路由狀態，同一個請求 (包含串流回應)
+  固定使用同一個副本，請求結束 (request_finished) 時清除。
+- 請求中有寫入 (例如在 admin 修改設備) 時，回應會設定 cookie，該使用者在
+  DEVICE_REPLICA_STICKY_SECONDS 秒內都從主資料庫讀取 (read-your-writes)。
+  session、登入時間等不影響設備資料的寫入 (BOOKKEEPING_APPS) 不算在內。
+- 設備資料變更後的 DEVICE_REPLICA_STICKY_SECONDS 秒內，所有請求都從主資料庫讀取，
+  避免把副本上尚未同步的舊資料存入頁面快取。
+- 副本無法連線時改用主資料庫，並在 DEVICE_REPLICA_RETRY_SECONDS 秒內不再嘗試該副本。
+  檢視執行途中副本的查詢失敗 (OperationalError，例如副本中斷或查詢因複寫衝突被取消) 時，
+  改用主資料庫重新執行該檢視 (檢視只讀取資料，可以安全地重新執行)。串流回應開始輸出後
+  的查詢無法重試。
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections
+from django.dispatch import receiver
+from django.utils.connection import ConnectionDoesNotExist
+
+from .pagecache import DATA_CHANGED_AT_KEY
+
+logger = logging.getLogger(__name__)
+
+# 最近有寫入的使用者改讀主資料庫到此時間 (Unix 時間)
+STICKY_COOKIE = 'devices_primary_until'
+# 這些 app 的寫入 (session、登入時間、權限與 admin 紀錄) 不影響設備資料，不讓使用者改讀主資料庫
+BOOKKEEPING_APPS = frozenset({'sessions', 'auth', 'contenttypes', 'admin'})
+
+_state = ContextVar('devices_db_routing', default=None)
+_down_until = {}
+_down_lock = threading.Lock()
+
+
+class RoutingState:
+    """一個請求的路由狀態"""
+
+    __slots__ = ('sticky', 'replica', 'wrote')
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky
+        self.replica = None
+        self.wrote = False
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def sticky_seconds():
+    return getattr(settings, 'DEVICE_REPLICA_STICKY_SECONDS', 10)
+
+
+def available_replicas():
+    """目前沒有被標記為無法連線的副本"""
+    now = time.monotonic()
+    with _down_lock:
+        return [alias for alias in replica_aliases() if _down_until.get(alias, 0) <= now]
+
+
+def mark_down(alias, error):
+    retry = getattr(settings, 'DEVICE_REPLICA_RETRY_SECONDS', 30)
+    logger.warning('唯讀副本 %s 無法連線，%d 秒內改用主資料庫：%s', alias, retry, error)
+    with _down_lock:
+        _down_until[alias] = time.monotonic() + retry
+
+
+def choose_replica():
+    """隨機選擇一個可以連線的副本，沒有副本、資料剛變更或都無法連線時回傳 None (使用主資料庫)"""
+    replicas = available_replicas()
+    if not replicas:
+        return None
+    changed_at = cache.get(DATA_CHANGED_AT_KEY)
+    if changed_at is not None and time.time() - changed_at < sticky_seconds():
+        return None
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+        except (DatabaseError, ConnectionDoesNotExist) as e:
+            mark_down(alias, e)
+            continue
+        return alias
+    return None
+
+
+def begin_request(request):
+    """建立請求的路由狀態，最近有寫入的使用者固定讀取主資料庫"""
+    try:
+        sticky = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        sticky = False
+    state = RoutingState(sticky)
+    _state.set(state)
+    return state
+
+
+def finish_response(state, response):
+    """請求中有寫入時設定 read-your-writes cookie"""
+    if state.wrote:
+        seconds = sticky_seconds()
+        response.set_cookie(
+            STICKY_COOKIE, str(int(time.time() + seconds)), max_age=seconds, httponly=True, samesite='Lax',
+        )
+    if settings.DEBUG and state.replica:
+        response['X-DB-Replica'] = state.replica
+    return response
+
+
+@receiver(request_finished)
+def _end_request(sender, **kwargs):
+    # 串流回應讀完後才會結束請求，在此之前的查詢仍使用同一個副本
+    state = _state.get()
+    if state is not None:
+        state.replica = None
+
+
+def _use_replica(state):
+    return state is not None and not state.sticky and not state.wrote
+
+
+def _fall_back_to_primary(state, error):
+    """使用副本時發生錯誤，標記該副本無法連線並改用主資料庫，回傳是否應重新執行"""
+    if state is None or state.replica is None:
+        return False
+    mark_down(state.replica, error)
+    state.replica = None
+    return True
+
+
+def read_from_replica(view):
+    """標記只讀取資料的檢視：查詢 (包含串流回應中的查詢) 送到唯讀副本"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state = _state.get()
+            if _use_replica(state) and replica_aliases():
+                state.replica = await sync_to_async(choose_replica)()
+            try:
+                return await view(request, *args, **kwargs)
+            except OperationalError as e:
+                if not _fall_back_to_primary(state, e):
+                    raise
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _state.get()
+            if _use_replica(state) and replica_aliases():
+                state.replica = choose_replica()
+            try:
+                return view(request, *args, **kwargs)
+            except OperationalError as e:
+                if not _fall_back_to_primary(state, e):
+                    raise
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """read_from_replica 檢視的讀取使用副本，其餘讀取與寫入使用主資料庫"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in BOOKKEEPING_APPS:
+            # 寫入後同一個請求的讀取也改用主資料庫
+            state.wrote = True
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的資料表由主資料庫複製而來
+        if db in replica_aliases():
+            return False
+        return None
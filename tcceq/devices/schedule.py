@@ -0,0 +1,226 @@
+"""維修保養周期與保固時程的解析
+
+maintenance_cycle 與 warranty_period 是自由輸入的文字 (每月、每季、半年、一年、3年保固、
+保固18個月…)，parse_months 把它們轉成月數，存在設備的 maintenance_interval_months 與
+warranty_months 欄位，並由安裝日期算出有索引的 next_maintenance_due 與 warranty_expires，
+「本月需保養」、「本季保固到期」等篩選就是日期欄位的範圍查詢。
+
+下次保養日會隨時間過去，由 refresh_schedules 指令 (每天排程執行) 把已過去的日期
+往後推到下一個周期。migration 0009 使用的是這些函式固定的複本。
+"""
+import calendar
+import datetime
+import re
+import unicodedata
+
+from django.utils import timezone
+
+# 排程欄位依據的設備欄位
+SOURCE_FIELDS = ('date_installed', 'maintenance_cycle', 'warranty_period')
+# 由 schedule_fields 計算的設備欄位
+SCHEDULE_FIELDS = ('maintenance_interval_months', 'warranty_months', 'next_maintenance_due', 'warranty_expires')
+
+# 每個單位的月數
+UNIT_MONTHS = {'年': 12, '季': 3, '個月': 1, '月': 1}
+
+CHINESE_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '兩': 2, '两': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+}
+
+_NUMBER = r'[0-9]+|[零〇一二兩两三四五六七八九十]+'
+# 例如 每月、每季、半年、兩年半、18個月、保固3年
+_PERIOD = re.compile(r'(?P<number>%s|半)?(?P<unit>年|季|個月|月)(?P<half>半)?' % _NUMBER)
+# 例如 每年2次、一年兩次
+_TIMES = re.compile(r'(?P<number>%s)次' % _NUMBER)
+
+# 超過這個月數視為無法解析 (例如誤填的日期 2025年)
+MAX_MONTHS = 1200
+
+# 設備列表與匯出的到期篩選：(參數值, 說明)
+DUE_WINDOWS = (
+    ('past', '已到期'),
+    ('month', '本月'),
+    ('next_month', '下個月'),
+    ('quarter', '本季'),
+    ('year', '今年'),
+)
+
+# 可篩選的日期欄位：(查詢參數, 欄位, 說明)
+DUE_FILTERS = (
+    ('maintenance_due', 'next_maintenance_due', '下次保養'),
+    ('warranty_expires', 'warranty_expires', '保固到期'),
+)
+
+
+def parse_number(text):
+    """阿拉伯數字或中文數字 (到九十九)，無法解析時回傳 None"""
+    if text.isdigit():
+        return int(text)
+    try:
+        if '十' in text:
+            tens, _, ones = text.partition('十')
+            return (CHINESE_DIGITS[tens] if tens else 1) * 10 + (CHINESE_DIGITS[ones] if ones else 0)
+        value = 0
+        for character in text:
+            value = value * 10 + CHINESE_DIGITS[character]
+        return value
+    except KeyError:
+        return None
+
+
+def parse_months(text):
+    """把周期或期限的文字轉成月數，無法解析時回傳 None"""
+    if not text:
+        return None
+    # 全形數字轉成半形並去除空白
+    text = ''.join(unicodedata.normalize('NFKC', text).split())
+    match = _PERIOD.search(text)
+    if match is None:
+        return None
+    unit_months = UNIT_MONTHS[match['unit']]
+    number = match['number']
+    if number == '半':
+        if unit_months % 2:
+            return None
+        months = unit_months // 2
+    else:
+        count = parse_number(number) if number else 1
+        if count is None:
+            return None
+        months = count * unit_months
+    if match['half']:
+        months += unit_months // 2
+    # 每年2次：周期為 6 個月
+    times = _TIMES.search(text, match.end())
+    if times:
+        count = parse_number(times['number'])
+        if not count or months % count:
+            return None
+        months //= count
+    if not 0 < months <= MAX_MONTHS:
+        return None
+    return months
+
+
+def as_date(value):
+    """日期或 YYYY-MM-DD 字串 (尚未轉換的匯入資料)，無法轉換時回傳 None"""
+    if not value:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def add_months(day, months):
+    """day 之後 months 個月的同一天，該月沒有這一天時為月底"""
+    index = day.month - 1 + months
+    year = day.year + index // 12
+    month = index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def next_due(start, interval_months, today):
+    """從 start 起每 interval_months 個月一次，today 當天或之後的第一次"""
+    elapsed = (today.year - start.year) * 12 + today.month - start.month
+    # 每次都從 start 計算，月底的日期不會逐次往前移
+    count = max(elapsed // interval_months, 1)
+    due = add_months(start, count * interval_months)
+    while due < today:
+        count += 1
+        due = add_months(start, count * interval_months)
+    return due
+
+
+def schedule_fields(date_installed, maintenance_cycle, warranty_period, today=None):
+    """設備的結構化排程欄位 (dict)，沒有安裝日期或無法解析的項目為 None"""
+    today = today or timezone.localdate()
+    installed = as_date(date_installed)
+    interval = parse_months(maintenance_cycle)
+    warranty = parse_months(warranty_period)
+    return {
+        'maintenance_interval_months': interval,
+        'warranty_months': warranty,
+        'next_maintenance_due': next_due(installed, interval, today) if installed and interval else None,
+        'warranty_expires': add_months(installed, warranty) if installed and warranty else None,
+    }
+
+
+def window_range(window, today=None):
+    """到期篩選的日期範圍 (開始, 結束)，開始日包含在內、結束日不包含，開始為 None 表示不限"""
+    today = today or timezone.localdate()
+    month_start = today.replace(day=1)
+    if window == 'past':
+        return None, today
+    if window == 'month':
+        return month_start, add_months(month_start, 1)
+    if window == 'next_month':
+        return add_months(month_start, 1), add_months(month_start, 2)
+    if window == 'quarter':
+        quarter_start = month_start.replace(month=(today.month - 1) // 3 * 3 + 1)
+        return quarter_start, add_months(quarter_start, 3)
+    if window == 'year':
+        return today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)
+    raise ValueError(f'不支援的到期篩選: {window}')
+
+
+def due_filters(params):
+    """從查詢參數 (dict) 取出有效的到期篩選 {參數: 範圍名稱}，無效的值忽略"""
+    windows = {window for window, _ in DUE_WINDOWS}
+    return {name: params[name] for name, _, _ in DUE_FILTERS if params.get(name) in windows}
+
+
+def due_order_field(filters):
+    """有到期篩選時列表的排序欄位 (第一個篩選的日期欄位)"""
+    return next(field for name, field, _ in DUE_FILTERS if name in filters)
+
+
+def due_lookups(filters, today=None):
+    """到期篩選轉成 QuerySet.filter 的條件 (日期欄位的範圍查詢，可使用索引)"""
+    fields = {name: field for name, field, _ in DUE_FILTERS}
+    lookups = {}
+    for name, window in filters.items():
+        start, end = window_range(window, today)
+        if start is not None:
+            lookups[f'{fields[name]}__gte'] = start
+        lookups[f'{fields[name]}__lt'] = end
+    return lookups
+
+
+def update_schedules(devices, connection, today=None, batch_size=2000):
+    """重新計算 devices (設備的 QuerySet) 的排程欄位
+
+    只寫入有變更的設備，以 executemany 執行 UPDATE，回傳寫入的筆數。
+    詳細資料頁會顯示排程日期，寫入時一併更新 updated_at，
+    頁面的 Last-Modified 與 ETag 才會跟著改變。
+    """
+    quote = connection.ops.quote_name
+    sql = 'UPDATE %s SET %s, %s = %%s WHERE %s = %%s' % (
+        quote(devices.model._meta.db_table),
+        ', '.join('%s = %%s' % quote(field) for field in SCHEDULE_FIELDS),
+        quote('updated_at'),
+        quote('id'),
+    )
+    updated_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = devices.order_by('id').values_list('id', *SOURCE_FIELDS, *SCHEDULE_FIELDS)
+    changed = 0
+    pending = []
+    with connection.cursor() as cursor:
+        for device_id, *values in rows.iterator(chunk_size=batch_size):
+            sources, current = values[:len(SOURCE_FIELDS)], tuple(values[len(SOURCE_FIELDS):])
+            computed = schedule_fields(*sources, today=today)
+            fields = tuple(computed[field] for field in SCHEDULE_FIELDS)
+            if fields == current:
+                continue
+            pending.append((*fields, updated_at, device_id))
+            if len(pending) >= batch_size:
+                cursor.executemany(sql, pending)
+                changed += len(pending)
+                pending = []
+        if pending:
+            cursor.executemany(sql, pending)
+            changed += len(pending)
+    return changed
@@ -0,0 +1,114 @@
+"""設備搜尋
+
+PostgreSQL 的全文檢索分詞器會把一整段中文視為一個詞 (在 C locale 下甚至會忽略中文)，
+無法搜尋其中的片段。因此先在 Python 端把廠牌、規格、施工廠商切成詞段
+(連續的中文或英數字)，並把每個詞段的所有後綴存進 search_document 欄位。
+
+資料庫端以 array_to_tsvector 直接把這些詞轉成 tsvector (不經過分詞器，與 locale 無關)，
+並建立 GIN 索引。查詢時每個關鍵字以前綴比對 ('關鍵字':*)，等同於在原文中做子字串搜尋，
+但可以使用索引並依相關度排序。
+
+其他資料庫 (例如開發用的 SQLite) 仍使用 icontains 搜尋。
+"""
+import re
+
+from django.contrib.postgres.search import SearchQueryField, SearchRank, SearchVectorField
+from django.db import connections, models
+from django.db.models.functions import Cast
+
+from .schedule import due_lookups
+
+# 每個後綴詞最多保留的字數，避免過長的詞段產生大量資料
+MAX_TERM_LENGTH = 32
+# 搜尋的欄位
+SEARCH_FIELDS = ('brand', 'specification', 'contractor_name')
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def split_terms(text):
+    """把文字切成小寫的詞段"""
+    if not text:
+        return []
+    return _TERM_RE.findall(text.lower().replace('_', ' '))
+
+
+def build_search_document(*values):
+    """產生 search_document 欄位內容：每個詞段的所有後綴，以空白分隔"""
+    tokens = []
+    seen = set()
+    for value in values:
+        for term in split_terms(value):
+            for start in range(len(term)):
+                token = term[start:start + MAX_TERM_LENGTH]
+                if token not in seen:
+                    seen.add(token)
+                    tokens.append(token)
+    return ' '.join(tokens)
+
+
+class SearchTokens(models.Func):
+    """把以空白分隔的詞直接轉成 tsvector，不經過全文檢索分詞器"""
+    function = 'array_to_tsvector'
+    template = "%(function)s(string_to_array(%(expressions)s, ' '))"
+    output_field = SearchVectorField()
+
+
+class PrefixQuery(models.Func):
+    """把已整理好的 tsquery 字串直接轉型，不經過全文檢索分詞器"""
+    template = '%(expressions)s::tsquery'
+    output_field = SearchQueryField()
+
+
+class Matches(models.Func):
+    """tsvector @@ tsquery"""
+    template = '%(expressions)s'
+    arg_joiner = ' @@ '
+    output_field = models.BooleanField()
+
+
+def search_vector():
+    """與 GIN 索引相同的 tsvector 運算式"""
+    return SearchTokens('search_document')
+
+
+def build_search_query(search_query):
+    """把使用者輸入轉成 AND 組合的前綴查詢，沒有可搜尋的詞時回傳 None"""
+    terms = [term[:MAX_TERM_LENGTH] for term in split_terms(search_query)]
+    if not terms:
+        return None
+    # 詞段只含文字字元，不會與 tsquery 的語法衝突
+    return PrefixQuery(models.Value(' & '.join(f"'{term}':*" for term in terms)))
+
+
+def search_devices(devices, search_query, rank=True):
+    """以關鍵字篩選設備，PostgreSQL 上使用索引並可依相關度排序"""
+    if connections[devices.db].vendor != 'postgresql':
+        q = models.Q()
+        for field in SEARCH_FIELDS:
+            q |= models.Q(**{f'{field}__icontains': search_query})
+        return devices.filter(q)
+
+    query = build_search_query(search_query)
+    if query is None:
+        return devices.none()
+    devices = devices.filter(Matches(search_vector(), query))
+    if rank:
+        # ts_rank 回傳 real，轉成 double precision 讓游標分頁能精確比較相同的值
+        rank_expression = Cast(SearchRank(search_vector(), query), models.FloatField())
+        devices = devices.annotate(rank=rank_expression).order_by('-rank', 'id')
+    return devices
+
+
+def filter_devices(devices, equipment_type_id=None, search_query='', rank=True, due=None):
+    """設備列表的篩選條件 (設備類型、關鍵字、保養與保固到期)，設備列表與匯出共用
+
+    due 為 schedule.due_filters 取得的到期篩選 {參數: 範圍名稱}
+    """
+    if equipment_type_id:
+        devices = devices.filter(equipment_type_id=equipment_type_id)
+    if due:
+        devices = devices.filter(**due_lookups(due))
+    if search_query:
+        devices = search_devices(devices, search_query, rank=rank)
+    return devices
@@ -0,0 +1,68 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Devices, EquipmentCategory, EquipmentType
+from .pagecache import bump_data_version
+from .stats import STAT_FIELDS, apply_changes, device_stat_keys, stat_keys
+from .stickers import sticker_cache
+
+
+# 設備資料變更時移除該設備的貼紙快取
+@receiver(post_save, sender=Devices)
+@receiver(post_delete, sender=Devices)
+def invalidate_device_sticker(sender, instance, **kwargs):
+    sticker_cache.invalidate(instance.pk)
+
+
+# 設備種類名稱會印在貼紙上，變更時清除全部貼紙快取
+@receiver(post_save, sender=EquipmentType)
+@receiver(post_delete, sender=EquipmentType)
+def invalidate_all_stickers(sender, instance, **kwargs):
+    sticker_cache.clear()
+
+
+# 設備、設備種類與大類會顯示在列表頁與詳細資料頁，任何變更都讓已快取的頁面失效
+@receiver(post_save, sender=Devices)
+@receiver(post_delete, sender=Devices)
+@receiver(post_save, sender=EquipmentType)
+@receiver(post_delete, sender=EquipmentType)
+@receiver(post_save, sender=EquipmentCategory)
+@receiver(post_delete, sender=EquipmentCategory)
+def invalidate_cached_pages(sender, instance, **kwargs):
+    bump_data_version()
+
+
+# 設備種類名稱會顯示在設備詳細資料頁，更新該種類設備的 updated_at 讓 Last-Modified 跟著改變
+@receiver(post_save, sender=EquipmentType)
+def touch_type_devices(sender, instance, created, **kwargs):
+    if not created:
+        Devices.objects.filter(equipment_type=instance).update(updated_at=timezone.now())
+
+
+# 設備的種類、施工廠商或安裝年份變更時增減預先彙總的統計，儲存前先記下原本的值
+@receiver(pre_save, sender=Devices)
+def remember_stat_keys(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stat_keys = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not STAT_FIELDS & set(update_fields):
+        instance._stat_keys = device_stat_keys(instance)
+        return
+    row = Devices.objects.filter(pk=instance.pk).values_list(
+        'equipment_type_id', 'contractor_name', 'date_installed'
+    ).first()
+    if row is not None:
+        instance._stat_keys = stat_keys(*row)
+
+
+@receiver(post_save, sender=Devices)
+def update_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apply_changes(getattr(instance, '_stat_keys', None) or set(), device_stat_keys(instance))
+
+
+@receiver(post_delete, sender=Devices)
+def update_stats_on_delete(sender, instance, **kwargs):
+    apply_changes(device_stat_keys(instance), set())
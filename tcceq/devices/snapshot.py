@@ -0,0 +1,158 @@
+"""設備資料快照 (PostgreSQL COPY)
+
+以 COPY ... TO STDOUT / FROM STDIN 直接在資料庫與檔案之間傳送資料，
+不經過 ORM 建立模型物件。快照是一個 gzip 壓縮檔：
+
+    第一行      JSON 檔頭 (格式版本、devices app 的 migration、各資料表的欄位)
+    其後        依檔頭順序，每個資料表的 COPY 文字格式資料，以 \\. 一行結束
+
+COPY 文字格式會把資料中的反斜線跳脫成 \\\\，因此 \\. 不會出現在資料行中。
+"""
+import gzip
+import json
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+from .models import Devices, EquipmentCategory, EquipmentType
+from .pagecache import bump_data_version
+from .stats import refresh_stats
+from .stickers import sticker_cache
+
+SNAPSHOT_FORMAT = 'tcceq-devices-snapshot'
+SNAPSHOT_VERSION = 1
+
+# 依外鍵相依順序排列 (還原時依序寫入)
+SNAPSHOT_MODELS = (EquipmentCategory, EquipmentType, Devices)
+
+END_OF_DATA = b'\\.\n'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def check_postgresql():
+    if connection.vendor != 'postgresql':
+        raise SnapshotError('快照功能只支援 PostgreSQL 資料庫')
+
+
+def schema_version():
+    """資料庫中 devices app 最後套用的 migration"""
+    applied = [name for app, name in MigrationRecorder(connection).applied_migrations() if app == 'devices']
+    return max(applied) if applied else None
+
+
+def table_columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def _copy_sql(model, columns, direction):
+    quote = connection.ops.quote_name
+    column_list = ', '.join(quote(column) for column in columns)
+    return f'COPY {quote(model._meta.db_table)} ({column_list}) {direction}'
+
+
+class _SectionReader:
+    """把快照中一個資料表的區段當作檔案讀取，讀到 \\. 為止"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.finished = False
+
+    def readline(self, size=-1):
+        if self.finished:
+            return b''
+        line = self.fileobj.readline()
+        if not line:
+            raise SnapshotError('快照檔案不完整')
+        if line == END_OF_DATA:
+            self.finished = True
+            return b''
+        return line
+
+    def read(self, size=-1):
+        chunks = []
+        length = 0
+        while size < 0 or length < size:
+            line = self.readline()
+            if not line:
+                break
+            chunks.append(line)
+            length += len(line)
+        return b''.join(chunks)
+
+
+def export_snapshot(path, compresslevel=6):
+    """輸出快照，回傳 {資料表: 筆數}"""
+    check_postgresql()
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'schema': schema_version(),
+        'created_at': timezone.now().isoformat(),
+        'tables': [
+            {'table': model._meta.db_table, 'columns': table_columns(model)}
+            for model in SNAPSHOT_MODELS
+        ],
+    }
+    counts = {}
+    # 在同一個可重複讀取的交易中匯出，確保各資料表的內容一致
+    with transaction.atomic(), gzip.open(path, 'wb', compresslevel=compresslevel) as output:
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            output.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            for model, table in zip(SNAPSHOT_MODELS, header['tables']):
+                cursor.copy_expert(_copy_sql(model, table['columns'], 'TO STDOUT'), output)
+                counts[table['table']] = cursor.rowcount
+                output.write(END_OF_DATA)
+    return counts
+
+
+def read_header(fileobj):
+    try:
+        header = json.loads(fileobj.readline())
+    except (ValueError, OSError):
+        raise SnapshotError('無法讀取快照檔頭，檔案格式錯誤')
+    if not isinstance(header, dict) or header.get('format') != SNAPSHOT_FORMAT:
+        raise SnapshotError('不是設備資料快照檔案')
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f'不支援的快照格式版本: {header.get("version")}')
+    return header
+
+
+def restore_snapshot(path, ignore_schema=False):
+    """清除現有的設備資料並還原快照，回傳 {資料表: 筆數}"""
+    check_postgresql()
+    models_by_table = {model._meta.db_table: model for model in SNAPSHOT_MODELS}
+    counts = {}
+    with gzip.open(path, 'rb') as snapshot:
+        header = read_header(snapshot)
+        if not ignore_schema and header['schema'] != schema_version():
+            raise SnapshotError(
+                f'快照的資料結構 ({header["schema"]}) 與資料庫 ({schema_version()}) 不同，'
+                f'請先執行 migrate 或使用 --ignore-schema'
+            )
+        tables = header['tables']
+        if sorted(table['table'] for table in tables) != sorted(models_by_table):
+            raise SnapshotError('快照中的資料表與目前的模型不符')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            quote = connection.ops.quote_name
+            cursor.execute('TRUNCATE %s' % ', '.join(quote(table) for table in models_by_table))
+            for table in tables:
+                model = models_by_table[table['table']]
+                cursor.copy_expert(_copy_sql(model, table['columns'], 'FROM STDIN'), _SectionReader(snapshot))
+                counts[table['table']] = cursor.rowcount
+
+            # 讓自動編號從目前最大的 id 之後繼續
+            for sql in connection.ops.sequence_reset_sql(no_style(), SNAPSHOT_MODELS):
+                cursor.execute(sql)
+
+            # COPY 不會送出 signal，交易完成後讓快取失效
+            transaction.on_commit(bump_data_version)
+            transaction.on_commit(sticker_cache.clear)
+            transaction.on_commit(refresh_stats)
+    return counts
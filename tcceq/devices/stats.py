@@ -0,0 +1,139 @@
+"""預先彙總的設備統計
+
+依設備種類、施工廠商與安裝年份統計設備數量，存在 InventoryStat (每個維度每個值一筆)。
+統計頁只需讀取幾百筆彙總資料，不必掃描所有設備；設備大類的數量由設備種類的數量加總。
+
+- 單筆設備新增、修改或刪除時，由 signal 以 apply_changes 增減受影響的項目。
+- 批次匯入、還原快照等不會送出 signal 的操作，在交易完成後以 refresh_stats 重新計算。
+- refresh_stats 也可由 refresh_stats 指令排程執行，修正任何偏差；只會寫入有變更的項目。
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from .models import Devices, EquipmentType, InventoryStat
+
+# 影響統計的設備欄位
+STAT_FIELDS = frozenset({'equipment_type', 'equipment_type_id', 'contractor_name', 'date_installed'})
+
+
+def stat_keys(equipment_type_id, contractor_name, date_installed):
+    """一個設備在各統計維度的 (維度, 鍵)"""
+    if not date_installed:
+        year = ''
+    elif hasattr(date_installed, 'year'):
+        year = str(date_installed.year)
+    else:
+        # 尚未轉換的 YYYY-MM-DD 字串
+        year = str(date_installed)[:4]
+    return {
+        (InventoryStat.DIMENSION_TYPE, str(equipment_type_id)),
+        (InventoryStat.DIMENSION_CONTRACTOR, contractor_name or ''),
+        (InventoryStat.DIMENSION_YEAR, year),
+    }
+
+
+def device_stat_keys(device):
+    return stat_keys(device.equipment_type_id, device.contractor_name, device.date_installed)
+
+
+def apply_changes(old_keys, new_keys):
+    """設備由 old_keys 變成 new_keys (新增時 old_keys 為空，刪除時 new_keys 為空)，增減對應的數量"""
+    deltas = {key: 1 for key in new_keys - old_keys}
+    deltas.update({key: -1 for key in old_keys - new_keys})
+    if not deltas:
+        return
+    now = timezone.now()
+    for (dimension, key), delta in deltas.items():
+        stat, created = InventoryStat.objects.get_or_create(dimension=dimension, key=key, defaults={'count': delta})
+        if not created:
+            InventoryStat.objects.filter(pk=stat.pk).update(count=F('count') + delta, updated_at=now)
+    # 數量歸零的項目 (例如最後一個設備被刪除的廠商) 不再顯示
+    decreased = [Q(dimension=dimension, key=key) for (dimension, key), delta in deltas.items() if delta < 0]
+    if decreased:
+        condition = Q()
+        for term in decreased:
+            condition |= term
+        InventoryStat.objects.filter(condition, count__lte=0).delete()
+
+
+def compute_counts(devices):
+    """以 GROUP BY 計算各維度的設備數量，回傳 {(維度, 鍵): 數量}"""
+    devices = devices.order_by()
+    counts = Counter()
+    for equipment_type_id, count in devices.values_list('equipment_type_id').annotate(count=Count('id')):
+        counts[(InventoryStat.DIMENSION_TYPE, str(equipment_type_id))] += count
+    for contractor_name, count in devices.values_list('contractor_name').annotate(count=Count('id')):
+        counts[(InventoryStat.DIMENSION_CONTRACTOR, contractor_name or '')] += count
+    years = devices.annotate(year=ExtractYear('date_installed')).values_list('year').annotate(count=Count('id'))
+    for year, count in years:
+        counts[(InventoryStat.DIMENSION_YEAR, '' if year is None else str(year))] += count
+    return counts
+
+
+def sync_counts(counts):
+    """把 InventoryStat 的內容改成 counts，只寫入有變更的項目，回傳變更的項目數"""
+    now = timezone.now()
+    existing = {(stat.dimension, stat.key): stat for stat in InventoryStat.objects.select_for_update()}
+    created = [
+        InventoryStat(dimension=dimension, key=key, count=count)
+        for (dimension, key), count in counts.items() if (dimension, key) not in existing
+    ]
+    updated = []
+    deleted = []
+    for key, stat in existing.items():
+        count = counts.get(key)
+        if count is None:
+            deleted.append(stat.pk)
+        elif count != stat.count:
+            stat.count = count
+            stat.updated_at = now
+            updated.append(stat)
+    InventoryStat.objects.bulk_create(created, batch_size=1000)
+    InventoryStat.objects.bulk_update(updated, ['count', 'updated_at'], batch_size=1000)
+    InventoryStat.objects.filter(pk__in=deleted).delete()
+    return len(created) + len(updated) + len(deleted)
+
+
+def refresh_stats():
+    """重新計算所有統計，回傳變更的項目數"""
+    with transaction.atomic():
+        return sync_counts(compute_counts(Devices.objects.all()))
+
+
+def dashboard_stats():
+    """統計頁的資料：總數、各設備大類、設備種類、施工廠商與安裝年份的數量"""
+    stats = defaultdict(dict)
+    updated_at = None
+    for stat in InventoryStat.objects.all():
+        stats[stat.dimension][stat.key] = stat.count
+        if updated_at is None or stat.updated_at > updated_at:
+            updated_at = stat.updated_at
+
+    type_counts = stats[InventoryStat.DIMENSION_TYPE]
+    equipment_types = EquipmentType.objects.in_bulk([int(key) for key in type_counts])
+    types = []
+    categories = Counter()
+    for key, count in type_counts.items():
+        equipment_type = equipment_types.get(int(key))
+        if equipment_type is None:
+            continue
+        category = equipment_type.category.name if equipment_type.category else ''
+        categories[category] += count
+        types.append({'category': category, 'name': equipment_type.name, 'id': equipment_type.id, 'count': count})
+    types.sort(key=lambda row: (row['category'], -row['count'], row['name']))
+
+    def rows(counts):
+        return [{'name': key, 'count': count} for key, count in counts.items()]
+
+    return {
+        'total': sum(row['count'] for row in types),
+        'updated_at': updated_at,
+        'categories': sorted(rows(categories), key=lambda row: (-row['count'], row['name'])),
+        'types': types,
+        'contractors': sorted(rows(stats[InventoryStat.DIMENSION_CONTRACTOR]), key=lambda row: (-row['count'], row['name'])),
+        'years': sorted(rows(stats[InventoryStat.DIMENSION_YEAR]), key=lambda row: (row['name'] == '', row['name'])),
+    }
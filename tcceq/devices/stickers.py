@@ -0,0 +1,316 @@
+"""QR code 貼紙繪製引擎
+
+字型在每個程序啟動時 (AppConfig.ready) 註冊一次，版面座標預先計算，
+文字寬度量測結果會被快取，用來依實際寬度截斷文字。
+
+每張貼紙頁面的 QR code 會先轉成 PDF 繪圖指令 (content stream)，
+與排版好的文字一起快取在記憶體中，並寫入 STICKER_CACHE_DIR 供同一台主機的所有程序共用。
+重複匯出未變更的設備時，只需把快取的頁面內容放進新的 PDF，不必重新產生 QR code 與文字排版。
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.lib.units import mm
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+
+logger = logging.getLogger(__name__)
+
+# 貼紙尺寸 (30mm x 40mm)
+STICKER_WIDTH = 30 * mm
+STICKER_HEIGHT = 40 * mm
+
+# QR code 大小和位置 (調整為適合貼紙尺寸)
+QR_SIZE = 22 * mm  # 稍微縮小QR code為中文文字留空間
+QR_X = (STICKER_WIDTH - QR_SIZE) / 2  # QR code 水平置中
+QR_Y = 10 * mm  # QR code 位置
+
+# 文字排版
+FONT_SIZE = 8
+MAX_TEXT_WIDTH = STICKER_WIDTH - 2 * mm  # 左右各留 1mm
+MAX_SPEC_LINES = 3
+LINE_HEIGHT = 2.8 * mm
+ELLIPSIS = "..."
+
+
+class StickerLayout:
+    """預先計算好的貼紙文字座標"""
+
+    def __init__(self, spec_offset):
+        self.center_x = STICKER_WIDTH / 2
+        self.type_y = QR_Y + QR_SIZE + 4 * mm      # 設備類型 (QR code 上方)
+        self.brand_y = QR_Y + QR_SIZE + 0.5 * mm   # 設備品牌 (QR code 上方第二行)
+        # 規格 (QR code 下方)，最多 3 行
+        self.spec_ys = tuple(QR_Y - spec_offset - j * LINE_HEIGHT for j in range(MAX_SPEC_LINES))
+
+
+# 下載所有設備與下載選中設備的規格行位置略有不同
+ALL_LAYOUT = StickerLayout(spec_offset=1 * mm)
+SELECTED_LAYOUT = StickerLayout(spec_offset=1.5 * mm)
+
+
+_fonts = None
+
+
+def register_fonts():
+    """註冊中文字體，每個程序只需執行一次，回傳 (一般字體, 粗體字體) 名稱"""
+    global _fonts
+    if _fonts is not None:
+        return _fonts
+
+    # Noto Sans TC 字體路徑
+    font_path = os.path.join(settings.BASE_DIR, 'media', 'fonts', 'static', 'NotoSansTC-Bold.ttf')
+    if os.path.exists(font_path):
+        # 粗體檔案同時作為一般與粗體字體使用，只需解析一次
+        pdfmetrics.registerFont(TTFont('NotoSansTC', font_path))
+        _fonts = ('NotoSansTC', 'NotoSansTC')
+        return _fonts
+
+    logger.warning("字體文件不存在: %s，改用備用字體", font_path)
+    # 備用方案：內建的中文 CID 字體 (STSong-Light，其次 HeiseiMin-W3)
+    for cid_font in ('STSong-Light', 'HeiseiMin-W3'):
+        try:
+            pdfmetrics.registerFont(UnicodeCIDFont(cid_font))
+            _fonts = (cid_font, cid_font)  # 系統字體通常沒有分別的粗體
+            return _fonts
+        except Exception as e:
+            logger.warning("註冊 %s 字體失敗: %s", cid_font, e)
+
+    # 最後備用：使用 Helvetica
+    _fonts = ('Helvetica', 'Helvetica-Bold')
+    return _fonts
+
+
+def get_fonts():
+    """取得已註冊的 (一般字體, 粗體字體) 名稱"""
+    return register_fonts()
+
+
+@lru_cache(maxsize=65536)
+def text_width(text, font_name, size=FONT_SIZE):
+    """文字寬度 (點)，結果會被快取"""
+    return pdfmetrics.stringWidth(text, font_name, size)
+
+
+class StickerPage:
+    """單張貼紙已完成排版的內容：QR code 繪圖指令與各行文字"""
+
+    __slots__ = ('fingerprint', 'qr_ops', 'type_line', 'brand_line', 'spec_lines')
+
+    def __init__(self, fingerprint, qr_ops, type_line, brand_line, spec_lines):
+        self.fingerprint = fingerprint
+        self.qr_ops = qr_ops
+        self.type_line = type_line
+        self.brand_line = brand_line
+        self.spec_lines = spec_lines
+
+
+class StickerCache:
+    """以設備 id 為鍵的貼紙快取，內容為 StickerPage
+
+    記憶體中是每個程序最多 max_entries 頁的 LRU 快取。頁面同時以 JSON 檔寫入
+    directory (預設為 STICKER_CACHE_DIR，每個設備一個檔案)，同一台主機的所有程序共用，
+    重新啟動後仍然有效，大小隨設備數增加而不受 max_entries 限制，
+    超過 max_entries 頁的匯出也能使用快取。
+
+    檔案內容包含指紋，內容已變更的頁面不會被使用，因此 clear() 只清除記憶體中的頁面。
+    """
+
+    def __init__(self, max_entries, directory=None):
+        self.max_entries = max_entries
+        self._directory = directory
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        """頁面檔案的目錄，空值表示只使用記憶體 (每次都從設定讀取)"""
+        if self._directory is not None:
+            return self._directory
+        return getattr(settings, 'STICKER_CACHE_DIR', None)
+
+    def _path(self, device_id):
+        # 依 id 分成 1000 個子目錄，避免單一目錄的檔案過多
+        return os.path.join(self.directory, f'{int(device_id) % 1000:03d}', f'{device_id}.json')
+
+    def get(self, device_id, fingerprint):
+        with self._lock:
+            page = self._pages.get(device_id)
+            if page is not None and page.fingerprint == fingerprint:
+                self._pages.move_to_end(device_id)
+                return page
+        page = self._read(device_id)
+        if page is None or page.fingerprint != fingerprint:
+            return None
+        self._remember(device_id, page)
+        return page
+
+    def set(self, device_id, page):
+        self._remember(device_id, page)
+        self._write(device_id, page)
+
+    def _remember(self, device_id, page):
+        with self._lock:
+            self._pages[device_id] = page
+            self._pages.move_to_end(device_id)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def _read(self, device_id):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(device_id), encoding='utf-8') as file:
+                return StickerPage(**json.load(file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("讀取貼紙快取失敗 (設備 %s): %s", device_id, e)
+            return None
+
+    def _write(self, device_id, page):
+        if not self.directory:
+            return
+        path = self._path(device_id)
+        data = {name: getattr(page, name) for name in StickerPage.__slots__}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先寫入暫存檔再取代，其他程序不會讀到寫到一半的檔案
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump(data, file, ensure_ascii=False)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            logger.warning("寫入貼紙快取失敗 (設備 %s): %s", device_id, e)
+
+    def invalidate(self, device_id):
+        with self._lock:
+            self._pages.pop(device_id, None)
+        if self.directory:
+            try:
+                os.remove(self._path(device_id))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """清除記憶體中的頁面 (檔案以指紋判斷是否仍然有效)"""
+        with self._lock:
+            self._pages.clear()
+
+    def __len__(self):
+        return len(self._pages)
+
+
+sticker_cache = StickerCache(getattr(settings, 'STICKER_CACHE_SIZE', 10000))
+
+
+def sticker_fingerprint(device, device_url):
+    """貼紙上印出的欄位 (種類、廠牌、規格、詳細頁 URL) 與字體的指紋"""
+    fields = (device.equipment_type.name, device.brand, device.specification, device_url) + get_fonts()
+    raw = '\x1f'.join('' if value is None else str(value) for value in fields)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def fit_width(text, font_name, max_width=MAX_TEXT_WIDTH):
+    """回傳能放進 max_width 的最長前綴字元數"""
+    width = 0
+    for i, char in enumerate(text):
+        width += text_width(char, font_name)
+        if width > max_width:
+            return i
+    return len(text)
+
+
+def truncate(text, font_name, max_width=MAX_TEXT_WIDTH):
+    """依實際寬度截斷文字，超過時加上省略號"""
+    if text_width(text, font_name) <= max_width:
+        return text
+    keep = fit_width(text, font_name, max_width - text_width(ELLIPSIS, font_name))
+    return text[:keep] + ELLIPSIS
+
+
+def split_spec_lines(spec_info, font_name):
+    """依實際寬度將規格分割成多行，最多顯示 3 行，超過時在最後一行加上省略號"""
+    spec_lines = []
+    remaining = spec_info
+    while remaining and len(spec_lines) < MAX_SPEC_LINES:
+        keep = max(1, fit_width(remaining, font_name))
+        spec_lines.append(remaining[:keep])
+        remaining = remaining[keep:]
+
+    if remaining:
+        spec_lines[-1] = truncate(spec_lines[-1] + remaining, font_name)
+    return spec_lines
+
+
+def build_qr_ops(device_url):
+    """產生 QR code 的 PDF 繪圖指令 (已換算成貼紙頁面座標)"""
+    qr_widget = QrCodeWidget(device_url)
+    qr_widget.barWidth = QR_SIZE
+    qr_widget.barHeight = QR_SIZE
+
+    ops = ['q', '0 0 0 rg']
+    for rect in qr_widget.draw().contents:
+        # 第一個矩形是沒有填色的外框
+        if rect.fillColor is None:
+            continue
+        ops.append('%s re' % fp_str(QR_X + rect.x, QR_Y + rect.y, rect.width, rect.height))
+    ops.append('f')
+    ops.append('Q')
+    return '\n'.join(ops)
+
+
+def build_sticker_page(device, device_url, fingerprint=None):
+    """建立單一設備的貼紙內容 (不經過快取)"""
+    if fingerprint is None:
+        fingerprint = sticker_fingerprint(device, device_url)
+    chinese_font, chinese_font_bold = get_fonts()
+    return StickerPage(
+        fingerprint=fingerprint,
+        qr_ops=build_qr_ops(device_url),
+        type_line=truncate(f"{device.equipment_type.name}", chinese_font_bold),
+        brand_line=truncate(f"{device.brand}", chinese_font_bold),
+        spec_lines=split_spec_lines(f"{device.specification}", chinese_font),
+    )
+
+
+def get_sticker_page(device, device_url):
+    """取得設備的貼紙內容，優先使用快取"""
+    fingerprint = sticker_fingerprint(device, device_url)
+    page = sticker_cache.get(device.id, fingerprint)
+    if page is None:
+        page = build_sticker_page(device, device_url, fingerprint)
+        sticker_cache.set(device.id, page)
+    return page
+
+
+def draw_sticker(p, page, layout=ALL_LAYOUT):
+    """將貼紙內容繪製到 canvas 目前的頁面"""
+    chinese_font, chinese_font_bold = get_fonts()
+
+    # QR code 直接使用快取的繪圖指令
+    p.addLiteral(page.qr_ops)
+
+    # 設備類型與品牌 (QR code 上方) - 使用粗體
+    p.setFont(chinese_font_bold, FONT_SIZE)
+    p.drawString(layout.center_x - text_width(page.type_line, chinese_font_bold) / 2, layout.type_y, page.type_line)
+    p.drawString(layout.center_x - text_width(page.brand_line, chinese_font_bold) / 2, layout.brand_y, page.brand_line)
+
+    # 規格 (QR code 下方) - 使用一般字體，支援多行顯示
+    p.setFont(chinese_font, FONT_SIZE)
+    for line, y in zip(page.spec_lines, layout.spec_ys):
+        p.drawString(layout.center_x - text_width(line, chinese_font) / 2, y, line)
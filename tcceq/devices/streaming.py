@@ -0,0 +1,80 @@
+"""在 ASGI 下輸出同步產生器的串流回應
+
+貼紙 PDF (iter_sticker_pdf) 與設備匯出 (iter_export) 都是同步產生器。ASGI handler
+遇到同步的 StreamingHttpResponse 時會以 sync_to_async(list) 先讀完整個內容，
+整份 PDF 或匯出檔都會留在記憶體中，而且讀取時佔用 asgiref 的共用同步執行緒，
+其他同步檢視與非同步 ORM 查詢都要等它完成。
+
+ThreadedStream 在每個回應專用的執行緒中讀取同步產生器，以有上限的佇列交給事件迴圈，
+記憶體用量固定 (最多 max_chunks 個區塊)，也不會佔用共用執行緒。
+AsyncStreamingMiddleware 在非同步請求中自動套用。
+"""
+import asyncio
+import contextvars
+import threading
+
+from django.db import connections
+
+# 每個串流在佇列中最多暫存的區塊數
+MAX_CHUNKS = 8
+
+_END = object()
+
+
+class ThreadedStream:
+    """在專用執行緒中讀取同步 iterator 的 async iterator
+
+    客戶端中斷連線 (消費端停止) 時，讀取執行緒在下一個區塊後停止。
+    執行緒結束時關閉它自己的資料庫連線。
+    """
+
+    def __init__(self, iterator, max_chunks=MAX_CHUNKS):
+        self.iterator = iterator
+        self.max_chunks = max_chunks
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        # 佇列中的區塊數上限 (消費端取出後才繼續讀取)
+        space = threading.Semaphore(self.max_chunks)
+        stopped = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(items.put_nowait, item)
+            except RuntimeError:
+                # 事件迴圈已關閉
+                stopped.set()
+
+        def produce():
+            error = None
+            try:
+                for chunk in self.iterator:
+                    space.acquire()
+                    if stopped.is_set():
+                        break
+                    put((chunk, None))
+            except Exception as e:
+                error = e
+            finally:
+                connections.close_all()
+            put((_END, error))
+
+        # 複製 context，讀取時仍使用同一個請求的唯讀副本路由與查詢計數
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk, error = await items.get()
+                if chunk is _END:
+                    if error is not None:
+                        raise error
+                    return
+                space.release()
+                yield chunk
+        finally:
+            stopped.set()
+            space.release()
@@ -0,0 +1,115 @@
+"""現場調查 CSV (直式設備區塊) 解析
+
+每個設備是一個區塊：第一行為「中文編號,設備種類」，之後每行為「序號,中文欄位名稱,值」，
+區塊之間以空行分隔。convert_csv_to_json.py 與 import_survey_csv 指令共用此模組，
+本模組不依賴 Django，可單獨執行。
+"""
+import csv
+import time
+from collections import Counter
+
+# 建立中文欄位名稱到JSON屬性的映射
+FIELD_MAPPING = {
+    '廠牌及用途': 'brand',
+    '規格': 'specification',
+    '使用電流及電壓': 'power_info',
+    '出廠/按裝日期': 'date_installed',
+    '出廠/安裝日期': 'date_installed',  # 處理不同的寫法
+    '維修保養周期': 'maintenance_cycle',
+    '保固時程': 'warranty_period',
+    '施工廠商名稱及電話': 'contractor_info',
+    '安裝人員姓名及電話': 'installer_info',
+    '按裝人員姓名及電話': 'installer_info',  # 處理不同的寫法
+    '緊急維修人員姓名及電話': 'emergency_info',
+    '負責維修人員姓名及電話': 'maintenance_info',
+}
+
+# 需要分離姓名 (名稱) 與電話的欄位
+CONTACT_FIELDS = ('contractor_info', 'installer_info', 'emergency_info', 'maintenance_info')
+
+
+def split_contact(property_name, field_value):
+    """把「名稱及電話」欄位拆成 {xxx_name, xxx_phone}"""
+    parts = field_value.split(' ')
+    name_key = property_name.replace('_info', '_name')
+    phone_key = property_name.replace('_info', '_phone')
+
+    if property_name == 'contractor_info':
+        # 施工廠商名稱及電話 (公司名稱 電話)
+        if len(parts) >= 2:
+            return {name_key: parts[0], phone_key: parts[1]}
+    elif len(parts) >= 3:
+        # 人員姓名及電話 (通常格式: 公司 姓名 電話)
+        return {name_key: f"{parts[0]} {parts[1]}", phone_key: parts[2]}
+    return {name_key: field_value, phone_key: ''}
+
+
+def iter_survey_devices(file, on_unknown_field=None):
+    """逐一產生 CSV 中的設備資料 (dict)，只保留目前的設備區塊在記憶體中
+
+    file: 已開啟的文字檔或任何可逐行讀取的物件
+    on_unknown_field: 遇到無法對應的欄位時呼叫 on_unknown_field(欄位名稱, 值)
+    """
+    current_device = {}
+
+    for row in csv.reader(file):
+        # 跳過空行
+        if not any(row):
+            continue
+
+        # 檢查是否為設備開始行（包含中文數字和設備種類）
+        if len(row) >= 2 and row[0] and row[1] and not row[0].isdigit():
+            # 如果有之前的設備資料，先產生
+            if current_device:
+                yield current_device
+
+            # 開始新設備
+            current_device = {
+                'equipment_type': row[1]
+            }
+
+        # 檢查是否為資料行（第一欄為數字）
+        elif row[0].isdigit() and len(row) >= 3:
+            field_name = row[1]  # 取得中文欄位名稱
+            field_value = row[2]  # 取得欄位值
+
+            # 根據中文欄位名稱映射到對應的屬性
+            property_name = FIELD_MAPPING.get(field_name)
+            if property_name in CONTACT_FIELDS:
+                current_device.update(split_contact(property_name, field_value))
+            elif property_name:
+                # 直接映射的欄位
+                current_device[property_name] = field_value
+            elif on_unknown_field:
+                on_unknown_field(field_name, field_value)
+
+    # 產生最後一個設備
+    if current_device:
+        yield current_device
+
+
+def parse_survey_file(path):
+    """解析一個 CSV 檔案，回傳設備資料與統計 (可在子程序中執行)"""
+    started = time.perf_counter()
+    rows = 0
+    unknown_fields = Counter()
+
+    def count_unknown_field(field_name, field_value):
+        unknown_fields[field_name] += 1
+
+    with open(path, 'r', encoding='utf-8') as file:
+        def counted_lines():
+            nonlocal rows
+            for line in file:
+                rows += 1
+                yield line
+
+        devices = list(iter_survey_devices(counted_lines(), count_unknown_field))
+
+    return {
+        'path': path,
+        'devices': devices,
+        'rows': rows,
+        'unknown_fields': dict(unknown_fields),
+        'parse_seconds': time.perf_counter() - started,
+    }
@@ -0,0 +1,254 @@
+"""產生擬真的設備資料 (負載與大資料量測試用)
+
+設備大類、設備種類、廠牌與規格使用繁體中文；設備種類的數量分佈是偏斜的
+(少數種類佔大部分設備，與實際工程相同)，施工廠商與人員也集中在少數廠商。
+
+亂數以每 BLOCK_SIZE 筆為一個區塊，各區塊的亂數種子由 seed 與區塊編號決定，
+因此相同的 seed 與起始編號一定產生相同的資料，也可以從任意編號接續產生。
+"""
+import itertools
+import random
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from .importers import BulkDeviceImporter
+from .models import EquipmentCategory, EquipmentType
+
+BLOCK_SIZE = 1000
+
+# 設備大類 → (說明, 設備種類, 廠牌, 使用電流及電壓)
+CATALOG = {
+    '電力設備': (
+        '受配電、變壓與備用電源',
+        ('配電盤', '變壓器', '不斷電系統', '緊急發電機', '電力電容器', '智慧電錶'),
+        ('士林電機', '華城電機', '中興電工', '亞力電機', '大同', '施耐德電機', '台達電子'),
+        ('3ψ4W 220/380V', '3ψ3W 11.4kV', 'AC220V', 'AC110V', 'DC125V'),
+    ),
+    '空調設備': (
+        '冰水主機、空調箱與通風設備',
+        ('冰水主機', '空調箱', '送風機', '冷卻水塔', '分離式冷氣', '排風機', '全熱交換器'),
+        ('日立', '大金', '開利', '約克', '東元電機', '三菱電機', '國際牌'),
+        ('3ψ380V', 'AC220V', '1ψ220V', '3ψ220V'),
+    ),
+    '給排水設備': (
+        '泵浦、水塔與熱水設備',
+        ('揚水泵浦', '污水泵浦', '熱水器', '水塔', '淨水設備', '加壓泵浦'),
+        ('大井泵浦', '木川泵浦', '川源', '櫻花', '和成', '中福'),
+        ('3ψ380V', 'AC220V', 'AC110V'),
+    ),
+    '消防設備': (
+        '火警、撒水與排煙設備',
+        ('火警受信總機', '撒水泵浦', '消防栓箱', '排煙設備', '緊急照明燈', '出口標示燈', '偵煙探測器'),
+        ('永揚消防', '祥瑞消防', '能美防災', '宏力消防', '台灣日立', '大中消防'),
+        ('AC110V', 'DC24V', '3ψ380V', 'AC220V'),
+    ),
+    '弱電設備': (
+        '監視、門禁、廣播與網路',
+        ('監視攝影機', '門禁讀卡機', '廣播主機', '網路交換器', '對講機', '網路錄影主機'),
+        ('海康威視', '大華', '陞泰科技', '晶睿通訊', '友訊科技', '聲寶'),
+        ('DC12V', 'PoE 48V', 'AC110V', 'DC24V'),
+    ),
+    '太陽能設備': (
+        '太陽能發電系統',
+        ('太陽能模組', '變流器', '監控系統', '直流接線箱'),
+        ('固態能源科技', '聯合再生', '元晶太陽能', '茂迪', '台達電子'),
+        ('DC34.37V /11.06A', 'DC1000V', '3ψ380V', 'AC220V'),
+    ),
+    '昇降設備': (
+        '電梯與電扶梯',
+        ('乘客電梯', '貨梯', '電扶梯', '無障礙升降平台'),
+        ('永大機電', '崇友實業', '台灣三菱電梯', '台灣日立', '奧的斯'),
+        ('3ψ380V', 'AC220V'),
+    ),
+}
+
+# 規格的額定值 (依設備種類名稱的關鍵字選擇)
+RATINGS = (
+    ('變壓器', ('{n}kVA 油浸式', '{n}kVA 模鑄式'), (500, 750, 1000, 1500, 2000)),
+    ('發電機', ('{n}kW 柴油', '{n}kVA 柴油'), (150, 300, 500, 750)),
+    ('不斷電', ('{n}kVA 線上式',), (3, 6, 10, 20, 40)),
+    ('冰水主機', ('{n}RT 螺旋式', '{n}RT 離心式'), (150, 250, 350, 500)),
+    ('冷氣', ('{n}kW 變頻', '{n}kW 定頻'), (2.8, 3.6, 5.0, 7.1, 9.0)),
+    ('泵浦', ('{n}HP 立式', '{n}HP 沉水式'), (1, 2, 3, 5, 7.5, 10)),
+    ('風機', ('{n}CMH', '{n}HP 軸流式'), (1200, 3000, 6000, 12000)),
+    ('模組', ('{n}Wp 單晶矽', '{n}Wp 多晶矽'), (330, 380, 410, 450)),
+    ('變流器', ('{n}kVA 三相', '{n}kW 併聯型'), (20, 50, 70, 100)),
+    ('電梯', ('載重{n}kg', '{n}人乘'), (750, 1000, 1350, 1600)),
+    ('攝影機', ('{n}MP 槍型', '{n}MP 半球型'), (2, 4, 5, 8)),
+)
+DEFAULT_RATINGS = (('{n}型', '{n}系列'), (100, 200, 300, 500, 1000))
+
+# 廠牌及用途中的用途說明
+PURPOSES = ('', '', '', '一般用', '動力用', '辦公區', '公共區域', '機房用', '緊急用', '地下室')
+
+MAINTENANCE_CYCLES = (('每月', 20), ('每季', 45), ('每半年', 20), ('每年', 15))
+WARRANTY_PERIODS = (('一年', 40), ('二年', 30), ('三年', 15), ('五年', 10), ('十年', 5))
+
+SURNAMES = (
+    ('陳', 11), ('林', 8), ('黃', 6), ('張', 5), ('李', 5), ('王', 4), ('吳', 4), ('劉', 3),
+    ('蔡', 3), ('楊', 3), ('許', 2), ('鄭', 2), ('謝', 2), ('郭', 2), ('洪', 2), ('曾', 1), ('邱', 1),
+)
+GIVEN_NAME_CHARACTERS = '志明家豪建宏俊傑冠宇怡君淑芬雅婷美玲宗翰柏諺承恩彥廷佳穎文雄正義國華育誠柏僥'
+COMPANY_PREFIXES = (
+    '宏達', '永豐', '聯合', '全球', '信義', '大安', '正大', '建國', '長泓', '東昇', '新亞', '台中',
+    '中興', '富邦', '弘安', '立德', '晟祥', '鼎盛', '合順', '嘉新', '裕隆', '瑞展', '欣榮', '群益',
+)
+COMPANY_SUFFIXES = (
+    '工程有限公司', '機電工程股份有限公司', '水電行', '消防工程有限公司', '空調工程股份有限公司', '電機技術顧問有限公司',
+)
+# 市話區碼與比例 (台中的工程，04 最多)
+AREA_CODES = (('04', 60), ('02', 20), ('03', 8), ('07', 7), ('06', 5))
+
+# 施工廠商數量與每家的人員數
+CONTRACTOR_COUNT = 240
+STAFF_PER_CONTRACTOR = (2, 8)
+
+
+def _weighted(choices):
+    """(值, 權重) → 可用 rng.choices 的 (值, 累積權重)"""
+    values = [value for value, weight in choices]
+    cum_weights = list(itertools.accumulate(weight for value, weight in choices))
+    return values, cum_weights
+
+
+def _zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+class InventoryGenerator:
+    """以 seed 產生固定的設備大類、設備種類、施工廠商與設備資料"""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        rng = random.Random(f'catalog:{seed}')
+
+        self.types = []           # [(設備大類, 設備種類)]
+        for category, (description, type_names, brands, powers) in CATALOG.items():
+            self.types.extend((category, type_name) for type_name in type_names)
+        # 設備種類的數量分佈偏斜：打亂順序後依排名給予 Zipf 權重
+        ranked = self.types[:]
+        rng.shuffle(ranked)
+        weights = dict(zip(ranked, _zipf_weights(len(ranked))))
+        self._type_cum_weights = list(itertools.accumulate(weights[item] for item in self.types))
+
+        self._surnames = _weighted(SURNAMES)
+        self._cycles = _weighted(MAINTENANCE_CYCLES)
+        self._warranties = _weighted(WARRANTY_PERIODS)
+
+        self.contractors = [self._contractor(rng, index) for index in range(CONTRACTOR_COUNT)]
+        self._contractor_cum_weights = list(itertools.accumulate(_zipf_weights(CONTRACTOR_COUNT, 0.9)))
+
+    def _person(self, rng):
+        surname = rng.choices(*self._surnames)[0]
+        return surname + ''.join(rng.sample(GIVEN_NAME_CHARACTERS, 2))
+
+    def _mobile(self, rng):
+        number = f'09{rng.randrange(10000000, 100000000)}'
+        # 少數電話以 0912-345-678 的格式記錄
+        if rng.random() < 0.2:
+            return f'{number[:4]}-{number[4:7]}-{number[7:]}'
+        return number
+
+    def _contractor(self, rng, index):
+        area_code = rng.choices(*_weighted(AREA_CODES))[0]
+        digits = 8 if area_code in ('02', '04') else 7
+        name = f'{rng.choice(COMPANY_PREFIXES)}{rng.choice(COMPANY_SUFFIXES)}'
+        staff = [
+            (self._person(rng), self._mobile(rng))
+            for _ in range(rng.randint(*STAFF_PER_CONTRACTOR))
+        ]
+        return {
+            'name': name,
+            'short_name': name[:2],
+            'phone': f'{area_code}-{rng.randrange(10 ** (digits - 1), 10 ** digits)}',
+            'staff': staff,
+        }
+
+    def _staff(self, rng, contractor):
+        person, phone = rng.choice(contractor['staff'])
+        return f'{contractor["short_name"]} {person}', phone
+
+    def _spec(self, rng, type_name, index):
+        for keyword, formats, values in RATINGS:
+            if keyword in type_name:
+                break
+        else:
+            formats, values = DEFAULT_RATINGS
+        rating = rng.choice(formats).format(n=rng.choice(values))
+        model = f'{rng.choice("ABCDEFGHKMNPRSTUVXZ")}{rng.choice("ABCDEFGHKMNPRSTUVXZ")}-{index:07d}'
+        return f'{rating} 型號{model}'
+
+    def device(self, rng, index):
+        """第 index 個設備的資料 (equipment_type 為設備種類名稱，其餘為設備欄位)"""
+        category, type_name = rng.choices(self.types, cum_weights=self._type_cum_weights)[0]
+        description, type_names, brands, powers = CATALOG[category]
+        brand = rng.choice(brands)
+        purpose = rng.choice(PURPOSES)
+
+        contractor = rng.choices(self.contractors, cum_weights=self._contractor_cum_weights)[0]
+        installer_name, installer_phone = self._staff(rng, contractor)
+        # 維修多半由原施工廠商負責，少數另外委託其他廠商
+        maintainer = contractor
+        if rng.random() < 0.3:
+            maintainer = rng.choices(self.contractors, cum_weights=self._contractor_cum_weights)[0]
+        maintenance_name, maintenance_phone = self._staff(rng, maintainer)
+        emergency_name, emergency_phone = self._staff(rng, maintainer)
+        if rng.random() < 0.05:
+            emergency_name = emergency_phone = None
+
+        # 安裝日期集中在近幾年
+        days_ago = int(rng.triangular(0, 3650, 200))
+        date_installed = None if rng.random() < 0.03 else date(2025, 9, 1) - timedelta(days=days_ago)
+
+        return {
+            'equipment_type': type_name,
+            'brand': f'{brand} {purpose}'.strip(),
+            'specification': self._spec(rng, type_name, index),
+            'power_info': rng.choice(powers),
+            'date_installed': date_installed,
+            'maintenance_cycle': rng.choices(*self._cycles)[0],
+            'warranty_period': rng.choices(*self._warranties)[0],
+            'contractor_name': contractor['name'],
+            'contractor_phone': contractor['phone'],
+            'installer_name': installer_name,
+            'installer_phone': installer_phone,
+            'emergency_name': emergency_name,
+            'emergency_phone': emergency_phone,
+            'maintenance_name': maintenance_name,
+            'maintenance_phone': maintenance_phone,
+        }
+
+    def iter_devices(self, count, start=0):
+        """產生編號 start 到 start + count - 1 的設備資料"""
+        end = start + count
+        for block in range(start // BLOCK_SIZE, (end - 1) // BLOCK_SIZE + 1 if count else 0):
+            rng = random.Random(f'devices:{self.seed}:{block}')
+            for index in range(block * BLOCK_SIZE, min((block + 1) * BLOCK_SIZE, end)):
+                data = self.device(rng, index)
+                if index >= start:
+                    yield data
+
+    def create_catalog(self):
+        """建立 (或沿用同名的) 設備大類與設備種類"""
+        categories = {}
+        for name, (description, type_names, brands, powers) in CATALOG.items():
+            categories[name] = EquipmentCategory.objects.get_or_create(
+                name=name, defaults={'description': description}
+            )[0]
+        for category, type_name in self.types:
+            EquipmentType.objects.get_or_create(name=type_name, defaults={'category': categories[category]})
+
+
+def generate_inventory(count, seed=0, start=0, batch_size=5000, progress_every=0, on_progress=None):
+    """在一個交易中產生 count 個設備 (編號從 start 開始)，回傳匯入器 (含統計)"""
+    generator = InventoryGenerator(seed)
+    with transaction.atomic():
+        generator.create_catalog()
+        importer = BulkDeviceImporter(
+            dedup_fields=(), batch_size=batch_size, progress_every=progress_every, on_progress=on_progress,
+        )
+        for data in generator.iter_devices(count, start):
+            importer.add(importer.type_id(data.pop('equipment_type')), **data)
+        importer.finish()
+    return importer
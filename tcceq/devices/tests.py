@@ -1,3 +1,1762 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from datetime import date, timedelta
+from unittest import skipIf, skipUnless
 
-# Create your tests here.
+import reportlab
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.http import Http404, HttpResponse
+from django.test import (
+    AsyncRequestFactory, LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from . import views
+from .asgismoke import run_smoke_test
+from .benchmarks import compare_results, summarize
+from .exports import (
+    JobReclaimed, claim_next_job, delete_expired_exports, fail_stale_jobs, report_progress, run_export_job,
+)
+from .importers import BulkDeviceImporter
+from .keys import DEVICE_FIELDS
+from .loadtest import Target, run_load
+from .management.commands.ingest_survey_csvs import expand_paths
+from .models import Devices, EquipmentCategory, EquipmentType, InventoryStat, RenderSlot, StickerExportJob
+from .pagecache import DATA_CHANGED_AT_KEY, bump_data_version, get_data_version
+from .pagination import CursorPaginator, encode_cursor, estimate_count
+from .pdfstream import StickerPDFWriter
+from .middleware import AsyncStreamingMiddleware, QueryBudgetMiddleware
+from .querycount import QueryCounter, install_dispatch
+from . import routers
+from .renderqueue import RenderQueue, RenderQueueFull, render_queue
+from .search import MAX_TERM_LENGTH, build_search_document, build_search_query, search_devices
+from .schedule import add_months, next_due, parse_months, window_range
+from .stats import compute_counts, dashboard_stats, refresh_stats
+from .stickers import (
+    ELLIPSIS, MAX_SPEC_LINES, MAX_TEXT_WIDTH, StickerCache, StickerPage, get_fonts, get_sticker_page, split_spec_lines,
+    sticker_cache, sticker_fingerprint, text_width, truncate,
+)
+from .survey_csv import iter_survey_devices
+from .synthetic import InventoryGenerator, generate_inventory
+from .utils import percentile
+
+
+def create_devices(count, start=0):
+    """建立 count 個設備，每個設備使用各自的設備種類與大類"""
+    for i in range(start, start + count):
+        category = EquipmentCategory.objects.create(name=f'大類{i}')
+        equipment_type = EquipmentType.objects.create(name=f'種類{i}', category=category)
+        Devices.objects.create(
+            equipment_type=equipment_type,
+            brand=f'廠牌{i}',
+            specification=f'規格{i}',
+            contractor_name=f'廠商{i}',
+            maintenance_name='維修人員',
+            maintenance_phone='0912345678',
+        )
+
+
+class QueryCountTestCase(TestCase):
+    """檢查各頁面的查詢次數固定，不隨資料筆數增加 (避免 N+1 查詢)"""
+
+    # 游標分頁在 PostgreSQL 上會多執行一次 EXPLAIN 估計總筆數
+    estimate_queries = 1 if connection.vendor == 'postgresql' else 0
+    # 產生貼紙 PDF 時讀取、取得與釋放名額 (devices.renderqueue)
+    render_slot_queries = 3
+
+    def setUp(self):
+        cache.clear()
+        sticker_cache.clear()
+        # 先建立名額，只計算每個請求固定的查詢
+        render_queue.stats()
+
+    def count_queries(self, request):
+        """執行 request() 並回傳查詢次數，串流回應會讀完內容再計算"""
+        with QueryCounter() as counter:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return counter.count
+
+    def assertConstantQueries(self, expected, request):
+        """資料為 3 筆與 13 筆時，查詢次數都必須等於 expected"""
+        create_devices(3)
+        self.assertEqual(self.count_queries(request), expected)
+        create_devices(10, start=3)
+        sticker_cache.clear()
+        self.assertEqual(self.count_queries(request), expected)
+
+    def test_device_list(self):
+        url = reverse('devices:device_list')
+        # 當頁設備、設備種類下拉選單
+        self.assertConstantQueries(2 + self.estimate_queries, lambda: self.client.get(url))
+
+    @override_settings(DEVICE_LIST_PAGINATION='page')
+    def test_device_list_page_numbers(self):
+        url = reverse('devices:device_list')
+        # COUNT、當頁設備、設備種類下拉選單
+        self.assertConstantQueries(3, lambda: self.client.get(url))
+
+    def test_device_detail(self):
+        create_devices(1)
+        device = Devices.objects.get()
+        url = reverse('devices:device_detail', args=[device.id])
+        self.assertEqual(self.count_queries(lambda: self.client.get(url)), 1)
+
+    def test_download_qrcodes(self):
+        url = reverse('devices:download_qrcodes')
+
+        def request(stream):
+            device_ids = list(Devices.objects.values_list('id', flat=True))
+            return lambda: self.client.post(url, {'device_ids': device_ids, 'stream': stream})
+
+        # exists()、讀取設備
+        expected = 2 + self.render_slot_queries
+        create_devices(3)
+        self.assertEqual(self.count_queries(request('0')), expected)
+        self.assertEqual(self.count_queries(request('1')), expected)
+        create_devices(10, start=3)
+        sticker_cache.clear()
+        self.assertEqual(self.count_queries(request('0')), expected)
+        self.assertEqual(self.count_queries(request('1')), expected)
+
+    def test_download_all_qrcodes(self):
+        url = reverse('devices:download_all_qrcodes')
+        # exists()、讀取設備
+        self.assertConstantQueries(2 + self.render_slot_queries, lambda: self.client.get(url, {'stream': '0'}))
+
+    def test_download_all_qrcodes_streaming(self):
+        url = reverse('devices:download_all_qrcodes')
+        self.assertConstantQueries(2 + self.render_slot_queries, lambda: self.client.get(url, {'stream': '1'}))
+
+    def test_export_devices(self):
+        url = reverse('devices:export_devices')
+        # 設備 (含設備種類與大類) 以一個查詢分批讀取
+        self.assertConstantQueries(1, lambda: self.client.get(url, {'format': 'jsonl'}))
+
+    def test_admin_changelist(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        url = reverse('admin:devices_devices_changelist')
+        # 工作階段、使用者、篩選用的設備種類、COUNT (兩次)、當頁設備、日期階層 (兩次)
+        self.assertConstantQueries(8, lambda: self.client.get(url))
+
+
+class DeviceListCacheTestCase(TestCase):
+    """設備列表頁的片段快取"""
+
+    def setUp(self):
+        cache.clear()
+        create_devices(3)
+        self.url = reverse('devices:device_list')
+
+    def test_cached_page_does_not_query(self):
+        self.client.get(self.url)
+        with QueryCounter() as counter:
+            response = self.client.get(self.url)
+        self.assertEqual(counter.count, 0)
+        self.assertContains(response, '廠牌0')
+
+    def test_search_whitespace_shares_cache(self):
+        self.client.get(self.url, {'search': '廠牌1'})
+        with QueryCounter() as counter:
+            self.client.get(self.url, {'search': '  廠牌1 '})
+        self.assertEqual(counter.count, 0)
+
+    def test_device_change_invalidates(self):
+        self.client.get(self.url)
+        device = Devices.objects.get(brand='廠牌0')
+        device.brand = '新廠牌'
+        device.save()
+        self.assertContains(self.client.get(self.url), '新廠牌')
+
+    def test_category_change_invalidates_type_options(self):
+        self.client.get(self.url)
+        EquipmentType.objects.filter(name='種類0').update(name='新種類')
+        # update() 不會觸發 signal，由大類的變更讓快取失效
+        EquipmentCategory.objects.first().save()
+        self.assertContains(self.client.get(self.url), '新種類')
+
+
+class DeviceDetailCacheTestCase(TestCase):
+    """設備詳細資料頁的快取與條件式 GET"""
+
+    def setUp(self):
+        cache.clear()
+        create_devices(1)
+        self.device = Devices.objects.get()
+        self.url = reverse('devices:device_detail', args=[self.device.id])
+
+    def test_cached_page_does_not_query(self):
+        self.client.get(self.url)
+        with QueryCounter() as counter:
+            response = self.client.get(self.url)
+        self.assertEqual(counter.count, 0)
+        self.assertContains(response, '廠牌0')
+
+    def test_etag_revalidation(self):
+        etag = self.client.get(self.url)['ETag']
+        with QueryCounter() as counter:
+            response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(counter.count, 0)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, headers={'if-modified-since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_device_change_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        self.device.brand = '新廠牌'
+        self.device.save()
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '新廠牌')
+
+    def test_type_change_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        equipment_type = self.device.equipment_type
+        equipment_type.name = '新種類'
+        equipment_type.save()
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertContains(response, '新種類')
+
+    def test_not_modified_response_headers(self):
+        response = self.client.get(self.url)
+        not_modified = self.client.get(self.url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+            self.assertEqual(not_modified[header], response[header])
+
+    def test_stale_validators_get_full_page(self):
+        response = self.client.get(self.url)
+        # If-None-Match 不符時不看 If-Modified-Since
+        stale = self.client.get(self.url, headers={
+            'if-none-match': '"stale"', 'if-modified-since': response['Last-Modified'],
+        })
+        self.assertEqual(stale.status_code, 200)
+        # 設備在 Last-Modified 之後修改過
+        Devices.objects.filter(id=self.device.id).update(updated_at=self.device.updated_at + timedelta(hours=1))
+        bump_data_version()
+        modified = self.client.get(self.url, headers={'if-modified-since': response['Last-Modified']})
+        self.assertEqual(modified.status_code, 200)
+        self.assertNotEqual(modified['Last-Modified'], response['Last-Modified'])
+
+    def test_missing_device(self):
+        response = self.client.get(reverse('devices:device_detail', args=[self.device.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkDeviceImporterTestCase(TestCase):
+
+    def add(self, importer, type_name, brand, specification):
+        return importer.add(
+            importer.type_id(type_name), brand=brand, specification=specification,
+            maintenance_name='維修人員', maintenance_phone='0912345678',
+        )
+
+    def test_import_with_constant_queries(self):
+        create_devices(1)
+        # 交易完成後的統計重新計算不計入匯入的查詢數
+        with self.captureOnCommitCallbacks(execute=True), QueryCounter() as counter:
+            importer = BulkDeviceImporter(batch_size=100)
+            for i in range(250):
+                self.add(importer, '種類0', f'廠牌{i}', f'規格{i}')
+            importer.finish()
+        # 載入種類、既有的自然鍵、既有設備，其餘為批次 INSERT (SQLite 會依參數上限再切分批次)
+        # 與每批的 savepoint
+        inserts = [sql for sql, _ in counter.queries if sql.startswith('INSERT')]
+        savepoints = [sql for sql, _ in counter.queries if 'SAVEPOINT' in sql]
+        self.assertEqual(len(savepoints), 6)
+        self.assertEqual(counter.count - len(inserts) - len(savepoints), 3)
+        self.assertLess(len(inserts), 25)
+        self.assertEqual(importer.created, 249)
+        self.assertEqual(importer.skipped, 1)
+        self.assertEqual(Devices.objects.count(), 250)
+        self.assertIn('規格10', Devices.objects.get(brand='廠牌10').search_document)
+
+    def test_dedup_within_batch_and_new_types(self):
+        importer = BulkDeviceImporter(dedup_fields=('specification',), skip_blank_keys=True)
+        self.assertTrue(self.add(importer, '新種類', 'A', '規格'))
+        self.assertFalse(self.add(importer, '新種類', 'B', '規格'))
+        self.assertTrue(self.add(importer, '新種類', 'C', ''))
+        self.assertTrue(self.add(importer, '新種類', 'D', ''))
+        importer.finish()
+        self.assertEqual(importer.types_created, 1)
+        self.assertEqual(Devices.objects.count(), 3)
+
+    def test_duplicate_natural_key_without_dedup(self):
+        importer = BulkDeviceImporter(dedup_fields=())
+        self.assertTrue(self.add(importer, '種類', 'A', '規格'))
+        self.assertFalse(self.add(importer, '種類', 'A', '規格'))
+        # 廠牌與規格都是空值的設備也依自然鍵判斷重複
+        self.assertTrue(self.add(importer, '種類', '', ''))
+        self.assertFalse(self.add(importer, '種類', '', ''))
+        importer.finish()
+        self.assertEqual((importer.created, importer.skipped), (2, 2))
+        self.assertEqual(Devices.objects.count(), 2)
+
+    def test_upsert_writes_only_changed_rows(self):
+        importer = BulkDeviceImporter(upsert=True)
+        for i in range(10):
+            self.add(importer, '種類', f'廠牌{i}', f'規格{i}')
+        importer.finish()
+        self.assertEqual(importer.created, 10)
+        device = Devices.objects.get(brand='廠牌3')
+        old_hash = device.content_hash
+
+        with QueryCounter() as counter:
+            importer = BulkDeviceImporter(upsert=True)
+            for i in range(10):
+                importer.add(
+                    importer.type_id('種類'), brand=f'廠牌{i}', specification=f'規格{i}',
+                    maintenance_name='維修人員', maintenance_phone='0911111111' if i == 3 else '0912345678',
+                )
+            self.add(importer, '種類', '廠牌10', '規格10')
+            importer.finish()
+        self.assertEqual((importer.created, importer.updated, importer.unchanged), (1, 1, 9))
+        # 載入種類、自然鍵、既有設備，新增與更新在同一個 INSERT ... ON CONFLICT 中
+        self.assertEqual(counter.count, 4)
+        self.assertEqual(Devices.objects.count(), 11)
+        device.refresh_from_db()
+        self.assertEqual(device.maintenance_phone, '0911111111')
+        self.assertNotEqual(device.content_hash, old_hash)
+
+    def test_save_keeps_content_hash_in_sync(self):
+        create_devices(1)
+        device = Devices.objects.get()
+        old_hash = device.content_hash
+        device.power_info = '220V'
+        device.save(update_fields=['power_info'])
+        device.refresh_from_db()
+        self.assertNotEqual(device.content_hash, old_hash)
+        importer = BulkDeviceImporter(upsert=True)
+        importer.add(
+            device.equipment_type_id, brand='廠牌0', specification='規格0', power_info='220V',
+            contractor_name='廠商0', maintenance_name='維修人員', maintenance_phone='0912345678',
+        )
+        self.assertEqual(importer.unchanged, 1)
+
+    def test_finish_invalidates_page_cache(self):
+        version = get_data_version()
+        importer = BulkDeviceImporter()
+        self.add(importer, '種類', 'A', '規格')
+        with self.captureOnCommitCallbacks(execute=True):
+            importer.finish()
+        self.assertNotEqual(get_data_version(), version)
+
+
+class ImportNdjsonTestCase(TestCase):
+    """import_devices 指令的 NDJSON 逐批匯入"""
+
+    def setUp(self):
+        EquipmentType.objects.create(name='冷氣')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = f'{directory}/devices.ndjson'
+
+    def record(self, i, **overrides):
+        record = {field: '' for field in DEVICE_FIELDS}
+        record.update(equipment_type='冷氣', brand=f'廠牌{i}', specification=f'規格{i}', date_installed='2024-01-15')
+        record.update(overrides)
+        return json.dumps(record, ensure_ascii=False)
+
+    def import_lines(self, lines, **options):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        out = io.StringIO()
+        call_command('import_devices', file=self.path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_errors_are_reported_by_line(self):
+        output = self.import_lines([
+            self.record(1),
+            '{"equipment_type": ',
+            self.record(2, equipment_type='不存在'),
+            json.dumps({'equipment_type': '冷氣'}),
+            self.record(3, date_installed='2024/01/15'),
+            self.record(4),
+        ], batch_size=2)
+        self.assertIn('第 2 行：JSON 格式錯誤', output)
+        self.assertIn('第 3 行：找不到設備類型: 不存在', output)
+        self.assertIn("第 4 行：缺少欄位: 'brand'", output)
+        self.assertIn('第 5 行：', output)
+        self.assertNotIn('第 1 行：', output)
+        self.assertIn('處理到第 6 行', output)
+        self.assertEqual(sorted(Devices.objects.values_list('brand', flat=True)), ['廠牌1', '廠牌4'])
+
+    def test_resume_from_line(self):
+        lines = [self.record(i) for i in range(1, 6)]
+        output = self.import_lines(lines, resume_from_line=3)
+        self.assertIn('開始從第 3 行匯入', output)
+        self.assertEqual(sorted(Devices.objects.values_list('brand', flat=True)), ['廠牌3', '廠牌4', '廠牌5'])
+
+        # 從頭重新匯入時，已匯入的設備視為重複
+        output = self.import_lines(lines)
+        self.assertIn('建立了 0 個設備種類、2 個設備，跳過 3 筆', output)
+        self.assertEqual(Devices.objects.count(), 5)
+
+    def test_duplicates_across_batches_use_per_batch_lookups(self):
+        create_devices(1)
+        lines = [self.record(i) for i in range(6)] + [self.record(2), self.record(0, equipment_type='種類0')]
+        with QueryCounter() as counter:
+            self.import_lines(lines, batch_size=2)
+        # 每批只查詢該批的自然鍵與重複鍵值，不載入全部現有設備
+        lookups = [sql for sql, _ in counter.queries if sql.startswith('SELECT') and 'natural_key' in sql]
+        self.assertEqual(len(lookups), 4)
+        self.assertTrue(all('IN' in sql for sql in lookups))
+        self.assertEqual(Devices.objects.filter(equipment_type__name='冷氣').count(), 6)
+        self.assertEqual(Devices.objects.count(), 7)
+
+
+class DuplicateDevicesTestCase(TestCase):
+    """同一個檔案中的重複設備與寫入時才發現的自然鍵衝突不會讓匯入失敗"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.directory = directory
+
+    def write_json(self, date_installed, count=2):
+        device = {field: '' for field in DEVICE_FIELDS}
+        device.update(equipment_type='冷氣', brand='大金', specification='RXV-50', date_installed=date_installed)
+        path = os.path.join(self.directory, 'devices.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'equipment_types': [{'name': '冷氣'}], 'devices': [device] * count}, file, ensure_ascii=False)
+        return path
+
+    def test_import_devices_skips_duplicate_rows(self):
+        out = io.StringIO()
+        call_command('import_devices', file=self.write_json('2024-01-15'), verbosity=2, stdout=out)
+        self.assertIn('建立了 1 個設備類型和 1 個設備', out.getvalue())
+        self.assertIn('設備已存在，跳過: 大金 - RXV-50', out.getvalue())
+        self.assertEqual(Devices.objects.count(), 1)
+
+    def test_load_sample_data_skips_duplicate_rows(self):
+        out = io.StringIO()
+        call_command('load_sample_data', file=self.write_json('2024/01/15'), stdout=out)
+        self.assertIn('新增了 1 個設備種類、1 個設備', out.getvalue())
+        self.assertIn('跳過了 1 個設備', out.getvalue())
+        self.assertEqual(Devices.objects.count(), 1)
+
+    def test_load_sample_data_ndjson_duplicates_across_batches(self):
+        EquipmentType.objects.create(name='冷氣')
+        device = {field: '' for field in DEVICE_FIELDS}
+        device.update(equipment_type='冷氣', brand='大金', specification='RXV-50', date_installed='2024/01/15')
+        path = os.path.join(self.directory, 'devices.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write((json.dumps(device, ensure_ascii=False) + '\n') * 3)
+        out = io.StringIO()
+        call_command('load_sample_data', file=path, batch_size=1, stdout=out)
+        self.assertIn('1 個設備，跳過 2 筆', out.getvalue())
+        self.assertEqual(Devices.objects.count(), 1)
+
+    def add_after_concurrent_write(self, importer):
+        # 另一個連線在匯入器載入現有設備之後寫入相同的設備
+        type_id = importer.type_id('冷氣')
+        importer.add(type_id, brand='日立', specification='RAS-28')
+        Devices.objects.create(equipment_type_id=type_id, brand='大金', specification='RXV-50')
+        importer.add(type_id, brand='大金', specification='RXV-50')
+        importer.finish()
+
+    def test_conflict_found_on_write_is_skipped(self):
+        conflicts = []
+        importer = BulkDeviceImporter(on_conflict=lambda device, error: conflicts.append(device.brand))
+        self.add_after_concurrent_write(importer)
+        self.assertEqual(conflicts, ['大金'])
+        self.assertEqual((importer.created, importer.skipped), (1, 1))
+        self.assertEqual(Devices.objects.count(), 2)
+
+    def test_conflict_without_dedup_is_skipped(self):
+        importer = BulkDeviceImporter(dedup_fields=())
+        self.add_after_concurrent_write(importer)
+        self.assertEqual((importer.created, importer.skipped), (1, 1))
+        self.assertEqual(Devices.objects.filter(brand='大金').count(), 1)
+
+    def test_save_rejects_duplicate(self):
+        equipment_type = EquipmentType.objects.create(name='冷氣')
+        Devices.objects.create(equipment_type=equipment_type, brand='大金', specification='RXV-50')
+        with self.assertRaisesMessage(ValidationError, '已有相同設備種類、廠牌及規格的設備'):
+            Devices.objects.create(equipment_type=equipment_type, brand='大金', specification='RXV-50')
+        other = Devices.objects.create(equipment_type=equipment_type, brand='日立', specification='RAS-28')
+        other.brand = '大金'
+        other.specification = 'RXV-50'
+        with self.assertRaises(ValidationError):
+            other.save()
+        # 自然鍵沒有改變時不檢查
+        other.refresh_from_db()
+        other.warranty_period = '一年'
+        other.save()
+        self.assertEqual(Devices.objects.count(), 2)
+
+
+SURVEY_CSV = """\ufeff一,太陽能模組,
+1,出廠/按裝日期,2025/8/25
+2,規格,380Wp
+3,使用電流及電壓,DC34.37V  /11.06A
+4,維修保養周期,每季
+5,施工廠商名稱及電話,固態能源科技股份有限公司 04-25131268
+6,安裝人員姓名及電話,固態 陳柏僥 04-25131268
+9,備註,屋頂
+,,
+二,變流器,
+1,出廠/按裝日期,2025年8月
+2,規格,70kVA
+,,
+三,變流器,
+2,規格,70kVA
+,,
+"""
+
+
+class SurveyCsvTestCase(TestCase):
+    """import_survey_csv 指令直接解析現場調查 CSV 並寫入資料庫"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'survey.csv')
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(SURVEY_CSV)
+
+    def test_iter_survey_devices(self):
+        unknown = []
+        with open(self.path, encoding='utf-8') as file:
+            devices = list(iter_survey_devices(file, lambda name, value: unknown.append((name, value))))
+        self.assertEqual(len(devices), 3)
+        self.assertEqual(devices[0]['equipment_type'], '太陽能模組')
+        self.assertEqual(devices[0]['contractor_name'], '固態能源科技股份有限公司')
+        self.assertEqual(devices[0]['contractor_phone'], '04-25131268')
+        self.assertEqual(devices[0]['installer_name'], '固態 陳柏僥')
+        self.assertEqual(unknown, [('備註', '屋頂')])
+        self.assertEqual(devices[2], {'equipment_type': '變流器', 'specification': '70kVA'})
+
+    def test_import(self):
+        out = io.StringIO()
+        call_command('import_survey_csv', file=self.path, stdout=out)
+        output = out.getvalue()
+        self.assertIn('新增了 2 個設備種類、2 個設備', output)
+        # 相同規格的設備只匯入一次，無法解析的日期使用預設日期
+        self.assertIn('跳過了 1 個設備', output)
+        self.assertIn('第 2 個設備：日期格式錯誤: 2025年8月', output)
+        device = Devices.objects.get(specification='380Wp')
+        self.assertEqual(device.equipment_type.name, '太陽能模組')
+        self.assertEqual(device.date_installed, date(2025, 8, 25))
+        self.assertEqual(device.maintenance_interval_months, 3)
+        self.assertIn('380wp', device.search_document)
+        self.assertEqual(Devices.objects.get(specification='70kVA').date_installed, date(2024, 1, 1))
+
+    def test_reimport_with_upsert(self):
+        call_command('import_survey_csv', file=self.path, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('import_survey_csv', file=self.path, upsert=True, stdout=out)
+        self.assertIn('新增了 0 個設備種類、0 個設備', out.getvalue())
+        self.assertIn('3 個設備內容未變更', out.getvalue())
+        self.assertEqual(Devices.objects.count(), 2)
+
+
+class IngestSurveyCsvsTestCase(TestCase):
+    """ingest_survey_csvs 指令以多個程序解析多個 CSV，在主程序中合併寫入"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.write('a.csv', SURVEY_CSV)
+        # 與 a.csv 重複的變流器，以及新的設備
+        self.write('b.csv', '一,變流器,\n2,規格,70kVA\n,,\n二,配電盤,\n2,規格,989.8kw\n')
+
+    def write(self, name, content, encoding='utf-8'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding=encoding) as file:
+            file.write(content)
+        return path
+
+    def test_expand_paths(self):
+        nested = os.path.join(self.directory, 'nested')
+        os.mkdir(nested)
+        with open(os.path.join(nested, 'c.csv'), 'w', encoding='utf-8'):
+            pass
+        a = os.path.join(self.directory, 'a.csv')
+        paths = expand_paths([self.directory, a, os.path.join(self.directory, '**', '*.csv')])
+        self.assertEqual(paths, [a, os.path.join(self.directory, 'b.csv'), os.path.join(nested, 'c.csv')])
+
+    def test_ingest_merges_files(self):
+        out = io.StringIO()
+        call_command('ingest_survey_csvs', self.directory, workers=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('共 2 個檔案，使用 2 個程序解析', output)
+        self.assertIn('a.csv: 16 行、3 個設備 (新增 2、跳過 1)', output)
+        # 重複檢查跨檔案合併
+        self.assertIn('b.csv: 5 行、2 個設備 (新增 1、跳過 1)', output)
+        self.assertIn('未知欄位: 備註 (1)', output)
+        self.assertIn('新增了 3 個設備種類、3 個設備，跳過 2 個', output)
+        self.assertEqual(
+            sorted(Devices.objects.values_list('specification', flat=True)), ['380Wp', '70kVA', '989.8kw'],
+        )
+
+    def test_unreadable_file_is_reported(self):
+        self.write('c.csv', '一,冷氣,\n2,規格,分離式\n', encoding='big5')
+        out = io.StringIO()
+        call_command('ingest_survey_csvs', self.directory, workers=2, stdout=out)
+        self.assertIn('c.csv: 無法解析', out.getvalue())
+        self.assertIn('1 個檔案無法解析', out.getvalue())
+        self.assertEqual(Devices.objects.count(), 3)
+
+    def test_missing_files(self):
+        with self.assertRaisesMessage(CommandError, '檔案不存在'):
+            call_command('ingest_survey_csvs', os.path.join(self.directory, 'missing.csv'))
+        with self.assertRaisesMessage(CommandError, '沒有符合的 CSV 檔案'):
+            call_command('ingest_survey_csvs', os.path.join(self.directory, '*.json'))
+
+
+class InventoryStatTestCase(TestCase):
+    """預先彙總的設備統計"""
+
+    def assertStatsMatchDevices(self):
+        stats = {(stat.dimension, stat.key): stat.count for stat in InventoryStat.objects.all()}
+        self.assertEqual(stats, dict(compute_counts(Devices.objects.all())))
+
+    def test_incremental_updates(self):
+        create_devices(3)
+        device = Devices.objects.order_by('id').first()
+        device.contractor_name = '廠商1'
+        device.date_installed = date(2020, 5, 1)
+        device.save()
+        self.assertStatsMatchDevices()
+        self.assertEqual(InventoryStat.objects.get(dimension='contractor', key='廠商1').count, 2)
+        self.assertFalse(InventoryStat.objects.filter(key='廠商0').exists())
+
+        device.equipment_type = EquipmentType.objects.get(name='種類2')
+        device.save(update_fields=['equipment_type'])
+        device.delete()
+        self.assertStatsMatchDevices()
+
+    def test_refresh_after_bulk_import(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            importer = BulkDeviceImporter()
+            type_id = importer.type_id('冷氣')
+            for i in range(5):
+                importer.add(type_id, brand=f'廠牌{i}', specification=f'規格{i}', contractor_name='廠商')
+            importer.finish()
+        self.assertStatsMatchDevices()
+        self.assertEqual(InventoryStat.objects.get(dimension='contractor', key='廠商').count, 5)
+        # 沒有偏差時不寫入
+        self.assertEqual(refresh_stats(), 0)
+
+    def test_stats_page(self):
+        create_devices(3)
+        url = reverse('devices:device_stats')
+        with QueryCounter() as counter:
+            response = self.client.get(url)
+        # 統計項目、設備種類 (含大類)
+        self.assertEqual(counter.count, 2)
+        self.assertContains(response, '大類1')
+        self.assertContains(response, '廠商2')
+        self.assertEqual(dashboard_stats()['total'], 3)
+
+
+class ExportDevicesTestCase(TestCase):
+
+    def setUp(self):
+        create_devices(3)
+
+    def export(self, **params):
+        response = self.client.get(reverse('devices:export_devices'), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_has_bom_and_header(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('devices.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertTrue(rows[0][0].startswith('\ufeff'))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][1:5], ['大類0', '種類0', '廠牌0', '規格0'])
+
+    def test_jsonl_uses_list_filters(self):
+        equipment_type = EquipmentType.objects.get(name='種類1')
+        response, content = self.export(format='jsonl', type=equipment_type.id)
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([record['brand'] for record in records], ['廠牌1'])
+
+        response, content = self.export(format='jsonl', search='廠牌2')
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([record['specification'] for record in records], ['規格2'])
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('devices:export_devices'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StickerEngineTestCase(TestCase):
+    """貼紙繪製引擎：依實際寬度截斷與分行，reportlab canvas 與逐頁輸出的內容相同"""
+
+    def test_truncate_by_width(self):
+        font = get_fonts()[1]
+        self.assertEqual(truncate('冷氣', font), '冷氣')
+        text = truncate('變頻分離式冷暖氣機' * 3, font)
+        self.assertTrue(text.endswith(ELLIPSIS))
+        self.assertLessEqual(text_width(text, font), MAX_TEXT_WIDTH)
+
+    def test_split_spec_lines(self):
+        font = get_fonts()[0]
+        spec = '變頻分離式冷暖氣機 RXV-50 (R32)'
+        lines = split_spec_lines(spec, font)
+        self.assertGreater(len(lines), 1)
+        self.assertEqual(''.join(lines), spec)
+        self.assertTrue(all(text_width(line, font) <= MAX_TEXT_WIDTH for line in lines))
+
+        lines = split_spec_lines(spec * 5, font)
+        self.assertEqual(len(lines), MAX_SPEC_LINES)
+        self.assertTrue(lines[-1].endswith(ELLIPSIS))
+        self.assertEqual(split_spec_lines('', font), [])
+
+    def test_canvas_and_stream_render_same_text(self):
+        create_devices(3)
+        url = reverse('devices:download_all_qrcodes')
+        texts = {}
+        for stream in ('0', '1'):
+            response = self.client.get(url, {'stream': stream})
+            data = b''.join(response.streaming_content) if response.streaming else response.content
+            texts[stream] = [
+                ' '.join(page.extract_text().split()) for page in PdfReader(io.BytesIO(data)).pages
+            ]
+        self.assertEqual(len(texts['0']), 3)
+        self.assertEqual(texts['0'], texts['1'])
+        self.assertIn('種類1', texts['0'][1])
+
+
+class StickerCacheTestCase(TestCase):
+    """貼紙頁面的快取：命中、未命中、設備變更時失效與程序共用的快取檔案"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(STICKER_CACHE_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory
+        sticker_cache.clear()
+        self.addCleanup(sticker_cache.clear)
+        create_devices(2)
+        self.device, self.other = Devices.objects.select_related('equipment_type').order_by('id')
+        self.url = 'http://testserver/devices/1/'
+
+    def test_hit_and_miss(self):
+        page = get_sticker_page(self.device, self.url)
+        self.assertIs(get_sticker_page(self.device, self.url), page)
+        self.assertEqual(len(sticker_cache), 1)
+        # 網址 (QR code 內容) 不同時重新產生
+        self.assertIsNot(get_sticker_page(self.device, 'http://example.com/devices/1/'), page)
+        self.assertEqual(len(sticker_cache), 1)
+
+    def test_device_save_invalidates(self):
+        page = get_sticker_page(self.device, self.url)
+        other_page = get_sticker_page(self.other, self.url)
+        self.device.brand = '新廠牌'
+        self.device.save()
+        self.assertIsNone(sticker_cache.get(self.device.id, page.fingerprint))
+        self.assertIs(sticker_cache.get(self.other.id, other_page.fingerprint), other_page)
+        self.assertEqual(get_sticker_page(self.device, self.url).brand_line, '新廠牌')
+
+    def test_stale_fingerprint_is_a_miss(self):
+        page = get_sticker_page(self.device, self.url)
+        # update() 不會送出 signal，快取的指紋與新的內容不符
+        Devices.objects.filter(id=self.device.id).update(specification='新規格')
+        device = Devices.objects.select_related('equipment_type').get(id=self.device.id)
+        self.assertIsNot(get_sticker_page(device, self.url), page)
+        self.assertEqual(get_sticker_page(device, self.url).spec_lines, ['新規格'])
+
+    def test_type_change_clears_all(self):
+        get_sticker_page(self.device, self.url)
+        get_sticker_page(self.other, self.url)
+        equipment_type = self.other.equipment_type
+        equipment_type.name = '新種類'
+        equipment_type.save()
+        self.assertEqual(len(sticker_cache), 0)
+
+    def test_files_shared_beyond_memory_limit(self):
+        # 另一個程序 (記憶體中沒有任何頁面、最多只保留一頁) 從檔案取得頁面
+        page = get_sticker_page(self.device, self.url)
+        get_sticker_page(self.other, self.url)
+        other_process = StickerCache(max_entries=1)
+        self.assertEqual(other_process.get(self.device.id, page.fingerprint).qr_ops, page.qr_ops)
+        self.assertIsNotNone(other_process.get(self.other.id, sticker_fingerprint(self.other, self.url)))
+        self.assertEqual(other_process.get(self.device.id, page.fingerprint).spec_lines, page.spec_lines)
+        self.assertEqual(len(other_process), 1)
+        # 指紋不同 (內容已變更) 時不使用檔案
+        self.assertIsNone(other_process.get(self.device.id, 'stale'))
+
+    def test_invalidate_removes_file_and_bad_files_are_misses(self):
+        page = get_sticker_page(self.device, self.url)
+        sticker_cache.invalidate(self.device.id)
+        self.assertIsNone(StickerCache(max_entries=1).get(self.device.id, page.fingerprint))
+
+        sticker_cache.set(self.device.id, page)
+        with open(sticker_cache._path(self.device.id), 'w') as file:
+            file.write('{')
+        with self.assertLogs('devices.stickers', 'WARNING'):
+            self.assertIsNone(StickerCache(max_entries=1).get(self.device.id, page.fingerprint))
+
+    def test_least_recently_used_is_evicted(self):
+        lru = StickerCache(max_entries=2, directory='')
+        pages = {i: StickerPage(f'fp{i}', '', '', '', []) for i in range(3)}
+        lru.set(0, pages[0])
+        lru.set(1, pages[1])
+        lru.get(0, 'fp0')
+        lru.set(2, pages[2])
+        self.assertIs(lru.get(0, 'fp0'), pages[0])
+        self.assertIsNone(lru.get(1, 'fp1'))
+        self.assertIs(lru.get(2, 'fp2'), pages[2])
+
+
+class StickerPdfStreamTestCase(TestCase):
+    """逐頁輸出的貼紙 PDF (devices.pdfstream) 能被一般的 PDF 閱讀器解析
+
+    pdfstream 使用 reportlab 的內部函式，升級 reportlab 後需確認這些測試仍通過
+    """
+
+    def assertValidPdf(self, data, page_count):
+        reader = PdfReader(io.BytesIO(data), strict=True)
+        self.assertEqual(len(reader.pages), page_count)
+        # 交互參照表的每個位置都必須指向對應編號的物件開頭
+        xref_offset = int(re.search(rb'startxref\n(\d+)\n%%EOF', data)[1])
+        table = data[xref_offset:].split(b'trailer')[0].splitlines()
+        self.assertEqual(table[:2], [b'xref', b'0 %d' % (len(table) - 2)])
+        for obj_id, entry in enumerate(table[3:], 1):
+            offset = int(entry.split()[0])
+            self.assertTrue(data[offset:].startswith(b'%d 0 obj\n' % obj_id), f'物件 {obj_id} 的位置錯誤')
+        return reader
+
+    @override_settings(STICKER_STREAM_CHUNK_SIZE=2)
+    def test_download_all_qrcodes_stream(self):
+        create_devices(5)
+        Devices.objects.filter(brand='廠牌3').update(specification='變頻分離式「一對一」(R32) 冷暖型')
+        response = self.client.get(reverse('devices:download_all_qrcodes'), {'stream': '1'})
+        self.assertTrue(response.streaming)
+        reader = self.assertValidPdf(b''.join(response.streaming_content), 5)
+        texts = [page.extract_text() for page in reader.pages]
+        self.assertIn('種類0', texts[0])
+        self.assertIn('廠牌4', texts[4])
+        self.assertIn('變頻分離式', texts[3])
+
+    def test_truetype_font_subsets(self):
+        # 超過 256 個字元時 TrueType 字型分成多個子集
+        font_path = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+        pdfmetrics.registerFont(TTFont('Vera', font_path))
+        characters = ''.join(sorted(
+            chr(code) for code in pdfmetrics.getFont('Vera').face.charToGlyph
+            if code < 0xfff0 and chr(code).isprintable() and not chr(code).isspace()
+        ))
+        lines = [characters[i:i + 10] for i in range(0, len(characters), 10)]
+        writer = StickerPDFWriter(fonts=('Vera', 'Vera'))
+        data = writer.begin()
+        for i in range(0, len(lines), 3):
+            data += writer.add_page(StickerPage('', '', 'Vera', lines[i], lines[i + 1:i + 3]))
+        data += writer.finish()
+
+        reader = self.assertValidPdf(data, writer.page_count)
+        self.assertIn('/F1+1', reader.pages[-1]['/Resources']['/Font'])
+        text = ''.join(page.extract_text() for page in reader.pages)
+        for line in lines:
+            self.assertIn(line, text)
+
+
+class RenderStickersTestCase(TransactionTestCase):
+    """render_stickers 指令以多個程序繪製分片並合併
+
+    子程序使用自己的資料庫連線，資料必須已經提交
+    """
+
+    def setUp(self):
+        create_devices(5)
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+
+    def page_count(self, filename):
+        return len(PdfReader(os.path.join(self.output_dir, filename), strict=True).pages)
+
+    def test_workers_and_merge(self):
+        out = io.StringIO()
+        call_command(
+            'render_stickers', workers=2, shard_size=2, merge=True, output_dir=self.output_dir, stdout=out,
+        )
+        self.assertIn('共 5 頁', out.getvalue())
+        self.assertEqual(
+            sorted(os.listdir(self.output_dir)),
+            ['stickers_0001.pdf', 'stickers_0002.pdf', 'stickers_0003.pdf', 'stickers_all.pdf'],
+        )
+        self.assertEqual([self.page_count(f'stickers_{n:04d}.pdf') for n in (1, 2, 3)], [2, 2, 1])
+        reader = PdfReader(os.path.join(self.output_dir, 'stickers_all.pdf'), strict=True)
+        self.assertEqual(len(reader.pages), 5)
+        # 合併的 PDF 依設備 id 排序
+        self.assertIn('廠牌0', reader.pages[0].extract_text())
+        self.assertIn('廠牌4', reader.pages[4].extract_text())
+
+
+class SnapshotTestCase(TransactionTestCase):
+    """以 COPY 匯出與還原設備資料快照
+
+    匯出時以 SET TRANSACTION 設定隔離等級，必須是交易中的第一個查詢，不能在 TestCase 的交易中執行
+    """
+
+    def setUp(self):
+        create_devices(3)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'snapshot.copy.gz')
+
+    def rows(self):
+        return list(Devices.objects.order_by('id').values_list(
+            'id', 'equipment_type__name', 'brand', 'specification', 'natural_key', 'search_document',
+        ))
+
+    @skipUnless(connection.vendor == 'postgresql', '快照只支援 PostgreSQL')
+    def test_export_and_restore(self):
+        device = Devices.objects.get(brand='廠牌1')
+        device.specification = '含反斜線\\N、\t定位字元\n與換行'
+        device.save()
+        expected = self.rows()
+        call_command('export_snapshot', file=self.path, stdout=io.StringIO())
+
+        Devices.objects.filter(brand='廠牌0').delete()
+        Devices.objects.filter(brand='廠牌2').update(brand='已修改')
+        create_devices(1, start=3)
+        version = get_data_version()
+
+        out = io.StringIO()
+        call_command('restore_snapshot', file=self.path, stdout=out)
+        self.assertIn('devices_devices: 3 筆', out.getvalue())
+        self.assertEqual(self.rows(), expected)
+        self.assertFalse(EquipmentType.objects.filter(name='種類3').exists())
+        # 還原後快取失效、統計重新計算、自動編號接續最大的 id
+        self.assertNotEqual(get_data_version(), version)
+        self.assertEqual(InventoryStat.objects.get(dimension='contractor', key='廠商0').count, 1)
+        create_devices(1, start=4)
+        self.assertGreater(Devices.objects.get(brand='廠牌4').id, expected[-1][0])
+
+    @skipUnless(connection.vendor == 'postgresql', '快照只支援 PostgreSQL')
+    def test_rejects_other_files_and_schemas(self):
+        with gzip.open(self.path, 'wb') as output:
+            output.write(b'{"format": "other"}\n')
+        with self.assertRaisesMessage(CommandError, '不是設備資料快照檔案'):
+            call_command('restore_snapshot', file=self.path)
+
+        # 以較舊的 migration 匯出的快照
+        call_command('export_snapshot', file=self.path, stdout=io.StringIO())
+        with gzip.open(self.path, 'rb') as snapshot:
+            header, data = json.loads(snapshot.readline()), snapshot.read()
+        header['schema'] = '0001_initial'
+        with gzip.open(self.path, 'wb') as output:
+            output.write(json.dumps(header).encode('utf-8') + b'\n' + data)
+        with self.assertRaisesMessage(CommandError, '請先執行 migrate'):
+            call_command('restore_snapshot', file=self.path)
+        self.assertEqual(Devices.objects.count(), 3)
+
+        call_command('restore_snapshot', file=self.path, ignore_schema=True, stdout=io.StringIO())
+        self.assertEqual(Devices.objects.count(), 3)
+
+    @skipIf(connection.vendor == 'postgresql', '只在其他資料庫檢查')
+    def test_requires_postgresql(self):
+        with self.assertRaisesMessage(CommandError, '只支援 PostgreSQL'):
+            call_command('export_snapshot', file=self.path)
+
+
+class TemporaryMediaMixin:
+    """測試產生的檔案寫到暫存目錄"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class StickerExportJobTestCase(TemporaryMediaMixin, TransactionTestCase):
+    """背景貼紙匯出工作：建立、工作程序產生 PDF、查詢進度、下載
+
+    工作程序每次取得工作前會呼叫 close_old_connections，不能在 TestCase 的交易中執行
+    """
+
+    def setUp(self):
+        super().setUp()
+        create_devices(3)
+
+    def run_job(self, data):
+        response = self.client.post(reverse('devices:create_export_job'), data)
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], StickerExportJob.STATUS_PENDING)
+
+        call_command('run_export_worker', once=True, stdout=io.StringIO())
+        return self.client.get(status_url).json()
+
+    def test_worker_completes_job(self):
+        status = self.run_job({'all': '1'})
+        self.assertEqual(status['status'], StickerExportJob.STATUS_DONE)
+        self.assertEqual((status['done'], status['total']), (3, 3))
+
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('all_devices_qr_stickers.pdf', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_selected_devices(self):
+        device_ids = list(Devices.objects.order_by('id').values_list('id', flat=True)[:2])
+        status = self.run_job({'device_ids': device_ids})
+        self.assertEqual(status['total'], 2)
+        job = StickerExportJob.objects.get()
+        self.assertEqual(job.device_ids, device_ids)
+
+    def test_requires_devices(self):
+        response = self.client.post(reverse('devices:create_export_job'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StickerExportJob.objects.exists())
+
+    def test_unfinished_job_cannot_be_downloaded(self):
+        job = StickerExportJob.objects.create(base_url='http://testserver')
+        response = self.client.get(reverse('devices:download_export_job', args=[job.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_running_job_is_failed(self):
+        StickerExportJob.objects.create(base_url='http://testserver')
+        job = claim_next_job()
+        self.assertEqual(fail_stale_jobs(), 0)
+
+        # 工作程序中止：心跳停在很久以前
+        StickerExportJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(fail_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StickerExportJob.STATUS_FAILED)
+        self.assertIn('沒有回報進度', job.error)
+        self.assertEqual(self.client.get(reverse('devices:export_job_status', args=[job.id])).json()['status'], 'failed')
+
+        # 原本的工作程序若仍在執行，回報進度時會停止，不會覆寫失敗狀態
+        with self.assertRaises(JobReclaimed):
+            report_progress(job, done=1)
+
+    def test_reclaimed_job_does_not_finish(self):
+        StickerExportJob.objects.create(base_url='http://testserver')
+        job = claim_next_job()
+        StickerExportJob.objects.filter(id=job.id).update(status=StickerExportJob.STATUS_FAILED)
+        job = run_export_job(job)
+        self.assertEqual(job.status, StickerExportJob.STATUS_FAILED)
+        self.assertFalse(job.file)
+        self.assertEqual(os.listdir(settings.MEDIA_ROOT), [])
+
+    def test_expired_exports_are_deleted(self):
+        status = self.run_job({'all': '1'})
+        job = StickerExportJob.objects.get()
+        path = job.file.path
+        # 工作程序中止時留下的不完整檔案
+        leftover = os.path.join(os.path.dirname(path), 'stickers_job_999.pdf')
+        with open(leftover, 'wb') as output:
+            output.write(b'%PDF')
+
+        self.assertEqual(delete_expired_exports(), (0, 0))
+        self.assertEqual(self.client.get(status['download_url']).status_code, 200)
+
+        old = time.time() - 2 * 24 * 3600
+        os.utime(leftover, (old, old))
+        StickerExportJob.objects.update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(delete_expired_exports(), (1, 2))
+        self.assertFalse(StickerExportJob.objects.exists())
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
+
+    def test_device_list_has_sync_download_limit(self):
+        with override_settings(STICKER_EXPORT_SYNC_LIMIT=7):
+            response = self.client.get(reverse('devices:device_list'))
+        self.assertContains(response, 'const EXPORT_SYNC_LIMIT = 7;')
+
+
+class StickerExportJobClaimTestCase(TransactionTestCase):
+    """多個工作程序以 SELECT ... FOR UPDATE SKIP LOCKED 取得工作，不會取得同一個工作"""
+
+    def setUp(self):
+        self.jobs = [StickerExportJob.objects.create(base_url='http://testserver') for _ in range(2)]
+
+    def test_each_claim_gets_a_different_job(self):
+        first, second = claim_next_job(), claim_next_job()
+        self.assertEqual({first.id, second.id}, {job.id for job in self.jobs})
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(StickerExportJob.objects.filter(status=StickerExportJob.STATUS_RUNNING).count(), 2)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_locked_job_is_skipped(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def other_worker():
+            # 另一個工作程序正在取得第一個工作 (交易尚未完成)
+            try:
+                with transaction.atomic():
+                    StickerExportJob.objects.select_for_update().get(id=self.jobs[0].id)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            job = claim_next_job()
+        finally:
+            release.set()
+            thread.join()
+        # 不等待被鎖定的工作，直接取得下一個
+        self.assertEqual(job.id, self.jobs[1].id)
+
+
+class SearchDocumentTestCase(SimpleTestCase):
+    """search_document 的後綴詞與使用者輸入轉成的前綴查詢"""
+
+    def test_document_contains_every_suffix(self):
+        document = build_search_document('Daikin', '變頻分離式 RXV-50', None).split()
+        self.assertEqual(document[:6], ['daikin', 'aikin', 'ikin', 'kin', 'in', 'n'])
+        self.assertIn('分離式', document)
+        self.assertIn('xv', document)
+        # 重複的詞只保留一次
+        self.assertEqual(len(document), len(set(document)))
+        self.assertEqual(build_search_document('', None), '')
+
+    def test_long_terms_are_truncated(self):
+        document = build_search_document('a' * 40).split()
+        self.assertEqual(max(map(len, document)), MAX_TERM_LENGTH)
+
+    def query_text(self, search_query):
+        query = build_search_query(search_query)
+        return None if query is None else query.source_expressions[0].value
+
+    def test_query_escapes_user_input(self):
+        self.assertEqual(self.query_text('Daikin 分離式'), "'daikin':* & '分離式':*")
+        self.assertEqual(self.query_text("O'Brien & co:* !x|y"), "'o':* & 'brien':* & 'co':* & 'x':* & 'y':*")
+
+    def test_query_without_terms(self):
+        for search_query in ('', '   ', "'\"&:!|()*"):
+            self.assertIsNone(self.query_text(search_query))
+
+
+class SearchDevicesTestCase(TestCase):
+    """search_devices 在 PostgreSQL 上使用 search_document 的前綴查詢，其他資料庫使用 icontains"""
+
+    def setUp(self):
+        create_devices(3)
+        device = Devices.objects.get(brand='廠牌1')
+        device.brand = 'Daikin'
+        device.specification = '變頻分離式 RXV-50'
+        device.save()
+
+    def search(self, search_query):
+        return sorted(search_devices(Devices.objects.all(), search_query).values_list('brand', flat=True))
+
+    def test_suffix_and_infix_matches(self):
+        self.assertEqual(self.search('分離'), ['Daikin'])
+        self.assertEqual(self.search('離式'), ['Daikin'])
+        self.assertEqual(self.search('aik'), ['Daikin'])
+        self.assertEqual(self.search('rxv'), ['Daikin'])
+        self.assertEqual(self.search('牌2'), ['廠牌2'])
+        self.assertEqual(self.search('不存在'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', '前綴查詢只用於 PostgreSQL')
+    def test_tsquery_syntax_in_input(self):
+        self.assertEqual(self.search("daikin & 'rxv"), ['Daikin'])
+        self.assertEqual(self.search('daikin:* | !rxv'), ['Daikin'])
+        self.assertEqual(self.search('牌0 廠商0'), ['廠牌0'])
+        self.assertEqual(self.search("'&:!"), [])
+
+    @skipUnless(connection.vendor == 'postgresql', '前綴查詢只用於 PostgreSQL')
+    def test_results_ordered_by_rank(self):
+        devices = search_devices(Devices.objects.all(), '廠牌')
+        self.assertEqual(list(devices.values_list('brand', flat=True)), ['廠牌0', '廠牌2'])
+        self.assertTrue(all(rank > 0 for rank in devices.values_list('rank', flat=True)))
+
+
+class CursorPaginatorTestCase(TestCase):
+    """游標分頁：前後翻頁、排序值相同的資料、無效的游標"""
+
+    @classmethod
+    def setUpTestData(cls):
+        equipment_type = EquipmentType.objects.create(name='冷氣')
+        # 每三個設備的安裝日期相同
+        Devices.objects.bulk_create([
+            Devices(
+                equipment_type=equipment_type, brand=f'廠牌{i}', date_installed=date(2024, 1, 1 + i // 3),
+                natural_key=f'{i}',
+            )
+            for i in range(10)
+        ])
+        cls.ids = list(Devices.objects.order_by('id').values_list('id', flat=True))
+
+    def pages(self, paginator, cursor=None):
+        """從 cursor 開始往後翻到最後一頁，回傳每一頁"""
+        pages = [paginator.get_page(cursor)]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return pages
+
+    def ids_of(self, page):
+        return [device.id for device in page]
+
+    def test_next_and_previous(self):
+        paginator = CursorPaginator(Devices.objects.all(), 4)
+        pages = self.pages(paginator)
+        self.assertEqual([self.ids_of(page) for page in pages], [self.ids[:4], self.ids[4:8], self.ids[8:]])
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[1].has_previous())
+
+        # 從最後一頁往前翻
+        previous = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(self.ids_of(previous), self.ids[4:8])
+        self.assertTrue(previous.has_next())
+        first = paginator.get_page(previous.previous_cursor)
+        self.assertEqual(self.ids_of(first), self.ids[:4])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_ties_on_ordering_key(self):
+        paginator = CursorPaginator(Devices.objects.all(), 2, ordering=('-date_installed', 'id'))
+        pages = self.pages(paginator)
+        expected = list(Devices.objects.order_by('-date_installed', 'id').values_list('id', flat=True))
+        # 相同日期的設備跨頁時不會重複或遺漏
+        self.assertEqual([device_id for page in pages for device_id in self.ids_of(page)], expected)
+        self.assertEqual(len(pages), 5)
+
+        previous = paginator.get_page(pages[3].previous_cursor)
+        self.assertEqual(self.ids_of(previous), self.ids_of(pages[2]))
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = CursorPaginator(Devices.objects.all(), 4, ordering=('-date_installed', 'id'))
+        first = self.ids_of(paginator.get_page())
+        for cursor in ('不是游標', 'e30', encode_cursor([1], 'n'), encode_cursor(['x', 'y'], 'n'),
+                       encode_cursor([{'a': 1}, [2]], 'p'), encode_cursor(['2024-01-02', 1], 'x')):
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual(self.ids_of(page), first)
+                self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor_in_device_list(self):
+        response = self.client.get(reverse('devices:device_list'), {'cursor': encode_cursor(['x'], 'n')})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '廠牌0')
+
+    def test_estimate_count(self):
+        estimate = estimate_count(Devices.objects.all())
+        if connection.vendor == 'postgresql':
+            self.assertIsInstance(estimate, int)
+        else:
+            # 只有 PostgreSQL 能以 EXPLAIN 估計，其他資料庫不執行查詢
+            with self.assertNumQueries(0):
+                self.assertIsNone(estimate_count(Devices.objects.all()))
+
+
+class ScheduleParserTestCase(SimpleTestCase):
+
+    def test_parse_months(self):
+        cases = {
+            '每月': 1, '每季': 3, '每半年': 6, '半年': 6, '一年': 12, '每年': 12, '3年保固': 36,
+            '保固５年': 60, '兩年半': 30, '18個月': 18, '十二個月': 12, '每年2次': 6, '一年兩次': 6,
+        }
+        for text, months in cases.items():
+            self.assertEqual(parse_months(text), months, text)
+        for text in ('', None, '無', '每週', '2025年', '每年7次'):
+            self.assertIsNone(parse_months(text), text)
+
+    def test_next_due_keeps_day_of_month(self):
+        # 1/31 安裝、每月保養：2 月為月底，之後仍是 31 日
+        self.assertEqual(next_due(date(2024, 1, 31), 1, date(2024, 2, 10)), date(2024, 2, 29))
+        self.assertEqual(next_due(date(2024, 1, 31), 1, date(2024, 3, 1)), date(2024, 3, 31))
+        # 第一次保養在安裝後一個周期
+        self.assertEqual(next_due(date(2024, 5, 1), 12, date(2024, 5, 1)), date(2025, 5, 1))
+
+    def test_window_range(self):
+        today = date(2026, 11, 18)
+        self.assertEqual(window_range('month', today), (date(2026, 11, 1), date(2026, 12, 1)))
+        self.assertEqual(window_range('next_month', today), (date(2026, 12, 1), date(2027, 1, 1)))
+        self.assertEqual(window_range('quarter', today), (date(2026, 10, 1), date(2027, 1, 1)))
+        self.assertEqual(window_range('past', today), (None, today))
+
+
+class MaintenanceScheduleTestCase(TestCase):
+
+    def setUp(self):
+        create_devices(3)
+        self.today = timezone.localdate()
+        devices = Devices.objects.order_by('id')
+        # 今年需保養、保固已過期
+        self.due = devices[0]
+        self.due.date_installed = add_months(self.today, -12)
+        self.due.maintenance_cycle = '每月'
+        self.due.warranty_period = '半年'
+        self.due.save()
+        # 明年才需保養，保固在三年後到期
+        self.later = devices[1]
+        self.later.date_installed = self.today
+        self.later.maintenance_cycle = '每年'
+        self.later.warranty_period = '3年保固'
+        self.later.save()
+
+    def test_save_computes_schedule(self):
+        self.due.refresh_from_db()
+        self.assertEqual(self.due.maintenance_interval_months, 1)
+        self.assertGreaterEqual(self.due.next_maintenance_due, self.today)
+        self.assertEqual(self.due.warranty_expires, add_months(self.due.date_installed, 6))
+        self.later.refresh_from_db()
+        self.assertEqual(self.later.warranty_expires.year, self.today.year + 3)
+
+        self.later.warranty_period = '無'
+        self.later.save(update_fields=['warranty_period'])
+        self.later.refresh_from_db()
+        self.assertIsNone(self.later.warranty_months)
+        self.assertIsNone(self.later.warranty_expires)
+
+    def test_list_and_export_filters(self):
+        response = self.client.get(reverse('devices:device_list'), {'warranty_expires': 'past'})
+        self.assertContains(response, '廠牌0')
+        self.assertNotContains(response, '廠牌1')
+        self.assertNotContains(response, '廠牌2')
+
+        response = self.client.get(reverse('devices:export_devices'), {'format': 'jsonl', 'maintenance_due': 'year'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual({record['brand'] for record in records}, {'廠牌0'})
+
+        # 無效的篩選值忽略
+        response = self.client.get(reverse('devices:device_list'), {'warranty_expires': 'soon'})
+        self.assertContains(response, '廠牌2')
+
+    def test_refresh_rolls_due_date_forward(self):
+        stale = self.due.updated_at - timedelta(days=1)
+        Devices.objects.filter(pk=self.due.pk).update(next_maintenance_due=date(2000, 1, 1), updated_at=stale)
+        Devices.objects.filter(pk=self.later.pk).update(updated_at=stale)
+        out = io.StringIO()
+        call_command('refresh_schedules', stdout=out)
+        self.assertIn('已更新 1 個設備', out.getvalue())
+        self.due.refresh_from_db()
+        self.assertGreaterEqual(self.due.next_maintenance_due, self.today)
+        # 詳細資料頁的 Last-Modified 隨排程日期更新，未變更的設備不動
+        self.assertGreater(self.due.updated_at, stale)
+        self.later.refresh_from_db()
+        self.assertEqual(self.later.updated_at, stale)
+
+        # 沒有過期的日期時不寫入
+        call_command('refresh_schedules', stdout=out)
+        self.assertIn('已更新 0 個設備', out.getvalue())
+        call_command('refresh_schedules', '--all', stdout=out)
+        self.assertIn('已更新 0 個設備', out.getvalue())
+
+
+class SyntheticInventoryTestCase(TestCase):
+
+    def test_same_seed_same_data(self):
+        devices = list(InventoryGenerator(seed=1).iter_devices(1500))
+        self.assertEqual(devices, list(InventoryGenerator(seed=1).iter_devices(1500)))
+        self.assertNotEqual(devices, list(InventoryGenerator(seed=2).iter_devices(1500)))
+        # 從任意編號接續產生的資料相同
+        self.assertEqual(devices[990:1010], list(InventoryGenerator(seed=1).iter_devices(20, start=990)))
+
+    def test_generate_inventory(self):
+        importer = generate_inventory(200, seed=3)
+        self.assertEqual(importer.created, 200)
+        self.assertEqual(Devices.objects.count(), 200)
+        self.assertFalse(EquipmentType.objects.filter(category__isnull=True).exists())
+        for field in ('installer_name', 'maintenance_phone', 'contractor_name'):
+            self.assertLessEqual(
+                max(len(value) for value in Devices.objects.values_list(field, flat=True)),
+                Devices._meta.get_field(field).max_length,
+            )
+
+
+class LoadTestTestCase(LiveServerTestCase):
+
+    def test_browse_and_download(self):
+        create_devices(15)
+        target = Target(
+            self.live_server_url,
+            device_ids=Devices.objects.values_list('id', flat=True),
+            type_ids=EquipmentType.objects.values_list('id', flat=True),
+            search_terms=['廠牌1'],
+            paths={
+                'device_list': reverse('devices:device_list'),
+                'device_detail': reverse('devices:device_detail', args=[0]).replace('/0/', '/{id}/'),
+                'download_qrcodes': reverse('devices:download_qrcodes'),
+            },
+        )
+        results, elapsed = run_load(target, 'browse', concurrency=2, duration=None, max_requests=6, seed=1)
+        results_download, elapsed = run_load(
+            target, 'download', concurrency=1, duration=None, max_requests=1, seed=1, qrcode_count=2,
+        )
+        summary = {**results.summary(elapsed), **results_download.summary(elapsed)}
+        self.assertIn('download_qrcodes', summary)
+        self.assertGreaterEqual(sum(stats['requests'] for stats in summary.values()), 7)
+        self.assertEqual([endpoint for endpoint, stats in summary.items() if stats['errors']], [])
+
+
+class AsyncViewsTestCase(TestCase):
+    """ASGI 部署使用的非同步設備列表與詳細資料頁"""
+
+    estimate_queries = QueryCountTestCase.estimate_queries
+
+    def setUp(self):
+        cache.clear()
+        create_devices(3)
+        self.device = Devices.objects.order_by('id').first()
+        self.factory = AsyncRequestFactory()
+
+    async def call(self, view, *args, **headers):
+        """呼叫非同步檢視，回傳 (回應, 查詢次數)"""
+        await sync_to_async(install_dispatch)()
+        async with QueryCounter() as counter:
+            response = await view(self.factory.get('/', headers=headers), *args)
+        return response, counter.count
+
+    async def test_device_detail(self):
+        response, queries = await self.call(views.device_detail_async, self.device.id)
+        self.assertEqual(queries, 1)
+        self.assertContains(response, '廠牌0')
+        # 第二次從快取取得，ETag 相同時回傳 304
+        response, queries = await self.call(views.device_detail_async, self.device.id, if_none_match=response['ETag'])
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_device_detail_matches_sync_view(self):
+        response, _ = await self.call(views.device_detail_async, self.device.id)
+        sync_response = await sync_to_async(self.client.get)(reverse('devices:device_detail', args=[self.device.id]))
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+
+    async def test_missing_device(self):
+        with self.assertRaises(Http404):
+            await self.call(views.device_detail_async, self.device.id + 100)
+
+    async def test_device_list(self):
+        response, queries = await self.call(views.device_list_async)
+        # 當頁設備、設備種類下拉選單
+        self.assertEqual(queries, 2 + self.estimate_queries)
+        self.assertContains(response, '廠牌2')
+        self.assertContains(response, '種類2')
+        response, queries = await self.call(views.device_list_async)
+        self.assertEqual(queries, 0)
+
+    @override_settings(DEVICE_LIST_PAGINATION='page')
+    async def test_device_list_page_numbers(self):
+        response, queries = await self.call(views.device_list_async)
+        # COUNT、當頁設備、設備種類下拉選單
+        self.assertEqual(queries, 3)
+        self.assertContains(response, '廠牌1')
+
+    @override_settings(DEBUG=True)
+    async def test_middleware_counts_async_queries(self):
+        async def get_response(request):
+            await Devices.objects.acount()
+            return HttpResponse()
+
+        await sync_to_async(install_dispatch)()
+        response = await QueryBudgetMiddleware(get_response)(self.factory.get('/'))
+        self.assertEqual(response['X-DB-Queries'], '1')
+
+    async def test_smoke_test(self):
+        device_ids = [device_id async for device_id in Devices.objects.values_list('id', flat=True)]
+        results, elapsed, stats = await run_smoke_test(
+            device_ids,
+            paths={
+                'device_list': reverse('devices:device_list'),
+                'device_detail': reverse('devices:device_detail', args=[0]).replace('/0/', '/{id}/'),
+            },
+            requests=20, concurrency=5, list_ratio=0.5, search_terms=['廠牌1'], seed=1,
+        )
+        summary = results.summary(elapsed)
+        self.assertEqual(sum(endpoint_stats['requests'] for endpoint_stats in summary.values()), 20)
+        self.assertEqual([endpoint for endpoint, endpoint_stats in summary.items() if endpoint_stats['errors']], [])
+        self.assertLessEqual(stats['max_in_flight'], 5)
+
+
+class AsgiStreamingTestCase(TransactionTestCase):
+    """ASGI 下的串流回應逐塊輸出，不會先讀進記憶體，也不佔用共用的同步執行緒
+
+    串流內容在另一個執行緒 (另一條資料庫連線) 中讀取，資料必須先提交，因此使用 TransactionTestCase
+    """
+
+    def setUp(self):
+        cache.clear()
+        create_devices(5)
+        self.factory = AsyncRequestFactory()
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_export_is_streamed_asynchronously(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get(reverse('devices:export_devices'), {'format': 'jsonl'})
+            self.assertTrue(response.is_async)
+            content = await self.read(response)
+        self.assertEqual(len(content.splitlines()), 5)
+        # 沒有退回 sync_to_async(list) 讀取整個內容
+        self.assertFalse([warning for warning in caught if 'StreamingHttpResponse' in str(warning.message)])
+
+    @override_settings(STICKER_RENDER_WORKERS=1, STICKER_RENDER_QUEUE=2, STICKER_RENDER_QUEUE_TIMEOUT=10)
+    async def test_queued_download_does_not_block_other_requests(self):
+        view = AsyncStreamingMiddleware(views.download_all_qrcodes_async)
+        first = await view(self.factory.get('/'))
+        self.assertTrue(first.is_async)
+
+        # 第二個下載在佇列中等待第一個 PDF 輸出完畢
+        second = asyncio.ensure_future(view(self.factory.get('/')))
+        await asyncio.sleep(0.2)
+        self.assertFalse(second.done())
+        # 等待中的下載不佔用共用的同步執行緒，其他查詢照常執行
+        count = await asyncio.wait_for(sync_to_async(Devices.objects.count)(), 2)
+        self.assertEqual(count, 5)
+
+        pdf = await self.read(first)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertTrue(pdf.rstrip().endswith(b'%%EOF'))
+        second = await asyncio.wait_for(second, 10)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(await self.read(second), pdf)
+
+
+class RenderQueueTestCase(TransactionTestCase):
+    """限制同時產生貼紙 PDF 的請求數 (名額記錄在資料庫，所有程序共用)
+
+    排隊的請求在另一個執行緒 (另一條資料庫連線) 中等待，因此使用 TransactionTestCase
+    """
+
+    @override_settings(STICKER_RENDER_WORKERS=1, STICKER_RENDER_QUEUE=1, STICKER_RENDER_QUEUE_TIMEOUT=5)
+    def test_waits_in_order_then_rejects(self):
+        queue = RenderQueue()
+        lease = queue.acquire()
+        waited = []
+
+        def waiter():
+            try:
+                waited.append(queue.acquire())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while not queue.stats()['queued']:
+            time.sleep(0.01)
+        # 名額與佇列都已滿
+        with self.assertRaises(RenderQueueFull) as cm:
+            queue.acquire()
+        self.assertEqual(cm.exception.position, 2)
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+        queue.release(lease, 0.1)
+        thread.join()
+        self.assertEqual(len(waited), 1)
+        stats = queue.stats()
+        self.assertEqual((stats['running'], stats['queued'], stats['admitted'], stats['rejected']), (1, 0, 2, 1))
+        self.assertIsNotNone(stats['wait_ms']['max'])
+        queue.release(waited[0])
+        self.assertEqual(queue.stats()['running'], 0)
+
+    @override_settings(STICKER_RENDER_WORKERS=1, STICKER_RENDER_QUEUE=0, STICKER_RENDER_QUEUE_TIMEOUT=0)
+    def test_limit_is_shared_between_processes(self):
+        # 另一個程序 (各自的 RenderQueue) 持有唯一的名額
+        other = RenderQueue()
+        lease = other.acquire()
+        with self.assertRaises(RenderQueueFull):
+            RenderQueue().acquire()
+        other.release(lease)
+        RenderQueue().release(RenderQueue().acquire())
+
+    @override_settings(STICKER_RENDER_WORKERS=1, STICKER_RENDER_QUEUE=0, STICKER_RENDER_QUEUE_TIMEOUT=0)
+    def test_expired_lease_is_reclaimed(self):
+        queue = RenderQueue()
+        lease = queue.acquire()
+        # 持有名額的程序中止，租約沒有再延長
+        lease._keeper.stop()
+        RenderSlot.objects.filter(number=lease.number).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(queue.stats()['running'], 0)
+        queue.release(queue.acquire())
+        # 原持有者之後釋放不會影響新的持有者
+        lease.release()
+
+    @override_settings(STICKER_RENDER_WORKERS=1, STICKER_RENDER_QUEUE=0, STICKER_RENDER_QUEUE_TIMEOUT=0)
+    def test_views_return_503_when_full(self):
+        create_devices(2)
+        url = reverse('devices:download_all_qrcodes')
+        lease = render_queue.acquire()
+        try:
+            response = self.client.get(url)
+        finally:
+            render_queue.release(lease)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(response['X-Render-Queue-Position'], '1')
+
+        # 串流回應讀完後才釋放名額
+        response = self.client.get(url, {'stream': '1'})
+        self.assertEqual(render_queue.stats()['running'], 1)
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(render_queue.stats()['running'], 0)
+        self.assertIn('X-Render-Wait', response)
+
+    def test_status(self):
+        response = self.client.get(reverse('devices:render_queue_status'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.json()),
+            {'workers', 'queue_depth', 'running', 'queued', 'admitted', 'rejected', 'wait_ms', 'render_ms'},
+        )
+
+
+@override_settings(DEBUG=True, DATABASE_REPLICAS=['default'], DEVICE_REPLICA_STICKY_SECONDS=60)
+class ReplicaRouterTestCase(TestCase):
+    """唯讀副本路由 (以 default 別名當作副本，從 X-DB-Replica 標頭判斷是否讀取副本)"""
+
+    def setUp(self):
+        create_devices(2)
+        self.device = Devices.objects.order_by('id').first()
+        cache.clear()
+
+    def tearDown(self):
+        routers._down_until.clear()
+
+    def test_read_views_use_replica(self):
+        for url in (
+            reverse('devices:device_list'),
+            reverse('devices:device_detail', args=[self.device.id]),
+            reverse('devices:export_devices'),
+        ):
+            self.assertEqual(self.client.get(url)['X-DB-Replica'], 'default')
+        self.assertNotIn('X-DB-Replica', self.client.get(reverse('devices:render_queue_status')))
+
+    def test_write_makes_user_read_primary(self):
+        response = self.client.post(reverse('devices:create_export_job'), {'all': '1'})
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertNotIn('X-DB-Replica', self.client.get(reverse('devices:device_list')))
+        # 其他使用者不受影響
+        self.client.cookies.clear()
+        self.assertIn('X-DB-Replica', self.client.get(reverse('devices:device_list')))
+
+    def test_recent_change_reads_primary(self):
+        self.device.brand = '新廠牌'
+        self.device.save()
+        self.assertNotIn('X-DB-Replica', self.client.get(reverse('devices:device_list')))
+        cache.delete(DATA_CHANGED_AT_KEY)
+        self.assertIn('X-DB-Replica', self.client.get(reverse('devices:device_list')))
+
+    @override_settings(DATABASE_REPLICAS=['missing'])
+    def test_unavailable_replica_falls_back_to_primary(self):
+        with self.assertLogs('devices.routers', 'WARNING'):
+            response = self.client.get(reverse('devices:device_detail', args=[self.device.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-DB-Replica', response)
+        # 標記為無法連線後不再嘗試
+        with self.assertNoLogs('devices.routers', 'WARNING'):
+            self.client.get(reverse('devices:device_list'))
+
+    def test_bookkeeping_writes_do_not_pin_primary(self):
+        from django.contrib.sessions.models import Session
+
+        router = routers.ReplicaRouter()
+        state = routers.RoutingState()
+        token = routers._state.set(state)
+        try:
+            self.assertEqual(router.db_for_write(Session), 'default')
+            self.assertEqual(router.db_for_write(get_user_model()), 'default')
+            self.assertFalse(state.wrote)
+            router.db_for_write(Devices)
+            self.assertTrue(state.wrote)
+        finally:
+            routers._state.reset(token)
+
+    def test_login_does_not_pin_primary(self):
+        get_user_model().objects.create_superuser('reader', password='secret')
+        response = self.client.post(reverse('admin:login'), {'username': 'reader', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertIn('X-DB-Replica', self.client.get(reverse('devices:device_list')))
+
+    def test_replica_failure_mid_request_retries_on_primary(self):
+        def fail_on_replica(execute, sql, params, many, context):
+            if routers._state.get().replica is not None:
+                raise OperationalError('replica connection lost')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(fail_on_replica), self.assertLogs('devices.routers', 'WARNING'):
+            response = self.client.get(reverse('devices:device_detail', args=[self.device.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-DB-Replica', response)
+
+    def test_replicas_are_not_migrated(self):
+        router = routers.ReplicaRouter()
+        self.assertIs(router.allow_migrate('default', 'devices'), False)
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(router.allow_migrate('default', 'devices'))
+
+
+class QueryBudgetMiddlewareTestCase(TestCase):
+
+    @override_settings(QUERY_BUDGET=0)
+    def test_logs_requests_over_budget(self):
+        create_devices(1)
+        with self.assertLogs('devices.middleware', 'WARNING') as logs:
+            self.client.get(reverse('devices:device_list'))
+        self.assertIn('devices:device_list', logs.output[0])
+
+    def test_within_budget_is_not_logged(self):
+        create_devices(1)
+        with self.assertNoLogs('devices.middleware', 'WARNING'):
+            self.client.get(reverse('devices:device_list'))
+
+
+class BenchmarkResultTestCase(SimpleTestCase):
+
+    def test_percentile_interpolates(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual(percentile(values, 0), 1.0)
+        self.assertEqual(percentile(values, 50), 2.5)
+        self.assertEqual(percentile(values, 100), 4.0)
+        self.assertEqual(percentile([5.0], 99), 5.0)
+
+    def test_summarize_throughput(self):
+        result = summarize('import_devices', 1000, [0.5, 0.5], items=1000, unit='device')
+        self.assertEqual(result['throughput'], 2000)
+        self.assertEqual(result['p50_ms'], 500)
+
+    def test_compare_results(self):
+        baseline = {'results': [
+            summarize('device_list', 1000, [0.010]),
+            summarize('device_detail', 1000, [0.010]),
+            summarize('device_detail', 10000, [0.010]),
+        ]}
+        current = {'results': [
+            summarize('device_list', 1000, [0.015]),
+            summarize('device_detail', 1000, [0.0101]),
+            summarize('device_list_search', 1000, [0.010]),
+        ]}
+        comparison = {item['scenario']: item for item in compare_results(current, baseline, threshold=0.1)}
+        self.assertEqual(set(comparison), {'device_list', 'device_detail'})
+        self.assertEqual(comparison['device_list']['status'], 'slower')
+        self.assertEqual(comparison['device_detail']['status'], 'unchanged')
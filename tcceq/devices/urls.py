@@ -1,15 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'devices'
 
+# ASGI 部署時 (DEVICE_ASYNC_VIEWS) 讀取頁面改用非同步檢視，不必每個請求都切換到執行緒
+# 貼紙 PDF 也改用非同步檢視，在佇列中等待時不佔用 asgiref 的共用同步執行緒
+if getattr(settings, 'DEVICE_ASYNC_VIEWS', False):
+    device_list_view, device_detail_view = views.device_list_async, views.device_detail_async
+    download_qrcodes_view, download_all_qrcodes_view = views.download_qrcodes_async, views.download_all_qrcodes_async
+else:
+    device_list_view, device_detail_view = views.device_list, views.device_detail
+    download_qrcodes_view, download_all_qrcodes_view = views.download_qrcodes, views.download_all_qrcodes
+
 urlpatterns = [
     # 設備列表頁面
-    path('', views.device_list, name='device_list'),
+    path('', device_list_view, name='device_list'),
     # 設備詳細資訊頁面
-    path('<int:device_id>/', views.device_detail, name='device_detail'),
+    path('<int:device_id>/', device_detail_view, name='device_detail'),
+    # 設備統計 (預先彙總)
+    path('stats/', views.device_stats, name='device_stats'),
+    # 匯出設備清單 (CSV / JSON Lines)
+    path('export/', views.export_devices, name='export_devices'),
     # 下載選中的 QR codes
-    path('download-qrcodes/', views.download_qrcodes, name='download_qrcodes'),
+    path('download-qrcodes/', download_qrcodes_view, name='download_qrcodes'),
     # 下載所有 QR codes
-    path('download-all-qrcodes/', views.download_all_qrcodes, name='download_all_qrcodes'),
+    path('download-all-qrcodes/', download_all_qrcodes_view, name='download_all_qrcodes'),
+    # 貼紙 PDF 產生佇列的狀態
+    path('render-queue/', views.render_queue_status, name='render_queue_status'),
+    # 背景貼紙匯出工作
+    path('export-jobs/', views.create_export_job, name='create_export_job'),
+    path('export-jobs/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export-jobs/<int:job_id>/download/', views.download_export_job, name='download_export_job'),
 ]
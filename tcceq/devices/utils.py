@@ -0,0 +1,11 @@
+"""devices 共用的小工具函式"""
+
+
+def percentile(sorted_values, q):
+    """已排序數列的百分位數 (線性內插，q 為 0-100)"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
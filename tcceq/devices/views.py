@@ -1,107 +1,268 @@
-from django.shortcuts import render, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, aget_object_or_404, get_object_or_404
 from django.core.paginator import Paginator
-from django.db import models
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.urls import reverse
 from django.contrib.sites.shortcuts import get_current_site
-import qrcode
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils import timezone
+from urllib.parse import urlencode
+import hashlib
 import io
-import os
 from django.conf import settings
 from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.graphics import renderPDF
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics.barcode.qr import QrCodeWidget
-from reportlab.graphics.barcode import createBarcodeDrawing
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-from .models import Devices, EquipmentType
+from .models import Devices, EquipmentType, StickerExportJob
+from .stickers import ALL_LAYOUT, SELECTED_LAYOUT, STICKER_WIDTH, STICKER_HEIGHT, get_sticker_page, draw_sticker
+from .pdfstream import iter_sticker_pdf
+from .search import filter_devices
+from .dataexport import EXPORT_FORMATS, export_queryset, iter_export
+from .pagination import CursorPaginator, estimate_count
+from .routers import read_from_replica
+from .schedule import DUE_FILTERS, DUE_WINDOWS, due_filters, due_order_field
+from .stats import dashboard_stats
+from .renderqueue import limit_render_concurrency, render_queue
+from .pagecache import aget_data_version, aget_or_render, get_data_version, get_or_render, make_key, normalize_search
 
+def device_list_paginator(equipment_type_id, search_query, cursor_pagination, due=None):
+    """設備列表的查詢與分頁器 (尚未查詢資料庫)，同步與非同步檢視共用"""
+    # 設備類型、保養與保固到期篩選與搜尋功能
+    devices = filter_devices(Devices.objects.select_related('equipment_type'), equipment_type_id, search_query, due=due)
+    
+    # 分頁功能：依相關度 (有搜尋時)、到期日 (有到期篩選時，可直接依日期索引的順序讀取) 或 id 排序
+    if 'rank' in devices.query.annotations:
+        ordering = ('-rank', 'id')
+    elif due:
+        ordering = (due_order_field(due), 'id')
+    else:
+        ordering = ('id',)
+    if cursor_pagination:
+        # 游標分頁：不需要 COUNT(*)
+        return devices, CursorPaginator(devices, 10, ordering)  # 每頁顯示 10 個設備
+    if 'rank' not in devices.query.annotations:
+        devices = devices.order_by(*ordering)
+    return devices, Paginator(devices, 10)  # 每頁顯示 10 個設備
+
+def render_device_list_fragment(page_obj, cursor_pagination, approximate_count, equipment_type_id, search_query, due):
+    return render_to_string('devices/device_list_fragment.html', {
+        'page_obj': page_obj,
+        'cursor_pagination': cursor_pagination,
+        'approximate_count': approximate_count,
+        'current_type': equipment_type_id,
+        'search_query': search_query,
+        # 分頁連結保留到期篩選
+        'due_query': urlencode(due),
+    })
+
+def render_device_list(equipment_type_id, search_query, cursor_pagination, position, due):
+    """查詢並產生設備列表的 HTML 片段 (不含每個請求不同的內容，可快取)"""
+    devices, paginator = device_list_paginator(equipment_type_id, search_query, cursor_pagination, due)
+    page_obj = paginator.get_page(position)
+    approximate_count = None
+    if cursor_pagination and getattr(settings, 'DEVICE_LIST_APPROXIMATE_COUNT', True):
+        approximate_count = estimate_count(devices)
+    return render_device_list_fragment(page_obj, cursor_pagination, approximate_count, equipment_type_id, search_query, due)
+
+async def arender_device_list(equipment_type_id, search_query, cursor_pagination, position, due):
+    """render_device_list 的非同步版本"""
+    devices, paginator = device_list_paginator(equipment_type_id, search_query, cursor_pagination, due)
+    approximate_count = None
+    if cursor_pagination:
+        page_obj = await paginator.aget_page(position)
+        if getattr(settings, 'DEVICE_LIST_APPROXIMATE_COUNT', True):
+            # EXPLAIN 需要直接使用資料庫 cursor，沒有非同步版本
+            approximate_count = await sync_to_async(estimate_count)(devices)
+    else:
+        # Paginator 沒有非同步版本：先以 acount 填入總筆數，再以 async for 讀取該頁資料
+        paginator.count = await devices.acount()
+        page_obj = paginator.get_page(position)
+        page_obj.object_list = [device async for device in page_obj.object_list]
+    return render_device_list_fragment(page_obj, cursor_pagination, approximate_count, equipment_type_id, search_query, due)
+
+def device_list_params(request):
+    """設備列表的查詢參數：(設備類型, 搜尋字串, 是否游標分頁, 游標或頁碼, 到期篩選)"""
+    cursor_pagination = getattr(settings, 'DEVICE_LIST_PAGINATION', 'cursor') == 'cursor'
+    return (
+        request.GET.get('type'),
+        normalize_search(request.GET.get('search')),
+        cursor_pagination,
+        request.GET.get('cursor') if cursor_pagination else request.GET.get('page'),
+        due_filters(request.GET),
+    )
+
+def due_selects(due):
+    """篩選表單的到期下拉選單：(參數, 說明, 目前選擇的範圍)"""
+    return [(name, label, due.get(name, '')) for name, _, label in DUE_FILTERS]
+
+def device_list_keys(equipment_type_id, search_query, cursor_pagination, position, due, version):
+    """設備列表片段與設備類型選項的快取鍵"""
+    # 「本月」等到期篩選的範圍隨日期改變，快取鍵包含今天的日期
+    today = timezone.localdate().isoformat() if due else None
+    return (
+        make_key('list', equipment_type_id, search_query, cursor_pagination, position, due, today, version=version),
+        make_key('type_options', equipment_type_id, version=version),
+    )
+
+@read_from_replica
 def device_list(request):
     """設備列表檢視"""
-    devices = Devices.objects.all()
-    # 設備類型篩選
-    equipment_type_id = request.GET.get('type')
-    if equipment_type_id:
-        devices = devices.filter(equipment_type_id=equipment_type_id)
-    
-    # 搜尋功能
-    search_query = request.GET.get('search')
-    if search_query:
-        devices = devices.filter(
-            models.Q(brand__icontains=search_query) |
-            models.Q(specification__icontains=search_query) |
-            models.Q(contractor_name__icontains=search_query)
-        )
-    
-    # 分頁功能
-    paginator = Paginator(devices, 10)  # 每頁顯示 10 個設備
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # 取得所有設備類型用於篩選下拉選單
-    equipment_types = EquipmentType.objects.all()
+    equipment_type_id, search_query, cursor_pagination, position, due = device_list_params(request)
+    
+    # 先取得資料版本號再查詢，查詢期間資料若有變更，結果只會存到已失效的版本
+    list_key, type_options_key = device_list_keys(
+        equipment_type_id, search_query, cursor_pagination, position, due, get_data_version()
+    )
     
     context = {
-        'page_obj': page_obj,
-        'equipment_types': equipment_types,
+        'device_list_html': get_or_render(
+            list_key,
+            lambda: render_device_list(equipment_type_id, search_query, cursor_pagination, position, due),
+        ),
+        # 取得所有設備類型用於篩選下拉選單
+        'type_options_html': get_or_render(
+            type_options_key,
+            lambda: render_to_string('devices/type_options.html', {
+                'equipment_types': EquipmentType.objects.all(),
+                'current_type': equipment_type_id,
+            }),
+        ),
         'current_type': equipment_type_id,
         'search_query': search_query,
+        'due_selects': due_selects(due),
+        'due_windows': DUE_WINDOWS,
+        'sticker_export_sync_limit': getattr(settings, 'STICKER_EXPORT_SYNC_LIMIT', 200),
     }
     
     return render(request, 'devices/device_list.html', context)
 
-def device_detail(request, device_id):
-    """設備詳細資訊檢視"""
-    device = get_object_or_404(Devices, id=device_id)
+@read_from_replica
+async def device_list_async(request):
+    """設備列表檢視的非同步版本 (ASGI 部署使用，見 DEVICE_ASYNC_VIEWS)"""
+    equipment_type_id, search_query, cursor_pagination, position, due = device_list_params(request)
+    list_key, type_options_key = device_list_keys(
+        equipment_type_id, search_query, cursor_pagination, position, due, await aget_data_version()
+    )
+    
+    async def render_type_options():
+        return render_to_string('devices/type_options.html', {
+            'equipment_types': [equipment_type async for equipment_type in EquipmentType.objects.all()],
+            'current_type': equipment_type_id,
+        })
     
     context = {
-        'device': device,
+        'device_list_html': await aget_or_render(
+            list_key,
+            lambda: arender_device_list(equipment_type_id, search_query, cursor_pagination, position, due),
+        ),
+        'type_options_html': await aget_or_render(type_options_key, render_type_options),
+        'current_type': equipment_type_id,
+        'search_query': search_query,
+        'due_selects': due_selects(due),
+        'due_windows': DUE_WINDOWS,
+        'sticker_export_sync_limit': getattr(settings, 'STICKER_EXPORT_SYNC_LIMIT', 200),
     }
     
-    return render(request, 'devices/device_detail.html', context)
+    return render(request, 'devices/device_list.html', context)
 
-def register_chinese_font():
-    """註冊中文字體函數 - 支援一般與粗體"""
-    try:
-        # 您指定的 Noto Sans TC 字體路徑
-        font_path = os.path.join(settings.BASE_DIR, 'media', 'fonts', 'static','NotoSansTC-Bold.ttf')
-        
-        if os.path.exists(font_path):
-            # 註冊一般字重
-            pdfmetrics.registerFont(TTFont('NotoSansTC', font_path))
-            
-            # 註冊粗體字重 - 使用同一個 Variable Font 文件
-            # Variable Font 可以透過同一個文件產生不同字重
-            pdfmetrics.registerFont(TTFont('NotoSansTC-Bold', font_path))
-            
-            return ('NotoSansTC', 'NotoSansTC-Bold')
-        else:
-            # 字體文件不存在時的備用方案
-            raise FileNotFoundError(f"字體文件不存在: {font_path}")
-            
-    except Exception as e:
-        print(f"註冊 Noto Sans TC 字體失敗: {e}")
-        try:
-            # 備用方案1：使用 Windows 系統的中文字體
-            pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-            return ('STSong-Light', 'STSong-Light')  # 系統字體通常沒有分別的粗體
-        except:
-            try:
-                # 備用方案2：使用 HeiseiMin-W3 (日文字體但支援中文)
-                pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
-                return ('HeiseiMin-W3', 'HeiseiMin-W3')
-            except:
-                # 最後備用：使用 Helvetica
-                return ('Helvetica', 'Helvetica-Bold')
+def build_detail_page(device):
+    """產生設備詳細資料頁並計算 ETag 與最後修改時間 (存入快取的內容)"""
+    html = render_to_string('devices/device_detail.html', {'device': device})
+    return {
+        'html': html,
+        'etag': quote_etag(hashlib.md5(html.encode('utf-8')).hexdigest()),
+        'last_modified': int(device.updated_at.timestamp()),
+    }
 
-@require_http_methods(["POST"])
-def download_qrcodes(request):
-    """下載選中設備的 QR code 貼紙 PDF - 直接輸出貼紙尺寸"""
+def detail_response(request, page):
+    """依快取的頁面回傳 200 或 304"""
+    response = get_conditional_response(request, etag=page['etag'], last_modified=page['last_modified'])
+    if response is None:
+        response = HttpResponse(page['html'])
+    response['ETag'] = page['etag']
+    response['Last-Modified'] = http_date(page['last_modified'])
+    # 瀏覽器每次都要重新驗證，資料有變更時才會重新下載
+    patch_cache_control(response, max_age=getattr(settings, 'DEVICE_DETAIL_MAX_AGE', 0), must_revalidate=True)
+    return response
+
+@read_from_replica
+def device_detail(request, device_id):
+    """設備詳細資訊檢視 (QR code 貼紙連結的頁面)
+
+    產生的頁面依設備快取，並回傳 ETag 與 Last-Modified，
+    重複掃描或瀏覽器重新驗證時直接回傳 304，不需查詢資料庫或產生頁面。
+    """
+    key = make_key('detail', device_id)
+    page = cache.get(key)
+    if page is None:
+        device = get_object_or_404(Devices.objects.select_related('equipment_type'), id=device_id)
+        page = build_detail_page(device)
+        cache.set(key, page, getattr(settings, 'DEVICE_PAGE_CACHE_TIMEOUT', 300))
+    return detail_response(request, page)
+
+@read_from_replica
+async def device_detail_async(request, device_id):
+    """設備詳細資訊檢視的非同步版本
+
+    等待快取與資料庫時不佔用執行緒，一個 ASGI 程序可同時處理大量 QR code 掃描。
+    """
+    key = make_key('detail', device_id, version=await aget_data_version())
+    page = await cache.aget(key)
+    if page is None:
+        device = await aget_object_or_404(Devices.objects.select_related('equipment_type'), id=device_id)
+        page = build_detail_page(device)
+        await cache.aset(key, page, getattr(settings, 'DEVICE_PAGE_CACHE_TIMEOUT', 300))
+    return detail_response(request, page)
+
+@read_from_replica
+def device_stats(request):
+    """設備統計頁 (讀取預先彙總的 InventoryStat，不掃描設備資料表)"""
+    return render(request, 'devices/device_stats.html', dashboard_stats())
+
+@require_http_methods(["GET"])
+@read_from_replica
+def export_devices(request):
+    """以串流方式匯出設備清單 (CSV 或 JSON Lines)，篩選條件與設備列表相同"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(f"不支援的匯出格式: {export_format}", status=400)
+    content_type, extension = EXPORT_FORMATS[export_format]
+    devices = export_queryset(
+        request.GET.get('type'), normalize_search(request.GET.get('search')), due_filters(request.GET)
+    )
+    
+    response = StreamingHttpResponse(
+        iter_export(export_format, devices, getattr(settings, 'DEVICE_EXPORT_CHUNK_SIZE', 2000)),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="devices.{extension}"'
+    return response
+
+def use_sticker_streaming(request):
+    """是否以串流方式輸出貼紙 PDF (可用 stream=0/1 參數覆寫設定)"""
+    stream = request.GET.get('stream') or request.POST.get('stream')
+    if stream is not None:
+        return stream == '1'
+    return getattr(settings, 'STICKER_STREAMING', True)
+
+def streaming_sticker_response(request, devices, filename, layout=ALL_LAYOUT):
+    """逐頁產生 PDF 並串流輸出，設備以 iterator 分批讀取"""
+    current_site = get_current_site(request)
+    chunk_size = getattr(settings, 'STICKER_STREAM_CHUNK_SIZE', 500)
+
+    def pages():
+        for device in devices.iterator(chunk_size=chunk_size):
+            device_url = f"{request.scheme}://{current_site.domain}{reverse('devices:device_detail', args=[device.id])}"
+            yield get_sticker_page(device, device_url)
+
+    response = StreamingHttpResponse(iter_sticker_pdf(pages(), layout), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def qrcodes_response(request):
+    """選中設備的貼紙 PDF 回應，同步與非同步檢視共用"""
     device_ids = request.POST.getlist('device_ids')
     
     if not device_ids:
@@ -113,18 +274,15 @@ def download_qrcodes(request):
     if not devices.exists():
         return HttpResponse("找不到指定的設備", status=404)
     
+    if use_sticker_streaming(request):
+        return streaming_sticker_response(request, devices.order_by('id'), 'device_qr_stickers.pdf', SELECTED_LAYOUT)
+    
     # 建立 PDF
     buffer = io.BytesIO()
     
-    # 貼紙尺寸 (30mm x 40mm)
-    sticker_width = 30 * mm
-    sticker_height = 40 * mm
-    
     # 使用貼紙尺寸作為頁面尺寸
-    p = canvas.Canvas(buffer, pagesize=(sticker_width, sticker_height))
-    
-    # 註冊中文字體 - 現在返回一般和粗體字體名稱
-    chinese_font, chinese_font_bold = register_chinese_font()
+    p = canvas.Canvas(buffer, pagesize=(STICKER_WIDTH, STICKER_HEIGHT))
+    current_site = get_current_site(request)
     
     for i, device in enumerate(devices):
         # 如果不是第一個設備，創建新頁面
@@ -132,69 +290,11 @@ def download_qrcodes(request):
             p.showPage()
         
         # 產生設備詳細頁面的完整 URL
-        current_site = get_current_site(request)
         device_url = f"{request.scheme}://{current_site.domain}{reverse('devices:device_detail', args=[device.id])}"
         
-        # QR code 大小和位置 (調整為適合貼紙尺寸)
-        qr_size = 22 * mm  # 稍微縮小QR code為中文文字留空間
-        qr_x = (sticker_width - qr_size) / 2  # QR code 水平置中
-        qr_y = 10 * mm  # QR code 位置
-        
-        # 使用 reportlab 的 QR code
-        qr_widget = QrCodeWidget(device_url)
-        qr_widget.barWidth = qr_size
-        qr_widget.barHeight = qr_size
-        
-        drawing = Drawing(qr_size, qr_size)
-        drawing.add(qr_widget)
-        renderPDF.draw(drawing, p, qr_x, qr_y)
-        
-        # 添加設備資訊文字 - 使用粗體中文字體
-        p.setFont(chinese_font_bold, 8)  # 使用粗體字體
-        
-        # 設備類型 (QR code 上方) - 使用粗體
-        text_y = qr_y + qr_size + 4 * mm
-        device_info = f"{device.equipment_type.name}"
-        if len(device_info) > 10:  # 中文字符較寬，限制長度
-            device_info = device_info[:10] + "..."
-        p.drawCentredString(sticker_width/2, text_y, device_info)
-
-        # 設備品牌 (QR code 上方第二行) - 使用粗體
-        text_y = qr_y + qr_size + 0.5 * mm
-        brand_info = f"{device.brand}"
-        if len(brand_info) > 10:
-            brand_info = brand_info[:10] + "..."
-        p.drawCentredString(sticker_width/2, text_y, brand_info)
-        
-        # 切換到一般中文字體（規格用一般字體）
-        p.setFont(chinese_font, 8)  # 規格用較小的一般字體
-        
-        # 規格 (再下方) - 支援多行顯示，最多3行
-        text_y = qr_y - 1.5 * mm
-        spec_info = f"{device.specification}"
-        
-        # 將長文字分割成多行，每行最多13個字符，最多顯示3行
-        max_chars_per_line = 10
-        max_lines = 3
-        spec_lines = []
-        
-        for j in range(0, len(spec_info), max_chars_per_line):
-            if len(spec_lines) >= max_lines:
-                break
-            line_text = spec_info[j:j + max_chars_per_line]
-            spec_lines.append(line_text)
-        
-        # 如果文字超過3行，在第三行末尾加上省略號
-        if len(spec_info) > max_chars_per_line * max_lines:
-            if len(spec_lines) == max_lines:
-                spec_lines[-1] = spec_lines[-1][:10] + "..."
-        
-        # 繪製每一行
-        line_height = 2.8 * mm
-        for j, line in enumerate(spec_lines):
-            current_y = text_y - (j * line_height)
-            p.drawCentredString(sticker_width/2, current_y, line)
-        
+        # 取得 (或建立並快取) 貼紙內容後繪製
+        page = get_sticker_page(device, device_url)
+        draw_sticker(p, page, SELECTED_LAYOUT)
     
     # 完成 PDF
     p.save()
@@ -206,27 +306,23 @@ def download_qrcodes(request):
     
     return response
 
-@require_http_methods(["GET"])
-def download_all_qrcodes(request):
-    """下載所有設備的 QR code 貼紙 PDF"""
+def all_qrcodes_response(request):
+    """所有設備的貼紙 PDF 回應，同步與非同步檢視共用"""
     # 取得所有設備
-    devices = Devices.objects.all().order_by('id')
+    devices = Devices.objects.all().select_related('equipment_type').order_by('id')
     
     if not devices.exists():
         return HttpResponse("系統中沒有設備資料", status=404)
     
+    if use_sticker_streaming(request):
+        return streaming_sticker_response(request, devices, 'all_devices_qr_stickers.pdf')
+    
     # 建立 PDF
     buffer = io.BytesIO()
     
-    # 貼紙尺寸 (30mm x 40mm)
-    sticker_width = 30 * mm
-    sticker_height = 40 * mm
-    
     # 使用貼紙尺寸作為頁面尺寸
-    p = canvas.Canvas(buffer, pagesize=(sticker_width, sticker_height))
-    
-    # 註冊中文字體 - 現在返回一般和粗體字體名稱
-    chinese_font, chinese_font_bold = register_chinese_font()
+    p = canvas.Canvas(buffer, pagesize=(STICKER_WIDTH, STICKER_HEIGHT))
+    current_site = get_current_site(request)
     
     for i, device in enumerate(devices):
         # 如果不是第一個設備，創建新頁面
@@ -234,70 +330,11 @@ def download_all_qrcodes(request):
             p.showPage()
         
         # 產生設備詳細頁面的完整 URL
-        current_site = get_current_site(request)
         device_url = f"{request.scheme}://{current_site.domain}{reverse('devices:device_detail', args=[device.id])}"
         
-        # QR code 大小和位置 (調整為適合貼紙尺寸)
-        qr_size = 22 * mm  # 稍微縮小QR code為中文文字留空間
-        qr_x = (sticker_width - qr_size) / 2  # QR code 水平置中
-        qr_y = 10 * mm  # QR code 位置
-        
-        # 使用 reportlab 的 QR code
-        qr_widget = QrCodeWidget(device_url)
-        qr_widget.barWidth = qr_size
-        qr_widget.barHeight = qr_size
-        
-        drawing = Drawing(qr_size, qr_size)
-        drawing.add(qr_widget)
-        renderPDF.draw(drawing, p, qr_x, qr_y)
-        
-        # 添加設備資訊文字 - 使用粗體中文字體
-        p.setFont(chinese_font_bold, 8)  # 使用粗體字體
-        
-        # 設備類型 (QR code 上方) - 使用粗體
-        text_y = qr_y + qr_size + 4 * mm
-        device_info = f"{device.equipment_type.name}"
-        if len(device_info) > 10:  # 中文字符較寬，限制長度
-            device_info = device_info[:10] + "..."
-        p.drawCentredString(sticker_width/2, text_y, device_info)
-
-        # 設備品牌 (QR code 上方第二行) - 使用粗體
-        p.setFont(chinese_font_bold, 8)
-        text_y = qr_y + qr_size + 0.5 * mm
-        brand_info = f"{device.brand}"
-        if len(brand_info) > 10:
-            brand_info = brand_info[:10] + "..."
-        p.drawCentredString(sticker_width/2, text_y, brand_info)
-        
-        # 切換到一般中文字體（規格用一般字體）
-        p.setFont(chinese_font, 8)  # 規格用較小的一般字體
-        
-        # 規格 (再下方) - 支援多行顯示，最多3行
-        text_y = qr_y - 1 * mm
-        spec_info = f"{device.specification}"
-        
-        # 將長文字分割成多行，每行最多16個字符，最多顯示3行
-        max_chars_per_line = 10
-        max_lines = 3
-        spec_lines = []
-        
-        for j in range(0, len(spec_info), max_chars_per_line):
-            if len(spec_lines) >= max_lines:
-                break
-            line_text = spec_info[j:j + max_chars_per_line]
-            spec_lines.append(line_text)
-        
-        # 如果文字超過3行，在第三行末尾加上省略號
-        if len(spec_info) > max_chars_per_line * max_lines:
-            if len(spec_lines) == max_lines:
-                spec_lines[-1] = spec_lines[-1][:10] + "..."
-        
-        # 繪製每一行
-        line_height = 2.8 * mm
-        for j, line in enumerate(spec_lines):
-            current_y = text_y - (j * line_height)
-            p.drawCentredString(sticker_width/2, current_y, line)
-        
+        # 取得 (或建立並快取) 貼紙內容後繪製
+        page = get_sticker_page(device, device_url)
+        draw_sticker(p, page)
     
     # 完成 PDF
     p.save()
@@ -308,3 +345,91 @@ def download_all_qrcodes(request):
     response['Content-Disposition'] = 'attachment; filename="all_devices_qr_stickers.pdf"'
     
     return response
+
+@require_http_methods(["POST"])
+@limit_render_concurrency
+@read_from_replica
+def download_qrcodes(request):
+    """下載選中設備的 QR code 貼紙 PDF - 直接輸出貼紙尺寸"""
+    return qrcodes_response(request)
+
+@require_http_methods(["POST"])
+@limit_render_concurrency
+@read_from_replica
+async def download_qrcodes_async(request):
+    """download_qrcodes 的非同步版本 (ASGI 部署使用，見 DEVICE_ASYNC_VIEWS)
+
+    在佇列中等待時不佔用共用的同步執行緒，PDF 由 AsyncStreamingMiddleware 在專用執行緒中串流輸出
+    """
+    return await sync_to_async(qrcodes_response)(request)
+
+@require_http_methods(["GET"])
+@limit_render_concurrency
+@read_from_replica
+def download_all_qrcodes(request):
+    """下載所有設備的 QR code 貼紙 PDF"""
+    return all_qrcodes_response(request)
+
+@require_http_methods(["GET"])
+@limit_render_concurrency
+@read_from_replica
+async def download_all_qrcodes_async(request):
+    """download_all_qrcodes 的非同步版本"""
+    return await sync_to_async(all_qrcodes_response)(request)
+
+@require_http_methods(["GET"])
+def render_queue_status(request):
+    """貼紙 PDF 產生佇列的狀態：執行中與排隊的請求數 (所有程序合計)、本程序最近的等待與產生時間"""
+    return JsonResponse(render_queue.stats())
+
+@require_http_methods(["POST"])
+def create_export_job(request):
+    """建立背景貼紙匯出工作，回傳工作 id 供前端輪詢進度"""
+    if request.POST.get('all') == '1':
+        device_ids = None
+    else:
+        device_ids = [int(device_id) for device_id in request.POST.getlist('device_ids') if device_id.isdigit()]
+        if not device_ids:
+            return JsonResponse({'error': '沒有選擇設備'}, status=400)
+    
+    current_site = get_current_site(request)
+    job = StickerExportJob.objects.create(
+        device_ids=device_ids,
+        base_url=f"{request.scheme}://{current_site.domain}",
+    )
+    
+    return JsonResponse({
+        'job_id': job.id,
+        'status_url': reverse('devices:export_job_status', args=[job.id]),
+    }, status=202)
+
+@require_http_methods(["GET"])
+def export_job_status(request, job_id):
+    """查詢背景貼紙匯出工作的進度"""
+    job = get_object_or_404(StickerExportJob, id=job_id)
+    
+    data = {
+        'job_id': job.id,
+        'status': job.status,
+        'done': job.done,
+        'total': job.total,
+    }
+    if job.status == StickerExportJob.STATUS_DONE:
+        data['download_url'] = reverse('devices:download_export_job', args=[job.id])
+    elif job.status == StickerExportJob.STATUS_FAILED:
+        data['error'] = '產生 PDF 時發生錯誤'
+    
+    return JsonResponse(data)
+
+@require_http_methods(["GET"])
+def download_export_job(request, job_id):
+    """下載已完成的背景貼紙匯出 PDF"""
+    job = get_object_or_404(StickerExportJob, id=job_id, status=StickerExportJob.STATUS_DONE)
+    
+    try:
+        pdf_file = job.file.open('rb')
+    except FileNotFoundError:
+        raise Http404("找不到匯出檔案")
+    
+    filename = 'all_devices_qr_stickers.pdf' if job.device_ids is None else 'device_qr_stickers.pdf'
+    return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
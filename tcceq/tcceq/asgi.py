@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tcceq.settings')
+# 在 ASGI 伺服器下設備列表與詳細資料頁使用非同步檢視 (設為 0 可改回同步檢視)
+os.environ.setdefault('DEVICE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
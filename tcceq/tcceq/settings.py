@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
+import dj_database_url
 import django_heroku
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -37,10 +40,17 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'devices',
 ]
 
 MIDDLEWARE = [
+    # 放在最前面，統計整個請求 (包含其他中介軟體) 的查詢
+    'devices.middleware.QueryBudgetMiddleware',
+    # 唯讀副本的路由狀態與 read-your-writes cookie (devices.routers)
+    'devices.middleware.ReplicaRoutingMiddleware',
+    # ASGI 下的同步串流回應 (貼紙 PDF、匯出) 在專用執行緒中逐塊輸出 (devices.streaming)
+    'devices.middleware.AsyncStreamingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +94,19 @@ DATABASES = {
     }
 }
 
+# 唯讀副本：環境變數 DATABASE_REPLICA_URLS 以逗號分隔多個資料庫網址，依序設為 replica1、replica2…
+# 設備列表、詳細資料頁、貼紙與匯出的讀取查詢會送到副本 (devices.routers.ReplicaRouter)
+for _index, _url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{_index}'] = dj_database_url.parse(_url.strip())
+    # 測試時副本與主資料庫使用同一個測試資料庫
+    DATABASES[f'replica{_index}']['TEST'] = {'MIRROR': 'default'}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+DATABASE_ROUTERS = ['devices.routers.ReplicaRouter']
+# 使用者寫入資料後 (以及任何設備資料變更後) 改讀主資料庫的秒數，應大於副本的複製延遲
+DEVICE_REPLICA_STICKY_SECONDS = 10
+# 副本無法連線時，多少秒內不再嘗試該副本
+DEVICE_REPLICA_RETRY_SECONDS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,9 +144,59 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# 上傳與產生的檔案 (字型、背景匯出的貼紙 PDF)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 設備列表分頁方式：'cursor' (游標分頁，不執行 COUNT) 或 'page' (頁碼分頁)
+DEVICE_LIST_PAGINATION = 'cursor'
+# 游標分頁時顯示由 PostgreSQL 查詢計畫估計的總筆數
+DEVICE_LIST_APPROXIMATE_COUNT = True
+# 設備列表片段與詳細資料頁快取的秒數 (使用預設快取後端，資料變更時會自動失效)
+DEVICE_PAGE_CACHE_TIMEOUT = 300
+# 設備詳細資料頁 (QR code 連結) 在瀏覽器的快取秒數，0 表示每次都以 ETag 重新驗證
+DEVICE_DETAIL_MAX_AGE = 0
+# 匯出設備清單 (CSV / JSON Lines) 時每次從資料庫讀取的設備筆數
+DEVICE_EXPORT_CHUNK_SIZE = 2000
+# 設備列表與詳細資料頁使用非同步檢視 (ASGI 部署時由 tcceq/asgi.py 設定環境變數 DEVICE_ASYNC_VIEWS=1)
+DEVICE_ASYNC_VIEWS = os.environ.get('DEVICE_ASYNC_VIEWS') == '1'
+
+# QR code 貼紙 PDF
+# 每個程序在記憶體中最多快取的貼紙頁面數 (每頁約 10 KB)
+STICKER_CACHE_SIZE = 10000
+# 貼紙頁面的快取檔案目錄，同一台主機的所有程序共用，每個設備一個檔案 (約 10 KB)，
+# 大於 STICKER_CACHE_SIZE 的匯出也能使用快取；None 表示只使用記憶體
+STICKER_CACHE_DIR = os.environ.get('STICKER_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'tcceq-sticker-cache')
+# 以串流方式逐頁輸出 PDF (請求可用 stream=0/1 覆寫)
+STICKER_STREAMING = True
+# 串流輸出時每次從資料庫讀取的設備筆數
+STICKER_STREAM_CHUNK_SIZE = 500
+# 同時產生貼紙 PDF 的請求數上限，其餘請求排隊 (devices.renderqueue)；
+# 名額記錄在資料庫，所有 gunicorn worker 與使用同一個資料庫的主機共用
+STICKER_RENDER_WORKERS = 2
+# 排隊等待產生貼紙 PDF 的請求數上限 (同樣為全部合計)，超過時回傳 503 與 Retry-After
+STICKER_RENDER_QUEUE = 4
+# 排隊等待的最長秒數，逾時同樣回傳 503
+STICKER_RENDER_QUEUE_TIMEOUT = 30
+# 名額的租約秒數，產生期間自動延長；程序中止時租約到期後名額空出
+STICKER_RENDER_LEASE_SECONDS = 60
+
+# 背景貼紙匯出工作 (devices.exports，由 run_export_worker 執行)
+# 選中的設備數不超過此數量時直接下載 PDF，不建立背景工作
+STICKER_EXPORT_SYNC_LIMIT = 200
+# 產生中的工作超過此秒數沒有回報進度，視為工作程序已中止並標記為失敗
+STICKER_EXPORT_STALE_SECONDS = 300
+# 完成或失敗的工作與 MEDIA_ROOT/sticker_exports/ 中的 PDF 保留的小時數，逾期由 run_export_worker 刪除
+STICKER_EXPORT_RETENTION_HOURS = 24
+
+# 每個請求的 SQL 查詢預算，超過時記錄警告 (devices.middleware.QueryBudgetMiddleware)
+QUERY_BUDGET = 20
+# 每個請求的資料庫總耗時上限 (秒)
+QUERY_BUDGET_TIME = 0.5
+
 django_heroku.settings(locals())
\ No newline at end of file